@@ -0,0 +1,100 @@
+from flask import Blueprint, request, jsonify, current_app, send_from_directory, abort
+from src.utils.profiler import profiler, MAX_DURATION_SECONDS, MAX_HZ
+from functools import wraps
+import hmac
+import os
+
+admin_bp = Blueprint('admin', __name__)
+
+def admin_required(f):
+    """Require the X-Admin-Token header; the admin API does not exist without ADMIN_TOKEN"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        expected = current_app.config.get('ADMIN_TOKEN')
+        if not expected:
+            abort(404)
+        supplied = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(supplied.encode(), expected.encode()):
+            return jsonify({'error': 'Admin token is missing or invalid'}), 401
+        return f(*args, **kwargs)
+    
+    return decorated
+
+@admin_bp.route('/profiler', methods=['GET'])
+@admin_required
+def get_profiler_status():
+    return jsonify(profiler.status(current_app.config['PROFILE_DIR'])), 200
+
+@admin_bp.route('/profiler', methods=['POST'])
+@admin_required
+def start_profiler():
+    """
+    Profile one endpoint, e.g. {"endpoint": "feed.search_content", "rate": 0.1,
+    "hz": 100, "duration": 60}. Every worker joins the session within a second
+    and writes its own output when the duration ends.
+    """
+    try:
+        data = request.get_json() or {}
+        endpoint = data.get('endpoint')
+        rate = data.get('rate', 1.0)
+        hz = data.get('hz', 100)
+        duration = data.get('duration', 60)
+        
+        if endpoint not in current_app.view_functions:
+            return jsonify({'error': 'endpoint must be a route endpoint name, e.g. feed.search_content'}), 400
+        if not isinstance(rate, (int, float)) or not 0 < rate <= 1:
+            return jsonify({'error': 'rate must be in (0, 1]'}), 400
+        if not isinstance(hz, int) or not 1 <= hz <= MAX_HZ:
+            return jsonify({'error': f'hz must be an integer from 1 to {MAX_HZ}'}), 400
+        if not isinstance(duration, (int, float)) or not 0 < duration <= MAX_DURATION_SECONDS:
+            return jsonify({'error': f'duration must be at most {MAX_DURATION_SECONDS} seconds'}), 400
+        
+        output_dir = current_app.config['PROFILE_DIR']
+        session = profiler.start(endpoint, rate, hz, duration, output_dir)
+        if session is None:
+            return jsonify({'error': 'A profiling session is already running', **profiler.status(output_dir)}), 409
+        
+        return jsonify({'session': session.to_dict()}), 201
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiler/stop', methods=['POST'])
+@admin_required
+def stop_profiler():
+    """End the running session now in every worker and write their output"""
+    try:
+        session = profiler.stop(current_app.config['PROFILE_DIR'])
+        if session is None:
+            return jsonify({'error': 'No profiling session is running'}), 409
+        if session.error:
+            return jsonify({'error': f'Could not write the profile: {session.error}', 'session': session.to_dict()}), 500
+        
+        return jsonify({'session': session.to_dict()}), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    try:
+        folder = current_app.config['PROFILE_DIR']
+        names = sorted(
+            (name for name in os.listdir(folder) if name.endswith('.collapsed')),
+            reverse=True
+        ) if os.path.isdir(folder) else []
+        
+        return jsonify({'profiles': [
+            {'name': name, 'size': os.path.getsize(os.path.join(folder, name))} for name in names
+        ]}), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiles/<name>', methods=['GET'])
+@admin_required
+def download_profile(name):
+    if not name.endswith('.collapsed'):
+        abort(404)
+    return send_from_directory(current_app.config['PROFILE_DIR'], name, mimetype='text/plain', as_attachment=True)
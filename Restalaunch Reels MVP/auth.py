@@ -1,12 +1,140 @@
 from flask import Blueprint, request, jsonify, current_app
 from src.models.user import db, User
 from src.models.vendor import Vendor
+from src.utils.passwords import PasswordHasherBusy
+from sqlalchemy import event, select
+from sqlalchemy.orm import make_transient_to_detached
+from collections import OrderedDict
 import jwt
+import threading
+import time
 from datetime import datetime, timedelta
 from functools import wraps
 
 auth_bp = Blueprint('auth', __name__)
 
+# Loaded from the database on the rare request that needs it
+SNAPSHOT_EXCLUDED = {'password_hash'}
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified tokens, keyed by JWT signature. Each entry
+    holds the decoded claims and a column snapshot of the user (without the
+    password hash), and expires after `ttl` seconds or at the token's own
+    exp, whichever comes first.
+    
+    Invalidation on update only reaches this process, so token_required also
+    compares the snapshot's updated_at with the user row on every hit.
+    """
+    
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+    
+    def get(self, token):
+        signing_input, _, signature = token.rpartition('.')
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is None or entry['signing_input'] != signing_input:
+                self.misses += 1
+                return None
+            if entry['expires_at'] <= time.time():
+                self._remove(signature)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(signature)
+            self.hits += 1
+            return entry
+    
+    def put(self, token, claims, user):
+        signing_input, _, signature = token.rpartition('.')
+        expires_at = time.time() + self.ttl
+        if 'exp' in claims:
+            expires_at = min(expires_at, claims['exp'])
+        snapshot = {
+            column.key: getattr(user, column.key)
+            for column in User.__table__.columns if column.key not in SNAPSHOT_EXCLUDED
+        }
+        
+        with self._lock:
+            self._remove(signature)
+            self._entries[signature] = {
+                'signing_input': signing_input,
+                'claims': claims,
+                'user': snapshot,
+                'expires_at': expires_at
+            }
+            self._keys_by_user.setdefault(user.id, set()).add(signature)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def _remove(self, signature):
+        entry = self._entries.pop(signature, None)
+        if entry is not None:
+            keys = self._keys_by_user.get(entry['user']['id'])
+            if keys is not None:
+                keys.discard(signature)
+                if not keys:
+                    del self._keys_by_user[entry['user']['id']]
+    
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for signature in list(self._keys_by_user.get(user_id, ())):
+                self._remove(signature)
+    
+    def discard_stale(self, user_id):
+        """Drop a user's entries after a hit turned out to be outdated"""
+        self.invalidate_user(user_id)
+        with self._lock:
+            self.hits -= 1
+            self.misses += 1
+            self.stale += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+token_cache = TokenCache()
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_cached_tokens(mapper, connection, target):
+    """Drop cached snapshots whenever a user row changes"""
+    token_cache.invalidate_user(target.id)
+
+def _snapshot_is_current(snapshot):
+    """True if the user row is unchanged since the snapshot, in any process"""
+    updated_at = db.session.execute(
+        select(User.updated_at).where(User.id == snapshot['id'])
+    ).scalar()
+    return updated_at is not None and updated_at == snapshot['updated_at']
+
+def _user_from_snapshot(snapshot):
+    """Attach a cached user snapshot to the session without a SELECT"""
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -22,11 +150,18 @@ def token_required(f):
         if not token:
             return jsonify({'error': 'Token is missing'}), 401
         
+        cached = token_cache.get(token)
+        if cached is not None:
+            if _snapshot_is_current(cached['user']):
+                return f(_user_from_snapshot(cached['user']), *args, **kwargs)
+            token_cache.discard_stale(cached['user']['id'])
+        
         try:
             data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
             current_user = User.query.filter_by(id=data['user_id']).first()
             if not current_user:
                 return jsonify({'error': 'Invalid token'}), 401
+            token_cache.put(token, data, current_user)
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token has expired'}), 401
         except jwt.InvalidTokenError:
@@ -36,6 +171,13 @@ def token_required(f):
     
     return decorated
 
+def _hashing_busy(e):
+    """Shed the request quickly instead of queueing behind other logins"""
+    db.session.rollback()
+    response = jsonify({'error': 'Too many sign-in attempts right now; try again shortly'})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     try:
@@ -98,6 +240,8 @@ def register():
             'user': user.to_dict()
         }), 201
         
+    except PasswordHasherBusy as e:
+        return _hashing_busy(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -119,6 +263,10 @@ def login():
         if not user or not user.check_password(data['password']):
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        # check_password may have upgraded an outdated hash
+        if db.session.is_modified(user):
+            db.session.commit()
+        
         # Generate token
         token = jwt.encode({
             'user_id': user.id,
@@ -131,7 +279,10 @@ def login():
             'user': user.to_dict()
         }), 200
         
+    except PasswordHasherBusy as e:
+        return _hashing_busy(e)
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/me', methods=['GET'])
@@ -181,9 +332,12 @@ def change_password(current_user):
         
         current_user.set_password(data['new_password'])
         db.session.commit()
+        token_cache.invalidate_user(current_user.id)
         
         return jsonify({'message': 'Password changed successfully'}), 200
         
+    except PasswordHasherBusy as e:
+        return _hashing_busy(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
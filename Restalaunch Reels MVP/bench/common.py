@@ -0,0 +1,175 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Each script builds its own throwaway database, seeds it with synthetic data
+and reports latency percentiles or throughput. Run them from the project
+root, e.g. `python bench/search.py --videos 1000000`.
+"""
+from datetime import datetime, timedelta
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# The benchmarks import the app as `src.*`, like the WSGI entry point
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = (
+    'taco birria salsa ramen pho curry pizza burger brisket dumpling noodle '
+    'sushi bao falafel shawarma kebab arepa empanada churro gelato waffle '
+    'crispy spicy smoky fresh homemade street truck grill bakery vegan '
+    'breakfast lunch dinner late night family secret recipe special'
+).split()
+DISHES = 2000  # Long tail of dish names like 'birria417', so some terms are rare
+CUISINES = ('mexican', 'italian', 'thai', 'japanese', 'korean', 'indian', 'american', 'lebanese')
+CATEGORIES = ('appetizer', 'main', 'dessert', 'drink', 'snack')
+
+
+def load_app(database_path=None, **environ):
+    """
+    Import the app against a fresh SQLite file with background workers off,
+    create the schema and return the main module. Must run before anything
+    else imports src.main.
+    """
+    if database_path is None:
+        database_path = os.path.join(tempfile.mkdtemp(prefix='restalaunch-bench-'), 'app.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+    os.environ.setdefault('METRICS_DIR', os.path.join(os.path.dirname(database_path), 'metrics'))
+    os.environ.setdefault('RESPONSE_CACHE_INVALIDATION_LOG', os.path.join(os.path.dirname(database_path), 'response_cache_invalidations.log'))
+    for name in ('RANK_SCORE_REFRESH_SECONDS', 'DISCOVER_REFRESH_SECONDS', 'COUNTER_FLUSH_INTERVAL_MS', 'MEDIA_WORKERS'):
+        os.environ.setdefault(name, '0')
+    os.environ.setdefault('SLOW_REQUEST_MS', '0')
+    os.environ.update({name: str(value) for name, value in environ.items()})
+
+    from src import main
+    main.init_database()
+    return main
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def dish_name(rng):
+    return f'{rng.choice(WORDS)}{rng.randrange(DISHES)}'
+
+
+def seed(app, users=1000, videos=10000, batch_size=10000, random_seed=1):
+    """
+    Insert synthetic users and videos with bulk Core inserts. ORM listeners
+    (timelines, hashtag index, media jobs) do not run; database triggers,
+    including the search index, do.
+    """
+    from src.models.user import db, User
+    from src.models.video import Video, compute_rank_score
+    from sqlalchemy import select
+
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [
+            {
+                'username': f'bench{n}',
+                'email': f'bench{n}@example.com',
+                'password_hash': 'unusable',
+                'full_name': _sentence(rng, 2).title(),
+                'bio': _sentence(rng, 8),
+                'is_vendor': n % 10 == 0,
+            }
+            for n in range(users)
+        ])
+        user_ids = list(db.session.execute(select(User.id)).scalars())
+
+        for start in range(0, videos, batch_size):
+            rows = []
+            for _ in range(min(batch_size, videos - start)):
+                created_at = now - timedelta(seconds=rng.randrange(30 * 24 * 3600))
+                views, likes, comments = rng.randrange(10000), rng.randrange(500), rng.randrange(50)
+                rows.append({
+                    'user_id': rng.choice(user_ids),
+                    'title': f'{_sentence(rng, 3)} {dish_name(rng)}',
+                    'description': _sentence(rng, 16),
+                    'video_url': 'https://cdn.example.com/video.mp4',
+                    'thumbnail_url': 'https://cdn.example.com/video.jpg',
+                    'hashtags': ','.join(f'#{rng.choice(WORDS)}' for _ in range(3)),
+                    'cuisine_type': rng.choice(CUISINES),
+                    'food_category': rng.choice(CATEGORIES),
+                    'view_count': views,
+                    'like_count': likes,
+                    'comment_count': comments,
+                    'rank_score': compute_rank_score(views, likes, comments, created_at),
+                    'created_at': created_at,
+                    'updated_at': created_at,
+                })
+            db.session.execute(Video.__table__.insert(), rows)
+            db.session.commit()
+    return user_ids
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds for a list of durations in seconds"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(int(len(ordered) * p), len(ordered) - 1)] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered) * 1000,
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+    }
+
+
+def format_summary(label, summary):
+    if not summary.get('count'):
+        return f'{label:<32} no samples'
+    return (
+        f'{label:<32} n={summary["count"]:<6} mean={summary["mean"]:8.2f}ms '
+        f'p50={summary["p50"]:8.2f}ms p95={summary["p95"]:8.2f}ms p99={summary["p99"]:8.2f}ms'
+    )
+
+
+def serve_in_thread(app):
+    """Serve the app on a random local port with a threaded WSGI server. Returns (base_url, server)."""
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # No access log
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def run_for(duration, worker, threads):
+    """
+    Call worker() repeatedly from `threads` threads for `duration` seconds.
+    Returns the list of per-call durations; calls that raise are not timed.
+    """
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def loop():
+        local = []
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                worker()
+            except Exception:
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            samples.extend(local)
+
+    pool = [threading.Thread(target=loop) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return samples
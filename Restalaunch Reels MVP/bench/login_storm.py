@@ -0,0 +1,101 @@
+"""
+Feed latency during a login storm.
+
+    python bench/login_storm.py --login-threads 32 --feed-threads 4 --duration 10
+
+Seeds users and videos, gives every user a password hashed with the app's
+configured method (scrypt by default) and serves the app from a threaded
+local server. The personalized for-you feed, which is not response-cached,
+is timed alone and then while other clients log in as fast as they can.
+Reports feed percentiles for both phases and login throughput, including
+how many logins the hashing pool turned away with 503.
+
+Pass --hash-workers / --hash-queue to try other pool sizes
+(PASSWORD_HASH_WORKERS / PASSWORD_HASH_QUEUE).
+"""
+from common import load_app, seed, summarize, format_summary, serve_in_thread, run_for
+import argparse
+import http.client
+import json
+import random
+import threading
+
+
+def _client(port):
+    local = threading.local()
+
+    def request(method, path, body=None):
+        if not hasattr(local, 'connection'):
+            local.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            local.connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = local.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            del local.connection
+            raise
+        return response.status
+    return request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--login-threads', type=int, default=32)
+    parser.add_argument('--feed-threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--videos', type=int, default=20000)
+    parser.add_argument('--hash-workers', type=int, default=0)
+    parser.add_argument('--hash-queue', type=int, default=-1)
+    args = parser.parse_args()
+
+    main_module = load_app(PASSWORD_HASH_WORKERS=args.hash_workers, PASSWORD_HASH_QUEUE=args.hash_queue)
+    app = main_module.app
+    user_ids = seed(app, users=args.users, videos=args.videos)
+
+    from src.models.user import db, User
+    from src.utils.passwords import password_hasher
+
+    with app.app_context():
+        # Every user shares one password, so one hash serves them all
+        User.query.update({User.password_hash: password_hasher.hash('bench-password')})
+        db.session.commit()
+    print(f'Hashing pool: {password_hasher.workers} workers, queue {password_hasher.queue_size}')
+
+    _, server = serve_in_thread(app)
+    request = _client(server.server_port)
+    rng = random.Random(3)
+    statuses = {}
+    lock = threading.Lock()
+
+    def feed():
+        status = request('GET', f'/api/feed/for-you?user_id={rng.choice(user_ids)}&cursor=')
+        if status != 200:
+            raise RuntimeError(f'feed returned {status}')
+
+    def login():
+        n = rng.randrange(args.users)
+        status = request('POST', '/api/auth/login', {'username': f'bench{n}', 'password': 'bench-password'})
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+
+    try:
+        baseline = run_for(args.duration, feed, args.feed_threads)
+
+        storm = {}
+        logins = threading.Thread(target=lambda: storm.update(logins=run_for(args.duration, login, args.login_threads)))
+        logins.start()
+        during = run_for(args.duration, feed, args.feed_threads)
+        logins.join()
+    finally:
+        server.shutdown()
+
+    print(format_summary('feed, no logins', summarize(baseline)))
+    print(format_summary('feed, during login storm', summarize(during)))
+    print(format_summary('login', summarize(storm['logins'])))
+    print(f'logins: {sum(statuses.values()) / args.duration:.1f}/s, statuses={statuses}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Media serving: the /uploads/<file> endpoint versus the catch-all static
+route that served uploads before it.
+
+    python bench/media.py --size-mb 50 --threads 4 --duration 10
+
+Writes one content-addressed video into a temporary static folder, reachable
+both as /uploads/<sha256>.mp4 (the media endpoint) and as /<sha256>.mp4 (the
+catch-all send_from_directory route), and serves the app from a threaded
+local server. For each route it reports whole-file throughput, latency of
+random 1 MB Range requests and of a revalidation with If-None-Match, plus
+the status codes and caching headers returned. The local server copies file
+bodies through Python; under gunicorn both routes would use sendfile().
+"""
+from common import load_app, summarize, format_summary, serve_in_thread, run_for
+import argparse
+import hashlib
+import http.client
+import os
+import random
+import tempfile
+import threading
+
+RANGE_SIZE = 1024 * 1024
+
+
+def _write_video(static_folder, size):
+    data = os.urandom(size)
+    name = f'{hashlib.sha256(data).hexdigest()}.mp4'
+    os.makedirs(os.path.join(static_folder, 'uploads'))
+    for path in (os.path.join(static_folder, 'uploads', name), os.path.join(static_folder, name)):
+        with open(path, 'wb') as f:
+            f.write(data)
+    return name
+
+
+def measure(host, port, path, size, threads, duration):
+    local = threading.local()
+    statuses = {}
+    lock = threading.Lock()
+
+    def request(headers=None):
+        if not hasattr(local, 'connection'):
+            local.connection = http.client.HTTPConnection(host, port, timeout=30)
+        try:
+            local.connection.request('GET', path, headers=headers or {})
+            response = local.connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            del local.connection
+            raise
+        with lock:
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+        return response, body
+
+    def whole_file():
+        request()
+
+    def byte_range():
+        if not hasattr(local, 'rng'):
+            local.rng = random.Random(threading.get_ident())
+        start = local.rng.randrange(0, size - RANGE_SIZE)
+        request({'Range': f'bytes={start}-{start + RANGE_SIZE - 1}'})
+
+    response, _ = request()
+    etag = response.getheader('ETag')
+
+    def revalidate():
+        request({'If-None-Match': etag} if etag else {})
+
+    results = {}
+    for label, worker in (('whole file', whole_file), ('1 MB range', byte_range), ('If-None-Match', revalidate)):
+        statuses.clear()
+        results[label] = (run_for(duration, worker, threads), dict(statuses))
+    return results, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    app = load_app().app
+    static_folder = tempfile.mkdtemp(prefix='restalaunch-bench-static-')
+    app.static_folder = static_folder
+    app.config['UPLOAD_FOLDER'] = os.path.join(static_folder, 'uploads')
+    name = _write_video(static_folder, size)
+
+    _, server = serve_in_thread(app)
+    host, port = server.server_address[:2]
+    try:
+        for label, path in (('media endpoint', f'/uploads/{name}'), ('catch-all (before)', f'/{name}')):
+            results, response = measure(host, port, path, size, args.threads, args.duration)
+            print(f'{label}: {path}')
+            print(f'  ETag: {response.getheader("ETag")}  Cache-Control: {response.getheader("Cache-Control")}')
+            for kind, (samples, statuses) in results.items():
+                line = format_summary(f'  {kind}', summarize(samples))
+                if kind == 'whole file':
+                    line += f' {len(samples) * args.size_mb / args.duration:.0f} MB/s'
+                print(f'{line} statuses={statuses}')
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Search latency: /api/feed/search on the FTS5 index versus the LIKE scans it
+replaced.
+
+    python bench/search.py --videos 1000000
+
+Seeds the videos (the search index is filled by its triggers), then times
+search requests through the app, for common one- and two-word queries
+(prefixes included) and for rare dish names. With --compare-like, a page of
+videos plus the total is also timed as raw SQL, on the FTS5 index and with
+the old leading-wildcard LIKE query, for common and rare single words.
+"""
+from common import load_app, seed, summarize, format_summary, dish_name, WORDS
+import argparse
+import random
+import time
+
+QUERIES = ('taco', 'birria taco', 'ram', 'spicy noodle', 'street truck', 'gel', 'late night', 'secret recipe')
+
+LIKE_WHERE = (
+    'is_active = 1 AND ('
+    'title LIKE :pattern OR description LIKE :pattern OR hashtags LIKE :pattern OR cuisine_type LIKE :pattern)'
+)
+LIKE_PAGE = f'SELECT id FROM video WHERE {LIKE_WHERE} ORDER BY created_at DESC LIMIT 10'
+LIKE_COUNT = f'SELECT count(*) FROM video WHERE {LIKE_WHERE}'
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--compare-like', action='store_true', help='Also time the old LIKE scan')
+    args = parser.parse_args()
+
+    app = load_app().app
+
+    started = time.perf_counter()
+    seed(app, users=args.users, videos=args.videos)
+    print(f'Seeded {args.videos} videos in {time.perf_counter() - started:.1f}s')
+
+    client = app.test_client()
+    rng = random.Random(7)
+    samples = {}
+    for _ in range(args.requests):
+        for terms, query in (('common', rng.choice(QUERIES)), ('rare', dish_name(rng))):
+            for content_type in ('videos', 'all'):
+                started = time.perf_counter()
+                response = client.get('/api/feed/search', query_string={'q': query, 'type': content_type, 'cursor': ''})
+                samples.setdefault((content_type, terms), []).append(time.perf_counter() - started)
+                assert response.status_code == 200, response.get_data(as_text=True)
+
+    for (content_type, terms), durations in sorted(samples.items()):
+        print(format_summary(f'search type={content_type} {terms} terms', summarize(durations)))
+
+    if args.compare_like:
+        # Both sides as raw SQL: one page plus the total, like the old paginate()
+        from src.models.user import db
+        from src.models.search_index import SEARCH_INDEXES, build_match_query
+        from sqlalchemy import text
+
+        fts, like = [], []
+        with app.app_context():
+            for n in range(min(args.requests, 50)):
+                term = rng.choice(WORDS) if n % 2 else dish_name(rng)
+                match = build_match_query(term)
+                started = time.perf_counter()
+                SEARCH_INDEXES['videos'].search(match, 10)
+                SEARCH_INDEXES['videos'].count(match)
+                fts.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                db.session.execute(text(LIKE_PAGE), {'pattern': f'%{term}%'}).fetchall()
+                db.session.execute(text(LIKE_COUNT), {'pattern': f'%{term}%'}).scalar()
+                like.append(time.perf_counter() - started)
+        print(format_summary('videos page+count, FTS5', summarize(fts)))
+        print(format_summary('videos page+count, LIKE (before)', summarize(like)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Throughput of the feed endpoints under gunicorn, per worker count.
+
+    python bench/serve.py --workers 1 2 4 --threads 16 --duration 20
+
+Seeds one database, then for each worker count starts
+`gunicorn -c src/gunicorn.conf.py src.wsgi:app` on it with WEB_CONCURRENCY
+set, drives the feed endpoints from keep-alive client threads and reports
+requests per second and latency percentiles. The clients run on the same
+host, so on a small machine they compete with the workers for CPU.
+"""
+from common import load_app, seed, summarize, format_summary, run_for
+import argparse
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+PATHS = (
+    '/api/feed/for-you?cursor=',
+    '/api/feed/cuisine/mexican?cursor=',
+    '/api/feed/discover',
+    '/api/feed/search?q=taco&cursor=',
+)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_serving(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', PATHS[0])
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start serving in time')
+
+
+def measure(port, threads, duration):
+    """Returns {path: durations} for `duration` seconds of requests from `threads` clients"""
+    local = threading.local()
+    samples = {path: [] for path in PATHS}
+    failures = []
+
+    def request():
+        if not hasattr(local, 'connection'):
+            local.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local.rng = random.Random(threading.get_ident())
+        path = local.rng.choice(PATHS)
+        started = time.perf_counter()
+        try:
+            local.connection.request('GET', path)
+            response = local.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            del local.connection  # Reconnect on the next call
+            failures.append(path)
+            raise
+        if response.status != 200:
+            failures.append(path)
+            return
+        samples[path].append(time.perf_counter() - started)
+
+    run_for(duration, request, threads)
+    return samples, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=16, help='Client threads')
+    parser.add_argument('--web-threads', type=int, default=4, help='WEB_THREADS for each worker')
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--videos', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=2000)
+    args = parser.parse_args()
+
+    main_module = load_app()
+    seed(main_module.app, users=args.users, videos=args.videos)
+
+    for workers in args.workers:
+        port = _free_port()
+        environ = dict(
+            os.environ,
+            WEB_CONCURRENCY=str(workers),
+            WEB_THREADS=str(args.web_threads),
+            BIND=f'127.0.0.1:{port}',
+            WEB_ACCESS_LOG='',
+            WEB_LOG_LEVEL='warning',
+            # Background services on, as in production
+            RANK_SCORE_REFRESH_SECONDS='60',
+            DISCOVER_REFRESH_SECONDS='300',
+            COUNTER_FLUSH_INTERVAL_MS='250',
+        )
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'src/gunicorn.conf.py', 'src.wsgi:app'],
+            cwd=PROJECT_ROOT, env=environ
+        )
+        try:
+            _wait_until_serving(port, process)
+            samples, failures = measure(port, args.threads, args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+
+        total = sum(len(durations) for durations in samples.values())
+        print(f'WEB_CONCURRENCY={workers}: {total / args.duration:.1f} req/s, {len(failures)} failed')
+        for path, durations in samples.items():
+            print(format_summary(f'  {path.split("?")[0]}', summarize(durations)))
+
+
+if __name__ == '__main__':
+    main()
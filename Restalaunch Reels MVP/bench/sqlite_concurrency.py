@@ -0,0 +1,110 @@
+"""
+SQLite under concurrent readers and writers, with the default connection
+settings versus SQLITE_PRAGMAS from models/db_setup.py.
+
+    python bench/sqlite_concurrency.py --readers 6 --writers 4 --duration 10
+
+Each mode gets a fresh file with a seeded video table. Reader threads run a
+feed-style query, writer threads bump view counts in short transactions, each
+thread on its own sqlite3 connection. Reports operations per second, latency
+and how many operations failed with "database is locked".
+"""
+from common import summarize, format_summary
+from src.models.db_setup import SQLITE_PRAGMAS
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+READ = 'SELECT id, title, view_count FROM video WHERE cuisine_type = ? ORDER BY rank_score DESC LIMIT 20'
+WRITE = 'UPDATE video SET view_count = view_count + 1 WHERE id = ?'
+CUISINES = ('mexican', 'italian', 'thai', 'japanese')
+
+
+def _create(path, videos, pragmas):
+    connection = _connect(path, pragmas)  # journal_mode is stored in the file, so set it before the threads start
+    connection.execute(
+        'CREATE TABLE video (id INTEGER PRIMARY KEY, title TEXT, cuisine_type TEXT, '
+        'rank_score REAL, view_count INTEGER NOT NULL DEFAULT 0)'
+    )
+    connection.execute('CREATE INDEX ix_video_cuisine_rank ON video (cuisine_type, rank_score)')
+    rng = random.Random(1)
+    connection.executemany(
+        'INSERT INTO video (title, cuisine_type, rank_score) VALUES (?, ?, ?)',
+        [(f'video {n}', rng.choice(CUISINES), rng.random()) for n in range(videos)]
+    )
+    connection.commit()
+    connection.close()
+
+
+def _connect(path, pragmas):
+    # timeout=0 so lock waits come only from busy_timeout, as configured
+    connection = sqlite3.connect(path, timeout=0, check_same_thread=False)
+    for name, value in pragmas:
+        connection.execute(f'PRAGMA {name} = {value}')
+    return connection
+
+
+def run(path, pragmas, readers, writers, duration, videos):
+    samples = {'read': [], 'write': []}
+    locked = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def loop(kind):
+        connection = _connect(path, pragmas)
+        rng = random.Random(threading.get_ident())
+        local, failures = [], 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                if kind == 'read':
+                    connection.execute(READ, (rng.choice(CUISINES),)).fetchall()
+                else:
+                    connection.execute(WRITE, (rng.randrange(1, videos + 1),))
+                    connection.commit()
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                connection.rollback()
+                failures += 1
+                continue
+            local.append(time.perf_counter() - started)
+        connection.close()
+        with lock:
+            samples[kind].extend(local)
+            locked[kind] += failures
+
+    threads = [threading.Thread(target=loop, args=('read',)) for _ in range(readers)]
+    threads += [threading.Thread(target=loop, args=('write',)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, locked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=6)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--videos', type=int, default=100000)
+    args = parser.parse_args()
+
+    for label, pragmas in (('default settings', ()), ('SQLITE_PRAGMAS', SQLITE_PRAGMAS)):
+        path = os.path.join(tempfile.mkdtemp(prefix='restalaunch-bench-'), 'app.db')
+        _create(path, args.videos, pragmas)
+        samples, locked = run(path, pragmas, args.readers, args.writers, args.duration, args.videos)
+        print(f'{label}:')
+        for kind in ('read', 'write'):
+            rate = len(samples[kind]) / args.duration
+            print(f'  {kind}: {rate:.0f} ops/s, {locked[kind]} "database is locked" errors')
+            print(format_summary(f'  {kind}', summarize(samples[kind])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+from flask import Blueprint, request, jsonify
+from src.models.user import db
+from src.models.video import Video, Comment
+from src.models.db_setup import read_only
+from src.models.serializers import serialize_comment_threads, serialize_comments
+from src.utils.pagination import keyset_paginate, InvalidCursor
+
+comments_bp = Blueprint('comments', __name__)
+
+MAX_PER_PAGE = 50
+MAX_REPLIES_PER_THREAD = 20
+
+def _get_video(video_id):
+    video = db.session.get(Video, video_id)
+    if video is None or not video.is_active:
+        return None
+    return video
+
+@comments_bp.route('/<int:video_id>/comment-threads', methods=['GET'])
+@read_only
+def get_comment_threads(video_id):
+    """
+    Top-level comments, newest first, each with its first replies, reply
+    count and a cursor for loading more. Cursor paging only.
+    """
+    try:
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), MAX_PER_PAGE)
+        reply_limit = min(max(request.args.get('replies', 3, type=int), 1), MAX_REPLIES_PER_THREAD)
+        cursor = request.args.get('cursor')
+        
+        if _get_video(video_id) is None:
+            return jsonify({'error': 'Video not found'}), 404
+        
+        query = Comment.query.filter(Comment.video_id == video_id, Comment.parent_id.is_(None))
+        roots, next_cursor = keyset_paginate(query, [Comment.created_at, Comment.id], per_page, cursor)
+        
+        return jsonify({
+            'comments': serialize_comment_threads(roots, reply_limit),
+            'pagination': {'next_cursor': next_cursor, 'per_page': per_page}
+        }), 200
+    
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@comments_bp.route('/<int:video_id>/comment-threads/<int:comment_id>/replies', methods=['GET'])
+@read_only
+def get_thread_replies(video_id, comment_id):
+    """
+    More replies in a thread, oldest first. Start from the thread's
+    replies_next_cursor.
+    """
+    try:
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), MAX_PER_PAGE)
+        cursor = request.args.get('cursor')
+        
+        root = db.session.get(Comment, comment_id)
+        if root is None or root.video_id != video_id or root.parent_id is not None:
+            return jsonify({'error': 'Comment thread not found'}), 404
+        
+        query = Comment.query.filter(Comment.root_id == comment_id)
+        replies, next_cursor = keyset_paginate(
+            query, [Comment.created_at, Comment.id], per_page, cursor, descending=False
+        )
+        
+        return jsonify({
+            'replies': serialize_comments(replies),
+            'pagination': {'next_cursor': next_cursor, 'per_page': per_page}
+        }), 200
+    
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
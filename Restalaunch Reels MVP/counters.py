@@ -0,0 +1,291 @@
+"""
+Buffered engagement counters.
+
+Views, shares and likes on a popular video would otherwise be one row write
+each, all contending for SQLite's single writer lock. Views, shares and likes
+are therefore counted with record_view(), record_share() and record_like(),
+which coalesce increments in memory; they are flushed every few hundred
+milliseconds as one batch of atomic `UPDATE video SET view_count =
+view_count + ?` statements. Without a running flusher they fall back to the
+Video model's plain SQL increments.
+
+Increments only take a per-shard lock, so concurrent requests for different
+videos rarely contend. Before a batch is written it is spilled to disk; if the
+process dies mid-flush the batch is replayed on the next start, and a row in
+counter_flush_log records the last committed batch so replay never
+double-counts. Increments still sitting in memory (at most one flush
+interval's worth) are lost on a hard crash.
+
+Every worker process has its own spill file and flush log row, keyed by its
+pid, and holds a lock on `<pid>.lock` in the spill folder while it runs. On
+start a worker replays its own leftover spill and any other whose lock is
+free, i.e. whose process has died. Lock files are never removed: a process
+that removed one while holding it could leave two processes each holding a
+lock on a different file of the same name. There is at most one per pid.
+"""
+from src.models.user import db
+from src.models.video import Video
+from src.models.seen import record_seen
+from src.services.ranking import schedule_rank_refresh
+from sqlalchemy import update, bindparam, text
+from datetime import datetime
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ('view_count', 'like_count', 'share_count')
+
+
+class CounterBuffer:
+    def __init__(self, shards=16):
+        self._shards = [{} for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._oldest_pending = None
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.app = None
+        self.spill_folder = None
+        self.spill_key = None
+        self._lock_file = None
+        self.interval = 0.25
+
+        # Metrics
+        self.flush_count = 0
+        self.flush_failures = 0
+        self.flushed_increments = 0
+        self.last_flush_at = None
+        self.last_flush_duration = 0.0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def record(self, video_id, field, amount=1):
+        """Buffer an increment. Returns False if no flusher is running."""
+        if not self.running:
+            return False
+        shard = video_id % len(self._shards)
+        with self._locks[shard]:
+            deltas = self._shards[shard]
+            key = (video_id, field)
+            deltas[key] = deltas.get(key, 0) + amount
+        if self._oldest_pending is None:
+            self._oldest_pending = time.monotonic()
+        return True
+
+    def pending(self):
+        return sum(len(deltas) for deltas in self._shards)
+
+    def _drain(self):
+        """Swap out every shard and merge them into {video_id: {field: delta}}"""
+        batch = {}
+        for i, lock in enumerate(self._locks):
+            with lock:
+                deltas, self._shards[i] = self._shards[i], {}
+            for (video_id, field), amount in deltas.items():
+                fields = batch.setdefault(video_id, {})
+                fields[field] = fields.get(field, 0) + amount
+        return batch
+
+    def _restore(self, batch):
+        for video_id, fields in batch.items():
+            for field, amount in fields.items():
+                shard = video_id % len(self._shards)
+                with self._locks[shard]:
+                    key = (video_id, field)
+                    self._shards[shard][key] = self._shards[shard].get(key, 0) + amount
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_folder, f'{key}.json')
+
+    def _write_spill(self, batch_id, batch):
+        spill_path = self._spill_path(self.spill_key)
+        tmp_path = spill_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'batch_id': batch_id, 'deltas': {str(k): v for k, v in batch.items()}}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, spill_path)
+
+    def _clear_spill(self):
+        if self.spill_folder and os.path.exists(self._spill_path(self.spill_key)):
+            os.remove(self._spill_path(self.spill_key))
+
+    def _apply(self, batch_id, batch, spill_key=None):
+        """Write one batch and its batch id in a single transaction"""
+        table = Video.__table__
+        statement = update(table).where(table.c.id == bindparam('_id')).values(
+            updated_at=table.c.updated_at,
+            **{field: table.c[field] + bindparam(f'_{field}') for field in COUNTER_FIELDS}
+        )
+        db.session.execute(statement, [
+            {'_id': video_id, **{f'_{field}': fields.get(field, 0) for field in COUNTER_FIELDS}}
+            for video_id, fields in batch.items()
+        ])
+        db.session.execute(
+            text(
+                'INSERT OR REPLACE INTO counter_flush_log (spill_key, batch_id, flushed_at) '
+                'VALUES (:spill_key, :batch_id, :now)'
+            ),
+            {'spill_key': spill_key or self.spill_key, 'batch_id': batch_id, 'now': datetime.utcnow()}
+        )
+        db.session.commit()
+        schedule_rank_refresh(batch.keys())
+
+    def flush(self):
+        """Write all buffered increments. Must be called inside an app context."""
+        with self._flush_lock:
+            oldest = self._oldest_pending
+            self._oldest_pending = None
+            batch = self._drain()
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            batch_id = uuid.uuid4().hex
+            try:
+                if self.spill_folder:
+                    self._write_spill(batch_id, batch)
+                self._apply(batch_id, batch)
+            except Exception:
+                db.session.rollback()
+                self._restore(batch)
+                self._oldest_pending = oldest
+                self.flush_failures += 1
+                raise
+            self._clear_spill()
+
+            finished = time.monotonic()
+            self.flush_count += 1
+            self.flushed_increments += sum(sum(fields.values()) for fields in batch.values())
+            self.last_flush_at = datetime.utcnow()
+            self.last_flush_duration = finished - started
+            self.last_flush_lag = finished - oldest if oldest else 0.0
+            self.max_flush_lag = max(self.max_flush_lag, self.last_flush_lag)
+            return len(batch)
+
+    def replay_spill(self, key):
+        """
+        Apply the batch a worker left behind, unless it was already committed.
+        The caller must hold that worker's lock.
+        """
+        spill_path = self._spill_path(key)
+        if os.path.exists(spill_path + '.tmp'):
+            os.remove(spill_path + '.tmp')  # Never renamed into place, so never applied
+        if not os.path.exists(spill_path):
+            return 0
+        with open(spill_path) as f:
+            spill = json.load(f)
+
+        last_batch = db.session.execute(
+            text('SELECT batch_id FROM counter_flush_log WHERE spill_key = :spill_key'),
+            {'spill_key': key}
+        ).scalar()
+        batch = {int(video_id): fields for video_id, fields in spill['deltas'].items()}
+        if spill['batch_id'] != last_batch:
+            self._apply(spill['batch_id'], batch, spill_key=key)
+            logger.warning('Replayed %d buffered counter updates from %s', len(batch), spill_path)
+        os.remove(spill_path)
+        self._forget(key)
+        return len(batch)
+
+    def _forget(self, key):
+        """Drop a worker's flush log row once it has no spill file left"""
+        db.session.execute(text('DELETE FROM counter_flush_log WHERE spill_key = :spill_key'), {'spill_key': key})
+        db.session.commit()
+
+    def replay_orphaned_spills(self):
+        """Replay this worker's leftover spill and those of dead workers"""
+        replayed = self.replay_spill(self.spill_key)
+        for name in sorted(os.listdir(self.spill_folder)):
+            key, extension = os.path.splitext(name)
+            if extension != '.json' or key == self.spill_key:
+                continue
+            with open(os.path.join(self.spill_folder, f'{key}.lock'), 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Its worker is alive and mid-flush
+                replayed += self.replay_spill(key)
+        return replayed
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception('Counter flush failed')
+
+    def start(self, app, interval=0.25, spill_folder=None):
+        self.app = app
+        self.interval = interval
+        self.spill_folder = spill_folder
+        if spill_folder:
+            os.makedirs(spill_folder, exist_ok=True)
+            self.spill_key = str(os.getpid())
+            # Held until the process exits; blocks while another worker replays a stale file of ours
+            self._lock_file = open(os.path.join(spill_folder, f'{self.spill_key}.lock'), 'a')
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            with app.app_context():
+                self.replay_orphaned_spills()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='counter-flusher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write whatever is still buffered"""
+        if not self.running:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        with self.app.app_context():
+            self.flush()
+            if self.spill_folder:
+                self._forget(self.spill_key)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def stats(self):
+        return {
+            'pending': self.pending(),
+            'flush_count': self.flush_count,
+            'flush_failures': self.flush_failures,
+            'flushed_increments': self.flushed_increments,
+            'last_flush_at': self.last_flush_at.isoformat() if self.last_flush_at else None,
+            'last_flush_duration_seconds': self.last_flush_duration,
+            'last_flush_lag_seconds': self.last_flush_lag,
+            'max_flush_lag_seconds': self.max_flush_lag,
+        }
+
+
+counter_buffer = CounterBuffer()
+
+
+def record_view(video, viewer_id=None):
+    """Count a view and, for a signed-in viewer, mark the video as seen"""
+    if not counter_buffer.record(video.id, 'view_count'):
+        video.increment_view()
+    if viewer_id is not None:
+        record_seen(viewer_id, [video.id])
+
+
+def record_share(video):
+    if not counter_buffer.record(video.id, 'share_count'):
+        video.increment_share()
+
+
+def record_like(video, delta):
+    """Count a like (+1) or unlike (-1)"""
+    if not counter_buffer.record(video.id, 'like_count', delta):
+        video.adjust_like_count(delta)
@@ -0,0 +1,96 @@
+"""
+SQLite connection setup, pool settings and read/write routing.
+
+Every SQLite connection is opened in WAL mode with the pragmas below, so
+readers keep working while a write is in progress and a writer waits up to
+busy_timeout for the lock instead of failing with "database is locked".
+
+Optionally (DB_READ_POOL_SIZE > 0) read-only views run their queries on a
+separate pool of query_only connections, so feed reads never wait for a
+connection slot held by a slow write. Views opt in with @read_only; flushes
+always go to the primary engine.
+"""
+from flask import g, has_app_context, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from functools import wraps
+import sqlite3
+
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),  # Durable across app crashes; WAL makes this safe
+    ('foreign_keys', 'ON'),
+    ('busy_timeout', 10000),  # ms
+    ('cache_size', -65536),  # Negative means KiB: 64 MB per connection
+    ('mmap_size', 268435456),  # 256 MB
+    ('temp_store', 'MEMORY'),
+)
+
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+
+def _make_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA query_only = ON')
+    cursor.close()
+
+
+def engine_options(pool_size=10, max_overflow=10, pool_timeout=30):
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'connect_args': {'check_same_thread': False, 'timeout': 10},
+    }
+
+
+def configure_database(app):
+    """Apply pool settings from the app config. Call before db.init_app(app)."""
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(
+        app.config.get('DB_POOL_SIZE', 10),
+        app.config.get('DB_MAX_OVERFLOW', 10),
+        app.config.get('DB_POOL_TIMEOUT', 30)
+    ))
+
+
+def init_read_engine(app):
+    """Create the read-only pool if DB_READ_POOL_SIZE is set. Call after db.init_app(app)."""
+    pool_size = app.config.get('DB_READ_POOL_SIZE', 0)
+    if pool_size <= 0:
+        return None
+    engine = create_engine(
+        app.config['SQLALCHEMY_DATABASE_URI'],
+        **engine_options(pool_size, pool_size, app.config.get('DB_POOL_TIMEOUT', 30))
+    )
+    event.listen(engine, 'connect', _make_query_only)
+    app.extensions['read_engine'] = engine
+    return engine
+
+
+def read_only(view):
+    """Mark a view as read-only so its queries may use the read pool"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only_db = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class RoutingSession(Session):
+    """Sends reads from @read_only views to the read engine, everything else to the primary"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('read_only_db'):
+            engine = current_app.extensions.get('read_engine')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
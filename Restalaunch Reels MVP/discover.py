@@ -0,0 +1,188 @@
+"""
+Precomputed payload for /api/feed/discover.
+
+The discover page aggregates trending hashtags, cuisines, featured videos and
+top vendors, which change slowly. A background worker rebuilds the serialized
+payload every few minutes and swaps it in atomically; requests only read the
+current snapshot, so a rebuild never blocks them.
+"""
+from src.models.user import db
+from src.models.vendor import Vendor
+from src.models.video import Video
+from src.models.hashtag import Hashtag, VideoHashtag
+from src.models.serializers import serialize_videos
+from sqlalchemy import desc, func, and_
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class DiscoverSnapshot:
+    def __init__(self, body, version, built_at):
+        self.body = body
+        self.version = version
+        self.built_at = built_at
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+
+
+_snapshot = None
+_build_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_refresh_in_flight = False
+
+
+def build_discover_payload():
+    """Run the discover aggregations and return the response payload"""
+    # Get trending hashtags (most used in recent videos)
+    recent_date = datetime.utcnow() - timedelta(days=7)
+    trending_hashtags = db.session.query(
+        Hashtag.name,
+        func.count(VideoHashtag.id).label('count')
+    ).join(
+        VideoHashtag, VideoHashtag.hashtag_id == Hashtag.id
+    ).join(
+        Video, Video.id == VideoHashtag.video_id
+    ).filter(
+        and_(
+            Video.created_at >= recent_date,
+            Video.is_active == True
+        )
+    ).group_by(Hashtag.id).order_by(desc('count')).limit(10).all()
+    
+    # Get trending cuisines
+    cuisine_counts = db.session.query(
+        Video.cuisine_type,
+        func.count(Video.id).label('count')
+    ).filter(
+        and_(
+            Video.created_at >= recent_date,
+            Video.is_active == True,
+            Video.cuisine_type.isnot(None)
+        )
+    ).group_by(Video.cuisine_type).order_by(desc('count')).limit(10).all()
+    
+    # Get featured videos
+    featured_videos = Video.query.filter(
+        and_(
+            Video.is_featured == True,
+            Video.is_active == True
+        )
+    ).order_by(desc(Video.created_at)).limit(5).all()
+    
+    # Get top vendors by engagement
+    top_vendors = db.session.query(
+        Vendor,
+        func.sum(Video.like_count + Video.comment_count + Video.view_count).label('total_engagement')
+    ).join(Video, Vendor.id == Video.vendor_id).filter(
+        and_(
+            Video.created_at >= recent_date,
+            Video.is_active == True,
+            Vendor.is_active == True
+        )
+    ).group_by(Vendor.id).order_by(desc('total_engagement')).limit(10).all()
+
+    return {
+        'trending_hashtags': [{'hashtag': tag, 'count': count} for tag, count in trending_hashtags],
+        'trending_cuisines': [{'cuisine': cuisine, 'count': count} for cuisine, count in cuisine_counts],
+        'featured_videos': serialize_videos(featured_videos),
+        'top_vendors': [vendor.to_dict() for vendor, _ in top_vendors]
+    }
+
+
+def _age_seconds(snapshot):
+    return (datetime.utcnow() - snapshot.built_at).total_seconds()
+
+
+def rebuild_discover_snapshot(max_age=None):
+    """
+    Rebuild the snapshot. Must be called inside an app context. With
+    max_age, a snapshot another thread finished while this one waited for
+    the lock is returned instead of building again.
+    """
+    global _snapshot
+    with _build_lock:
+        if max_age is not None and _snapshot is not None and _age_seconds(_snapshot) <= max_age:
+            return _snapshot
+
+        payload = build_discover_payload()
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+        snapshot = DiscoverSnapshot(body, 1, datetime.utcnow())
+        if _snapshot is not None:
+            # Version only moves when the content does
+            snapshot.version = _snapshot.version + (snapshot.etag != _snapshot.etag)
+        _snapshot = snapshot
+    return snapshot
+
+
+def _refresh_in_background(app, max_age):
+    """Start one refresh thread; requests arriving while it runs start none"""
+    global _refresh_in_flight
+    with _refresh_lock:
+        if _refresh_in_flight:
+            return
+        _refresh_in_flight = True
+
+    def refresh():
+        global _refresh_in_flight
+        try:
+            with app.app_context():
+                rebuild_discover_snapshot(max_age)
+        except Exception:
+            logger.exception('Discover snapshot refresh failed')
+        finally:
+            with _refresh_lock:
+                _refresh_in_flight = False
+
+    threading.Thread(target=refresh, name='discover-refresh', daemon=True).start()
+
+
+def get_discover_snapshot(app):
+    """
+    Return the current snapshot. Only the very first request builds it
+    inline, and concurrent first requests wait for that one build; a stale
+    snapshot is served while a single refresh runs in the background.
+    """
+    # Covers a stalled or disabled worker
+    max_age = (app.config.get('DISCOVER_REFRESH_SECONDS') or 300) * 2
+
+    snapshot = _snapshot
+    if snapshot is None:
+        return rebuild_discover_snapshot(max_age)
+
+    if _age_seconds(snapshot) > max_age:
+        _refresh_in_background(app, max_age)
+    return snapshot
+
+
+class DiscoverWorker(threading.Thread):
+    """Background thread that rebuilds the discover snapshot every interval"""
+
+    def __init__(self, app, interval=300):
+        super().__init__(name='discover-worker', daemon=True)
+        self.app = app
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    rebuild_discover_snapshot()
+            except Exception:
+                logger.exception('Discover snapshot rebuild failed')
+            if self._stop_event.wait(self.interval):
+                break
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_discover_worker(app, interval=300):
+    worker = DiscoverWorker(app, interval)
+    worker.start()
+    return worker
@@ -1,15 +1,56 @@
-from flask import Blueprint, request, jsonify
-from src.models.user import db, User, Follow
+from flask import Blueprint, request, jsonify, current_app
+from src.models.user import db, User
 from src.models.vendor import Vendor
-from src.models.video import Video, Like
+from src.models.video import Video
+from src.models.hashtag import Hashtag, VideoHashtag, normalize_hashtag
 from src.routes.auth import token_required
-from sqlalchemy import desc, func, and_, or_
-from datetime import datetime, timedelta
+from src.models.db_setup import read_only
+from src.models.serializers import serialize_videos, serialize_users
+from src.models.search_index import SEARCH_INDEXES, build_match_query
+from src.models.timeline import following_feed_query
+from src.models.seen import record_seen
+from src.services.recommendations import (
+    get_ranked_video_ids, load_videos_in_order, new_session_seed, daily_session_seed, session_location,
+    encode_session_cursor, decode_session_cursor
+)
+from src.models.spatial import (
+    ids_within_box, distance_km, nearby_vendors, vendor_location_index, video_location_index
+)
+from src.services.discover import get_discover_snapshot
+from src.utils.response_cache import cached_response
+from src.utils.pagination import keyset_paginate, encode_cursor, decode_cursor, InvalidCursor
+from sqlalchemy import func, and_, or_
 import random
 
 feed_bp = Blueprint('feed', __name__)
 
+def paginate_feed(query, sort_keys, page, per_page, cursor=None, descending=True):
+    """
+    Paginate a feed query. Without a cursor this is the classic page/total
+    response; passing `cursor` (empty for the first page) switches to keyset
+    pagination on `sort_keys`, which skips the COUNT and the OFFSET scan.
+    """
+    if cursor is not None:
+        items, next_cursor = keyset_paginate(query, sort_keys, per_page, cursor, descending)
+        return items, {'next_cursor': next_cursor, 'per_page': per_page}
+
+    result = query.order_by(
+        *[key.desc() if descending else key.asc() for key in sort_keys]
+    ).paginate(
+        page=page,
+        per_page=per_page,
+        error_out=False
+    )
+    return result.items, {
+        'total': result.total,
+        'pages': result.pages,
+        'current_page': page,
+        'per_page': per_page
+    }
+
 @feed_bp.route('/for-you', methods=['GET'])
+@read_only
+@cached_response(ttl=30, tags=lambda: {('feed', 'for-you')}, when=lambda: not request.args.get('user_id'))
 def get_for_you_feed():
     """
     Main TikTok-style feed with personalized content
@@ -17,92 +58,96 @@ def get_for_you_feed():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        cursor = request.args.get('cursor')
         user_id = request.args.get('user_id', type=int)  # Optional for personalization
+        lat = request.args.get('lat', type=float)  # Optional, adds nearby candidates
+        lng = request.args.get('lng', type=float)
         
-        # Base query for active videos
-        query = Video.query.filter_by(is_active=True)
-        
-        if user_id:
-            # Personalized feed based on user preferences
-            user = User.query.get(user_id)
-            if user:
-                # Get videos from followed users
-                followed_users = db.session.query(Follow.followed_id).filter_by(follower_id=user_id).subquery()
-                
-                # Get user's liked videos to understand preferences
-                liked_videos = db.session.query(Like.video_id).filter_by(user_id=user_id).subquery()
-                liked_video_objects = Video.query.filter(Video.id.in_(liked_videos)).all()
-                
-                # Extract preferences from liked videos
-                preferred_cuisines = list(set([v.cuisine_type for v in liked_video_objects if v.cuisine_type]))
-                preferred_categories = list(set([v.food_category for v in liked_video_objects if v.food_category]))
-                
-                # Build personalized query
-                personalized_conditions = []
-                
-                # Videos from followed users (high priority)
-                personalized_conditions.append(Video.user_id.in_(followed_users))
-                
-                # Videos matching cuisine preferences
-                if preferred_cuisines:
-                    personalized_conditions.append(Video.cuisine_type.in_(preferred_cuisines))
-                
-                # Videos matching category preferences
-                if preferred_categories:
-                    personalized_conditions.append(Video.food_category.in_(preferred_categories))
-                
-                # Trending videos (high engagement)
-                trending_threshold = datetime.utcnow() - timedelta(days=7)
-                personalized_conditions.append(
-                    and_(
-                        Video.created_at >= trending_threshold,
-                        (Video.like_count + Video.comment_count + Video.view_count) > 10
-                    )
-                )
-                
-                if personalized_conditions:
-                    query = query.filter(or_(*personalized_conditions))
-        
-        # Order by a mix of recency and engagement
-        # This creates a balanced feed of new and popular content
-        query = query.order_by(
-            desc(
-                func.log(Video.view_count + 1) * 0.3 +
-                func.log(Video.like_count + 1) * 0.4 +
-                func.log(Video.comment_count + 1) * 0.3 +
-                func.extract('epoch', Video.created_at) / 100000  # Recency factor
-            )
-        )
-        
-        # Pagination
-        videos = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
-        
-        # Shuffle results slightly to add variety
-        video_list = list(videos.items)
-        if len(video_list) > 5:
-            # Keep first few videos in order, shuffle the rest slightly
-            stable_count = min(3, len(video_list))
-            stable_videos = video_list[:stable_count]
-            shuffled_videos = video_list[stable_count:]
-            random.shuffle(shuffled_videos)
-            video_list = stable_videos + shuffled_videos
+        if user_id and db.session.get(User, user_id):
+            # Personalized feed: rank candidates once per session, then page through them.
+            # Later pages keep the session's location, from the signed cursor
+            if cursor:
+                seed, offset, lat, lng = decode_session_cursor(cursor, user_id)
+            elif cursor is not None:
+                seed, offset = new_session_seed(), 0
+                lat, lng = session_location(lat, lng)
+            else:
+                seed, offset = daily_session_seed(user_id), (page - 1) * per_page
+                lat, lng = session_location(lat, lng)
+            
+            ranked_ids = get_ranked_video_ids(user_id, seed, lat, lng)
+            video_list = load_videos_in_order(ranked_ids[offset:offset + per_page])
+            
+            if cursor is not None:
+                next_offset = offset + per_page
+                page_info = {
+                    'next_cursor': encode_session_cursor(user_id, seed, next_offset, lat, lng) if next_offset < len(ranked_ids) else None,
+                    'per_page': per_page
+                }
+            else:
+                page_info = {
+                    'total': len(ranked_ids),
+                    'pages': (len(ranked_ids) + per_page - 1) // per_page,
+                    'current_page': page,
+                    'per_page': per_page
+                }
+        else:
+            # Order by a mix of recency and engagement
+            # This creates a balanced feed of new and popular content.
+            # rank_score is precomputed (see compute_rank_score) so this is an
+            # index range scan on (is_active, rank_score).
+            query = Video.query.filter_by(is_active=True)
+            videos, page_info = paginate_feed(query, [Video.rank_score, Video.id], page, per_page, cursor)
+            
+            # Shuffle results slightly to add variety, seeded by the page so
+            # the same request always returns the same order
+            video_list = list(videos)
+            if len(video_list) > 5:
+                # Keep first few videos in order, shuffle the rest slightly
+                stable_count = min(3, len(video_list))
+                stable_videos = video_list[:stable_count]
+                shuffled_videos = video_list[stable_count:]
+                random.Random(cursor or page).shuffle(shuffled_videos)
+                video_list = stable_videos + shuffled_videos
         
         return jsonify({
-            'videos': [video.to_dict() for video in video_list],
-            'total': videos.total,
-            'pages': videos.pages,
-            'current_page': page,
-            'per_page': per_page
+            'videos': serialize_videos(video_list),
+            **page_info
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@feed_bp.route('/seen', methods=['POST'])
+@token_required
+def record_seen_videos(current_user):
+    """
+    Record videos the current user has watched so the for-you feed skips them
+    """
+    try:
+        data = request.get_json() or {}
+        video_ids = data.get('video_ids')
+        
+        if not isinstance(video_ids, list) or not video_ids:
+            return jsonify({'error': 'video_ids must be a non-empty list'}), 400
+        if len(video_ids) > 500:
+            return jsonify({'error': 'At most 500 video_ids per request'}), 400
+        if not all(isinstance(video_id, int) and not isinstance(video_id, bool) for video_id in video_ids):
+            return jsonify({'error': 'video_ids must be integers'}), 400
+        
+        record_seen(current_user.id, video_ids)
+        db.session.commit()
+        
+        return jsonify({'message': 'Seen videos recorded', 'count': len(video_ids)}), 200
+        
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @feed_bp.route('/following', methods=['GET'])
+@read_only
 @token_required
 def get_following_feed(current_user):
     """
@@ -111,36 +156,24 @@ def get_following_feed(current_user):
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        cursor = request.args.get('cursor')
         
-        # Get followed users
-        followed_users = db.session.query(Follow.followed_id).filter_by(
-            follower_id=current_user.id
-        ).subquery()
-        
-        # Get videos from followed users
-        videos = Video.query.filter(
-            and_(
-                Video.user_id.in_(followed_users),
-                Video.is_active == True
-            )
-        ).order_by(desc(Video.created_at)).paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        # Get videos from followed users via the precomputed timeline
+        query, sort_keys = following_feed_query(current_user.id)
+        videos, page_info = paginate_feed(query, sort_keys, page, per_page, cursor)
         
         return jsonify({
-            'videos': [video.to_dict() for video in videos.items],
-            'total': videos.total,
-            'pages': videos.pages,
-            'current_page': page,
-            'per_page': per_page
+            'videos': serialize_videos(videos),
+            **page_info
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @feed_bp.route('/local', methods=['GET'])
+@read_only
 def get_local_feed():
     """
     Feed showing videos from vendors in a specific location
@@ -148,93 +181,88 @@ def get_local_feed():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        cursor = request.args.get('cursor')
         lat = request.args.get('lat', type=float)
         lng = request.args.get('lng', type=float)
         radius = request.args.get('radius', 10, type=float)  # km
         
-        if not lat or not lng:
+        if lat is None or lng is None:
             return jsonify({'error': 'Latitude and longitude are required'}), 400
         
-        # Simple distance calculation for local videos
-        lat_range = radius / 111.0  # Rough conversion
-        lng_range = radius / (111.0 * abs(lat))
+        # Candidates come from the R*Tree indexes (bounding box only)
+        box_vendor_ids = ids_within_box(vendor_location_index, lat, lng, radius)
+        box_video_ids = ids_within_box(video_location_index, lat, lng, radius)
         
-        # Get vendors in the area
-        local_vendors = Vendor.query.filter(
-            and_(
-                Vendor.latitude.between(lat - lat_range, lat + lat_range),
-                Vendor.longitude.between(lng - lng_range, lng + lng_range),
-                Vendor.is_active == True
-            )
-        ).all()
-        
-        vendor_ids = [vendor.id for vendor in local_vendors]
+        # A video's own location wins over its vendor's
+        distance = distance_km(
+            lat, lng,
+            func.coalesce(Video.latitude, Vendor.latitude),
+            func.coalesce(Video.longitude, Vendor.longitude)
+        )
         
-        # Get videos from local vendors or videos with location in the area
-        videos = Video.query.filter(
+        # Get videos from local vendors or videos with location in the area, nearest first
+        query = Video.query.outerjoin(
+            Vendor, Vendor.id == Video.vendor_id
+        ).filter(
             and_(
                 Video.is_active == True,
                 or_(
-                    Video.vendor_id.in_(vendor_ids),
-                    and_(
-                        Video.latitude.between(lat - lat_range, lat + lat_range),
-                        Video.longitude.between(lng - lng_range, lng + lng_range)
-                    )
-                )
+                    and_(Video.vendor_id.in_(box_vendor_ids), Vendor.is_active == True),
+                    Video.id.in_(box_video_ids)
+                ),
+                distance <= radius
             )
-        ).order_by(desc(Video.created_at)).paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        )
+        videos, page_info = paginate_feed(
+            query, [distance, Video.id], page, per_page, cursor, descending=False
         )
         
         return jsonify({
-            'videos': [video.to_dict() for video in videos.items],
-            'total': videos.total,
-            'pages': videos.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'local_vendors_count': len(local_vendors)
+            'videos': serialize_videos(videos),
+            **page_info,
+            'local_vendors_count': nearby_vendors(lat, lng, radius).order_by(None).count()
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @feed_bp.route('/cuisine/<cuisine_type>', methods=['GET'])
+@read_only
+@cached_response(ttl=60, tags=lambda cuisine_type: {('cuisine', cuisine_type.strip().lower())})
 def get_cuisine_feed(cuisine_type):
     """
-    Feed showing videos for a specific cuisine type
+    Feed showing videos for a specific cuisine type, matched case-insensitively
     """
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        cursor = request.args.get('cursor')
         
-        videos = Video.query.filter(
+        query = Video.query.filter(
             and_(
-                Video.cuisine_type.ilike(f'%{cuisine_type}%'),
+                Video.cuisine_key == func.lower(func.trim(cuisine_type)),
                 Video.is_active == True
             )
-        ).order_by(
-            desc(Video.like_count + Video.comment_count + Video.view_count)
-        ).paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
         )
+        engagement = Video.like_count + Video.comment_count + Video.view_count
+        videos, page_info = paginate_feed(query, [engagement, Video.id], page, per_page, cursor)
         
         return jsonify({
-            'videos': [video.to_dict() for video in videos.items],
-            'total': videos.total,
-            'pages': videos.pages,
-            'current_page': page,
-            'per_page': per_page,
+            'videos': serialize_videos(videos),
+            **page_info,
             'cuisine_type': cuisine_type
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @feed_bp.route('/hashtag/<hashtag>', methods=['GET'])
+@read_only
+@cached_response(ttl=60, tags=lambda hashtag: {('hashtag', normalize_hashtag(hashtag))})
 def get_hashtag_feed(hashtag):
     """
     Feed showing videos for a specific hashtag
@@ -242,102 +270,83 @@ def get_hashtag_feed(hashtag):
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        cursor = request.args.get('cursor')
         
         # Remove # if present
         hashtag = hashtag.lstrip('#')
         
-        videos = Video.query.filter(
+        # Exact match through the hashtag index
+        query = Video.query.join(
+            VideoHashtag, VideoHashtag.video_id == Video.id
+        ).join(
+            Hashtag, Hashtag.id == VideoHashtag.hashtag_id
+        ).filter(
             and_(
-                Video.hashtags.ilike(f'%{hashtag}%'),
+                Hashtag.name == normalize_hashtag(hashtag),
                 Video.is_active == True
             )
-        ).order_by(
-            desc(Video.like_count + Video.comment_count + Video.view_count)
-        ).paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
         )
+        engagement = Video.like_count + Video.comment_count + Video.view_count
+        videos, page_info = paginate_feed(query, [engagement, Video.id], page, per_page, cursor)
         
         return jsonify({
-            'videos': [video.to_dict() for video in videos.items],
-            'total': videos.total,
-            'pages': videos.pages,
-            'current_page': page,
-            'per_page': per_page,
+            'videos': serialize_videos(videos),
+            **page_info,
             'hashtag': hashtag
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @feed_bp.route('/discover', methods=['GET'])
+@read_only
 def get_discover_feed():
     """
     Discovery feed with trending hashtags, cuisines, and featured content
     """
     try:
-        # Get trending hashtags (most used in recent videos)
-        recent_date = datetime.utcnow() - timedelta(days=7)
-        recent_videos = Video.query.filter(
-            and_(
-                Video.created_at >= recent_date,
-                Video.is_active == True,
-                Video.hashtags.isnot(None)
-            )
-        ).all()
+        # Served from a precomputed snapshot; see src.services.discover
+        snapshot = get_discover_snapshot(current_app._get_current_object())
         
-        hashtag_counts = {}
-        for video in recent_videos:
-            hashtags = video.get_hashtags_list()
-            for hashtag in hashtags:
-                hashtag_counts[hashtag] = hashtag_counts.get(hashtag, 0) + 1
-        
-        trending_hashtags = sorted(hashtag_counts.items(), key=lambda x: x[1], reverse=True)[:10]
-        
-        # Get trending cuisines
-        cuisine_counts = db.session.query(
-            Video.cuisine_type,
-            func.count(Video.id).label('count')
-        ).filter(
-            and_(
-                Video.created_at >= recent_date,
-                Video.is_active == True,
-                Video.cuisine_type.isnot(None)
-            )
-        ).group_by(Video.cuisine_type).order_by(desc('count')).limit(10).all()
-        
-        # Get featured videos
-        featured_videos = Video.query.filter(
-            and_(
-                Video.is_featured == True,
-                Video.is_active == True
-            )
-        ).order_by(desc(Video.created_at)).limit(5).all()
-        
-        # Get top vendors by engagement
-        top_vendors = db.session.query(
-            Vendor,
-            func.sum(Video.like_count + Video.comment_count + Video.view_count).label('total_engagement')
-        ).join(Video, Vendor.id == Video.vendor_id).filter(
-            and_(
-                Video.created_at >= recent_date,
-                Video.is_active == True,
-                Vendor.is_active == True
-            )
-        ).group_by(Vendor.id).order_by(desc('total_engagement')).limit(10).all()
-        
-        return jsonify({
-            'trending_hashtags': [{'hashtag': tag, 'count': count} for tag, count in trending_hashtags],
-            'trending_cuisines': [{'cuisine': cuisine, 'count': count} for cuisine, count in cuisine_counts],
-            'featured_videos': [video.to_dict() for video in featured_videos],
-            'top_vendors': [vendor.to_dict() for vendor, _ in top_vendors]
-        }), 200
+        response = current_app.response_class(snapshot.body, mimetype='application/json')
+        response.set_etag(snapshot.etag)
+        response.headers['X-Discover-Version'] = str(snapshot.version)
+        response.last_modified = snapshot.built_at
+        response.headers['Cache-Control'] = 'public, max-age=60'
+        return response.make_conditional(request)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _search_section(model, content_type, match, page, per_page, cursor):
+    """
+    Rank one content type through its full-text index. Returns the matching
+    objects in BM25 order plus either a total (page mode) or a next_cursor.
+    """
+    index = SEARCH_INDEXES[content_type]
+    if match is None:
+        return [], ({'next_cursor': None} if cursor is not None else {'total': 0})
+    
+    if cursor is not None:
+        after = decode_cursor(cursor, ('score', 'id')) if cursor else None
+        rows = index.search(match, per_page + 1, after=after)
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            next_cursor = encode_cursor([rows[-1].score, rows[-1].id])
+        info = {'next_cursor': next_cursor}
+    else:
+        rows = index.search(match, per_page, offset=(page - 1) * per_page)
+        info = {'total': index.count(match)}
+    
+    ids = [row.id for row in rows]
+    objects = {obj.id: obj for obj in model.query.filter(model.id.in_(ids))} if ids else {}
+    return [objects[id] for id in ids if id in objects], info
+
 @feed_bp.route('/search', methods=['GET'])
+@read_only
 def search_content():
     """
     Search across videos, vendors, and users
@@ -347,69 +356,41 @@ def search_content():
         content_type = request.args.get('type', 'all')  # all, videos, vendors, users
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        # Cursor paging applies to single-type searches only
+        cursor = request.args.get('cursor') if content_type != 'all' else None
         
         if not query:
             return jsonify({'error': 'Search query is required'}), 400
         
+        match = build_match_query(query)
         results = {}
         
         if content_type in ['all', 'videos']:
-            videos = Video.query.filter(
-                and_(
-                    Video.is_active == True,
-                    or_(
-                        Video.title.ilike(f'%{query}%'),
-                        Video.description.ilike(f'%{query}%'),
-                        Video.hashtags.ilike(f'%{query}%'),
-                        Video.cuisine_type.ilike(f'%{query}%')
-                    )
-                )
-            ).order_by(desc(Video.created_at)).paginate(
+            videos, info = _search_section(
+                Video, 'videos', match,
                 page=page if content_type == 'videos' else 1,
                 per_page=per_page if content_type == 'videos' else 10,
-                error_out=False
+                cursor=cursor
             )
-            results['videos'] = {
-                'items': [video.to_dict() for video in videos.items],
-                'total': videos.total
-            }
+            results['videos'] = {'items': serialize_videos(videos), **info}
         
         if content_type in ['all', 'vendors']:
-            vendors = Vendor.query.filter(
-                and_(
-                    Vendor.is_active == True,
-                    or_(
-                        Vendor.business_name.ilike(f'%{query}%'),
-                        Vendor.description.ilike(f'%{query}%'),
-                        Vendor.cuisine_type.ilike(f'%{query}%')
-                    )
-                )
-            ).paginate(
+            vendors, info = _search_section(
+                Vendor, 'vendors', match,
                 page=page if content_type == 'vendors' else 1,
                 per_page=per_page if content_type == 'vendors' else 10,
-                error_out=False
+                cursor=cursor
             )
-            results['vendors'] = {
-                'items': [vendor.to_dict() for vendor in vendors.items],
-                'total': vendors.total
-            }
+            results['vendors'] = {'items': [vendor.to_dict() for vendor in vendors], **info}
         
         if content_type in ['all', 'users']:
-            users = User.query.filter(
-                or_(
-                    User.username.ilike(f'%{query}%'),
-                    User.full_name.ilike(f'%{query}%'),
-                    User.bio.ilike(f'%{query}%')
-                )
-            ).paginate(
+            users, info = _search_section(
+                User, 'users', match,
                 page=page if content_type == 'users' else 1,
                 per_page=per_page if content_type == 'users' else 10,
-                error_out=False
+                cursor=cursor
             )
-            results['users'] = {
-                'items': [user.to_public_dict() for user in users.items],
-                'total': users.total
-            }
+            results['users'] = {'items': serialize_users(users), **info}
         
         return jsonify({
             'query': query,
@@ -418,6 +399,8 @@ def search_content():
             'per_page': per_page
         }), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
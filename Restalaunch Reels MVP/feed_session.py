@@ -0,0 +1,71 @@
+"""
+Ranked for-you feed sessions, shared by every worker process.
+
+A session's ranked id list is stored when its first page is built, so later
+pages are slices of the same list whichever worker serves them. Writes use a
+short transaction of their own on the primary engine, because the for-you
+view is read-only.
+"""
+from src.models.user import db
+from sqlalchemy import select, insert, delete
+from array import array
+from datetime import datetime, timedelta
+
+
+class FeedSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    session_key = db.Column(db.String(100), unique=True, nullable=False)  # user_id:seed:lat:lng
+    video_ids = db.Column(db.LargeBinary, nullable=False)  # Ranked order, packed 32-bit ids
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_feed_session_user', 'user_id'),
+        db.Index('ix_feed_session_expires', 'expires_at'),
+    )
+
+    def __repr__(self):
+        return f'<FeedSession {self.session_key}>'
+
+
+def _pack(video_ids):
+    return array('I', video_ids).tobytes()
+
+
+def _unpack(data):
+    video_ids = array('I')
+    video_ids.frombytes(data)
+    return video_ids.tolist()
+
+
+def load_feed_session(session_key):
+    """Return the stored ranked ids for a session, or None if absent or expired"""
+    data = db.session.execute(
+        select(FeedSession.video_ids).where(
+            FeedSession.session_key == session_key,
+            FeedSession.expires_at > datetime.utcnow()
+        )
+    ).scalar()
+    return _unpack(data) if data is not None else None
+
+
+def store_feed_session(user_id, session_key, video_ids, ttl):
+    """
+    Store a session's ranked ids unless another worker stored it first, and
+    return the stored list. Expired sessions are purged on the way.
+    """
+    now = datetime.utcnow()
+    with db.engine.begin() as connection:
+        connection.execute(delete(FeedSession).where(FeedSession.expires_at <= now))
+        connection.execute(insert(FeedSession).prefix_with('OR IGNORE').values(
+            user_id=user_id,
+            session_key=session_key,
+            video_ids=_pack(video_ids),
+            created_at=now,
+            expires_at=now + timedelta(seconds=ttl)
+        ))
+        data = connection.execute(
+            select(FeedSession.video_ids).where(FeedSession.session_key == session_key)
+        ).scalar()
+    return _unpack(data)
@@ -0,0 +1,60 @@
+"""
+Gunicorn settings for serving the API.
+
+    gunicorn -c src/gunicorn.conf.py src.wsgi:app
+
+Every setting can be overridden from the environment. The master process
+never imports the app: schema creation and migrations run once in a short
+subprocess, and each worker imports the app fresh, opens its own database
+connections and starts its own background services. `kill -HUP <master>`
+re-runs migrations and replaces the workers gracefully with the new code.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+os.environ['WEB_CONCURRENCY'] = str(workers)  # Workers inherit it and split per-host pools (password hashing) between them
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth (0 disables)
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# Workers must import the app themselves so a HUP picks up new code
+preload_app = False
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-') or None  # Empty disables
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+
+
+def _init_database(server):
+    server.log.info('Creating tables and applying migrations')
+    subprocess.run(
+        [sys.executable, '-c', 'from src.main import init_database; init_database()'],
+        check=True
+    )
+
+
+def on_starting(server):
+    _init_database(server)
+
+
+def on_reload(server):
+    _init_database(server)
+
+
+def post_worker_init(worker):
+    from src.main import start_background_services
+    start_background_services()
+
+
+def worker_exit(server, worker):
+    from src.main import stop_background_services
+    stop_background_services()
@@ -0,0 +1,159 @@
+from src.models.user import db
+from src.models.video import Video
+from sqlalchemy import event, insert, select, func
+from sqlalchemy.orm import Session, attributes
+from datetime import datetime
+
+
+def normalize_hashtag(tag):
+    """Lowercase a hashtag and strip the leading '#'"""
+    return tag.strip().lstrip('#').strip().lower()
+
+
+class Hashtag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)  # Normalized, without '#'
+    usage_count = db.Column(db.Integer, default=0, nullable=False)  # Number of videos tagged
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Hashtag #{self.name}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'usage_count': self.usage_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class VideoHashtag(db.Model):
+    """Inverted index from hashtags to the videos that use them"""
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id', ondelete='CASCADE'), nullable=False)
+    hashtag_id = db.Column(db.Integer, db.ForeignKey('hashtag.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    video = db.relationship('Video', backref=db.backref('hashtag_links', lazy='dynamic', cascade='all, delete-orphan'))
+    hashtag = db.relationship('Hashtag', backref=db.backref('video_links', lazy='dynamic'))
+
+    __table_args__ = (
+        db.UniqueConstraint('video_id', 'hashtag_id', name='unique_video_hashtag'),
+        db.Index('ix_video_hashtag_tag_video', 'hashtag_id', 'video_id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'video_id': self.video_id,
+            'hashtag_id': self.hashtag_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+def _wanted_hashtags(video):
+    return {name for name in (normalize_hashtag(tag) for tag in video.get_hashtags_list()) if name}
+
+
+@event.listens_for(Session, 'before_flush')
+def _sync_video_hashtags(session, flush_context, instances):
+    """Mirror changes to Video.hashtags into the VideoHashtag index"""
+    changed = [
+        obj for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, Video) and (
+            obj in session.new or attributes.get_history(obj, 'hashtags').has_changes()
+        )
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Video) and obj.id is not None]
+    if not changed and not deleted:
+        return
+
+    deltas = {}
+    with session.no_autoflush:
+        # Current links of every affected video, with their names, in one query
+        current_links = {}
+        stored_ids = [video.id for video in changed if video not in session.new] + [video.id for video in deleted]
+        if stored_ids:
+            rows = session.query(VideoHashtag, Hashtag.name).join(
+                Hashtag, Hashtag.id == VideoHashtag.hashtag_id
+            ).filter(VideoHashtag.video_id.in_(stored_ids))
+            for link, name in rows:
+                current_links.setdefault(link.video_id, {})[name] = link
+
+        for video in deleted:
+            for link in current_links.get(video.id, {}).values():
+                deltas[link.hashtag_id] = deltas.get(link.hashtag_id, 0) - 1
+
+        wanted = {video: _wanted_hashtags(video) for video in changed}
+        names = set().union(*wanted.values())
+        tags = {tag.name: tag for tag in session.query(Hashtag).filter(Hashtag.name.in_(names))} if names else {}
+        new_tags = {}
+
+        for video, video_names in wanted.items():
+            current = {} if video in session.new else current_links.get(video.id, {})
+
+            for name in set(current) - video_names:
+                session.delete(current[name])
+                deltas[current[name].hashtag_id] = deltas.get(current[name].hashtag_id, 0) - 1
+
+            for name in video_names - set(current):
+                tag = tags.get(name)
+                if tag is None:
+                    tag = new_tags.get(name)
+                    if tag is None:
+                        tag = new_tags[name] = Hashtag(name=name, usage_count=0)
+                        session.add(tag)
+                session.add(VideoHashtag(video=video, hashtag=tag))
+                if tag.id is None:
+                    tag.usage_count += 1
+                else:
+                    deltas[tag.id] = deltas.get(tag.id, 0) + 1
+
+        deltas = {hashtag_id: delta for hashtag_id, delta in deltas.items() if delta}
+        if deltas:
+            for tag in session.query(Hashtag).filter(Hashtag.id.in_(deltas)):
+                tag.usage_count = Hashtag.usage_count + deltas[tag.id]
+
+
+def backfill_hashtags(batch_size=500):
+    """Build the hashtag index from the comma-separated Video.hashtags column"""
+    links = {}
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Video.id, Video.hashtags, Video.created_at)
+            .where(Video.id > last_id, Video.hashtags.isnot(None))
+            .order_by(Video.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        for video_id, hashtags, created_at in rows:
+            for name in {normalize_hashtag(tag) for tag in hashtags.split(',')}:
+                if name:
+                    links.setdefault(name, []).append((video_id, created_at))
+        last_id = rows[-1].id
+
+    if not links:
+        return 0
+
+    existing = dict(db.session.execute(select(Hashtag.name, Hashtag.id)).fetchall())
+    missing = [{'name': name, 'usage_count': 0, 'created_at': datetime.utcnow()} for name in links if name not in existing]
+    if missing:
+        db.session.execute(insert(Hashtag.__table__), missing)
+        existing = dict(db.session.execute(select(Hashtag.name, Hashtag.id)).fetchall())
+
+    db.session.execute(insert(VideoHashtag.__table__).prefix_with('OR IGNORE'), [
+        {'video_id': video_id, 'hashtag_id': existing[name], 'created_at': created_at}
+        for name, videos in links.items()
+        for video_id, created_at in videos
+    ])
+
+    # Recount rather than trust the inserts, which may have skipped duplicates
+    usage = select(func.count(VideoHashtag.id)).where(VideoHashtag.hashtag_id == Hashtag.id).scalar_subquery()
+    db.session.execute(
+        Hashtag.__table__.update().values(usage_count=usage)
+    )
+    return sum(len(videos) for videos in links.values())
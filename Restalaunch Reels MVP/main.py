@@ -5,16 +5,44 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
-from src.models.user import db
-from src.models.vendor import Vendor, MenuItem, Review
+from src.models.user import db, reconcile_follow_counts
+from src.models.db_setup import configure_database, init_read_engine
+from src.models.vendor import Vendor, MenuItem, Review, recompute_vendor_ratings
 from src.models.video import Video, Like, Comment, VideoMenuItem
+from src.models.hashtag import Hashtag, VideoHashtag
+from src.models.timeline import TimelineEntry, sync_fanout_modes
+from src.models.preference import UserPreference
+from src.models.feed_session import FeedSession
+from src.models.seen import UserSeenFilter
+from src.models.upload_session import UploadSession
+from src.models.media_job import MediaJob
+from src.models.migrations import run_migrations
+from src.services.ranking import refresh_rank_scores, start_rank_score_worker
+from src.services.discover import start_discover_worker
+from src.services.counters import counter_buffer
+from src.utils.passwords import password_hasher, DEFAULT_METHOD as DEFAULT_PASSWORD_HASH_METHOD
+from src.services.media_jobs import start_media_worker
+from src.utils.query_plans import check_query_plans
+from src.utils.metrics import init_metrics, request_metrics
+from src.utils.profiler import init_profiler
+from src.utils.response_cache import response_cache
+from src.services.recommendations import ranked_feed_cache
+from src.services.media_jobs import queue_depth
+import atexit
+import click
+import signal
+import threading
 
 # Import route blueprints
 from src.routes.user import user_bp
-from src.routes.auth import auth_bp
+from src.routes.auth import auth_bp, token_cache
 from src.routes.vendor import vendor_bp
 from src.routes.video import video_bp
 from src.routes.feed import feed_bp
+from src.routes.upload import upload_bp, purge_expired_uploads
+from src.routes.media import media_bp
+from src.routes.comments import comments_bp
+from src.routes.admin import admin_bp
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -27,16 +55,166 @@ app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(user_bp, url_prefix='/api/users')
 app.register_blueprint(vendor_bp, url_prefix='/api/vendors')
 app.register_blueprint(video_bp, url_prefix='/api/videos')
+app.register_blueprint(comments_bp, url_prefix='/api/videos')
 app.register_blueprint(feed_bp, url_prefix='/api/feed')
+app.register_blueprint(upload_bp, url_prefix='/api/uploads')
+app.register_blueprint(media_bp)
+app.register_blueprint(admin_bp, url_prefix='/api/admin')
 
 # Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+app.config['RANK_SCORE_REFRESH_SECONDS'] = int(os.environ.get('RANK_SCORE_REFRESH_SECONDS', 60))  # 0 disables the worker
+app.config['DISCOVER_REFRESH_SECONDS'] = int(os.environ.get('DISCOVER_REFRESH_SECONDS', 300))  # 0 disables the worker
+app.config['COUNTER_FLUSH_INTERVAL_MS'] = int(os.environ.get('COUNTER_FLUSH_INTERVAL_MS', 250))  # 0 writes counters directly
+app.config['COUNTER_SPILL_FOLDER'] = os.path.join(os.path.dirname(__file__), 'database', 'counter_spill')  # One spill file per worker
+app.config['UPLOAD_FOLDER'] = os.path.join(app.static_folder, 'uploads')
+app.config['UPLOAD_STAGING_FOLDER'] = os.path.join(os.path.dirname(__file__), 'database', 'upload_staging')
+app.config['UPLOAD_MAX_FILE_SIZE'] = 100 * 1024 * 1024  # Whole video, across all chunks
+app.config['UPLOAD_CHUNK_SIZE'] = 5 * 1024 * 1024  # Suggested to clients
+app.config['UPLOAD_MAX_CHUNK_SIZE'] = 16 * 1024 * 1024
+app.config['MEDIA_WORKERS'] = int(os.environ.get('MEDIA_WORKERS', 0))  # Jobs run at once inside each web process; 0 leaves them to `flask media-worker`
+app.config['MEDIA_QUEUE_MAX_DEPTH'] = int(os.environ.get('MEDIA_QUEUE_MAX_DEPTH', 500))  # Uploads are refused past this backlog; 0 disables
+app.config['MEDIA_JOB_MAX_ATTEMPTS'] = int(os.environ.get('MEDIA_JOB_MAX_ATTEMPTS', 5))
+app.config['MEDIA_JOB_TIMEOUT'] = int(os.environ.get('MEDIA_JOB_TIMEOUT', 600))  # Seconds per ffmpeg/ffprobe run
+app.config['MEDIA_RENDITION_HEIGHTS'] = [int(h) for h in os.environ.get('MEDIA_RENDITION_HEIGHTS', '').split(',') if h.strip()]  # e.g. 720,480
+app.config['FFMPEG_PATH'] = os.environ.get('FFMPEG_PATH', 'ffmpeg')
+app.config['FFPROBE_PATH'] = os.environ.get('FFPROBE_PATH', 'ffprobe')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 0))  # Per process; 0 splits half the CPUs across WEB_CONCURRENCY processes
+app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', -1))  # Waiting hashes before 503s; -1 is 4 per worker
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', DEFAULT_PASSWORD_HASH_METHOD)  # Older hashes are upgraded on login
+app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', 500))  # Log slower requests with their SQL; 0 disables
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # Bearer token for /metrics; unset hides the endpoint
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(os.path.dirname(__file__), 'database', 'metrics'))  # Where workers share /metrics data; empty keeps it per process
+app.config['RESPONSE_CACHE_INVALIDATION_LOG'] = os.environ.get('RESPONSE_CACHE_INVALIDATION_LOG', os.path.join(os.path.dirname(__file__), 'database', 'response_cache_invalidations.log'))  # Tells other workers which cached feeds to drop; empty leaves them to the TTL
+app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')  # Enables /api/admin; sent as X-Admin-Token
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'database', 'profiles'))
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+app.config['DB_READ_POOL_SIZE'] = int(os.environ.get('DB_READ_POOL_SIZE', 0))  # 0 sends reads to the main pool
 
+configure_database(app)
 db.init_app(app)
-with app.app_context():
-    db.create_all()
+password_hasher.configure(
+    workers=app.config['PASSWORD_HASH_WORKERS'] or None,
+    queue_size=app.config['PASSWORD_HASH_QUEUE'] if app.config['PASSWORD_HASH_QUEUE'] >= 0 else None,
+    method=app.config['PASSWORD_HASH_METHOD'],
+    processes=int(os.environ.get('WEB_CONCURRENCY', 1))
+)
+init_read_engine(app)
+response_cache.configure(app.config['RESPONSE_CACHE_INVALIDATION_LOG'])
+init_metrics(app)
+init_profiler(app)
+
+_services = {}
+
+request_metrics.register_source('counters', counter_buffer.stats)
+request_metrics.register_source('token_cache', token_cache.stats)
+request_metrics.register_source('response_cache', response_cache.stats)
+request_metrics.register_source('ranked_feed_cache', ranked_feed_cache.stats)
+request_metrics.register_source('password_hasher', password_hasher.stats)
+request_metrics.register_source('db_pool', lambda: {
+    'size': db.engine.pool.size(),
+    'checked_out': db.engine.pool.checkedout(),
+    'overflow': db.engine.pool.overflow()
+})
+request_metrics.register_source('media_queue', lambda: {
+    'depth': queue_depth(),
+    **(_services['media_jobs'].stats() if 'media_jobs' in _services else {})
+})
+
+def init_database():
+    """Create tables and apply migrations. Run once per deployment, not per worker."""
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+
+def start_background_services():
+    """Start this process's background jobs. Call once in every serving process."""
+    if _services:
+        return
+    if app.config['RANK_SCORE_REFRESH_SECONDS'] > 0:
+        _services['rank_scores'] = start_rank_score_worker(app, app.config['RANK_SCORE_REFRESH_SECONDS'])
+    if app.config['DISCOVER_REFRESH_SECONDS'] > 0:
+        _services['discover'] = start_discover_worker(app, app.config['DISCOVER_REFRESH_SECONDS'])
+    if app.config['COUNTER_FLUSH_INTERVAL_MS'] > 0:
+        counter_buffer.start(app, app.config['COUNTER_FLUSH_INTERVAL_MS'] / 1000.0, app.config['COUNTER_SPILL_FOLDER'])
+        _services['counters'] = counter_buffer
+    if app.config['MEDIA_WORKERS'] > 0:
+        _services['media_jobs'] = start_media_worker(app, app.config['MEDIA_WORKERS'])
+    if app.config['METRICS_DIR']:
+        _services['metrics'] = request_metrics.start(app, app.config['METRICS_DIR'])
+    if _services:
+        atexit.register(stop_background_services)
+
+def stop_background_services():
+    """Stop background jobs and flush buffered counters"""
+    for name, service in list(_services.items()):
+        service.stop()
+        del _services[name]
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables and apply pending migrations"""
+    init_database()
+    print('Database initialized')
+
+@app.cli.command('recompute-rank-scores')
+def recompute_rank_scores_command():
+    """Recompute Video.rank_score for every video"""
+    changed = refresh_rank_scores()
+    db.session.commit()
+    print(f'Updated rank_score for {changed} videos')
+
+@app.cli.command('reconcile-follow-counts')
+def reconcile_follow_counts_command():
+    """Repair drifted follower/following counters and re-apply the timeline fan-out limits"""
+    repaired = reconcile_follow_counts()
+    switched = sync_fanout_modes()
+    db.session.commit()
+    print(f'Repaired follow counters for {repaired} users; {switched} creators switched timeline fan-out mode')
+
+@app.cli.command('recompute-vendor-ratings')
+def recompute_vendor_ratings_command():
+    """Repair drifted vendor rating averages, counts and star histograms"""
+    repaired = recompute_vendor_ratings()
+    db.session.commit()
+    print(f'Repaired rating aggregates for {repaired} vendors')
+
+@app.cli.command('purge-uploads')
+def purge_uploads_command():
+    """Delete expired, unfinished upload sessions and their partial files"""
+    purged = purge_expired_uploads()
+    print(f'Purged {purged} expired uploads')
+
+@app.cli.command('media-worker')
+@click.option('--concurrency', type=int, default=None, help='Jobs run at once (default: one per CPU)')
+def media_worker_command(concurrency):
+    """Process queued thumbnail, metadata and transcode jobs until stopped"""
+    worker = start_media_worker(app, concurrency)
+    print(f'Media worker {worker.worker_id} running {worker.concurrency} jobs at a time')
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stopping.set())
+    stopping.wait()
+    print('Stopping; waiting for running jobs')
+    worker.stop()
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if any feed or auth query falls back to a full table scan"""
+    failures = check_query_plans(app)
+    for label, table, statement, plan in failures:
+        print(f'[{label}] full scan of {table}:')
+        print(f'    {statement}')
+        for line in plan:
+            print(f'    -> {line}')
+    if failures:
+        sys.exit(1)
+    print('No unexpected table scans')
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -67,5 +245,16 @@ def internal_error(e):
     return {"error": "Internal server error"}, 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    debug = os.environ.get('FLASK_DEBUG', '0') == '1'
+    init_database()
+    # With the reloader on, only the child process serves requests
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+    app.run(
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', 5000)),
+        debug=debug,
+        threaded=True
+    )
 
@@ -0,0 +1,91 @@
+from flask import Blueprint, current_app, send_file, abort, jsonify
+from src.models.user import db
+from src.models.video import Video
+from src.models.media_job import MediaJob
+from src.models.db_setup import read_only
+from src.routes.auth import token_required
+from werkzeug.security import safe_join
+import os
+import re
+import stat
+
+media_bp = Blueprint('media', __name__)
+
+MEDIA_TYPES = {
+    'mp4': 'video/mp4',
+    'm4v': 'video/mp4',
+    'mov': 'video/quicktime',
+    'webm': 'video/webm',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'webp': 'image/webp',
+}
+
+# Uploads are stored as <sha256>.<ext>, so a name never changes content
+CONTENT_ADDRESSED = re.compile(r'^(?:.*/)?([0-9a-f]{64})\.\w+$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+@media_bp.route('/uploads/<path:filename>', methods=['GET', 'HEAD'])
+def serve_media(filename):
+    """
+    Serve uploaded media with Range/206 support for seeking, conditional
+    requests and long-lived caching. The file body is handed to the server's
+    wsgi.file_wrapper, which gunicorn sends with sendfile().
+    """
+    path = safe_join(current_app.config['UPLOAD_FOLDER'], filename)
+    if path is None:
+        abort(404)
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        abort(404)
+    if not stat.S_ISREG(file_stat.st_mode):
+        abort(404)
+    
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    content_addressed = CONTENT_ADDRESSED.match(filename)
+    
+    response = send_file(
+        path,
+        mimetype=MEDIA_TYPES.get(extension),
+        conditional=True,
+        etag=content_addressed.group(1) if content_addressed else True,
+        last_modified=file_stat.st_mtime,
+        max_age=IMMUTABLE_MAX_AGE if content_addressed else 3600
+    )
+    response.headers['Accept-Ranges'] = 'bytes'
+    if content_addressed:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
+@media_bp.route('/api/media/videos/<int:video_id>/jobs', methods=['GET'])
+@read_only
+@token_required
+def get_media_jobs(current_user, video_id):
+    """Processing status of the creator's own video"""
+    try:
+        video = db.session.get(Video, video_id)
+        if video is None or video.user_id != current_user.id:
+            return jsonify({'error': 'Video not found'}), 404
+        
+        jobs = MediaJob.query.filter_by(video_id=video_id).order_by(MediaJob.id).all()
+        statuses = {job.status for job in jobs}
+        if not jobs:
+            status = 'none'
+        elif statuses & {'queued', 'running'}:
+            status = 'processing'
+        elif 'failed' in statuses:
+            status = 'failed'
+        else:
+            status = 'done'
+        
+        return jsonify({
+            'video_id': video_id,
+            'status': status,
+            'jobs': [job.to_dict() for job in jobs]
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
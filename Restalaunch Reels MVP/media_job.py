@@ -0,0 +1,97 @@
+from src.models.user import db
+from src.models.video import Video
+from flask import current_app, has_app_context
+from sqlalchemy import event, text
+from datetime import datetime
+import json
+
+MEDIA_JOB_KINDS = ('probe', 'thumbnail', 'transcode')
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+class MediaJob(db.Model):
+    """A unit of background media work for one video, run by the media worker"""
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # probe, thumbnail, transcode
+    options = db.Column(db.Text, nullable=True)  # JSON, e.g. {"height": 480} for transcode
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=DEFAULT_MAX_ATTEMPTS, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # Not picked up before this
+    locked_by = db.Column(db.String(64), nullable=True)  # Worker that claimed the job
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_media_job_status_run_after', 'status', 'run_after'),
+        db.Index('ix_media_job_video', 'video_id'),
+    )
+
+    def __repr__(self):
+        return f'<MediaJob {self.id} {self.kind} video:{self.video_id} {self.status}>'
+
+    def get_options(self):
+        return json.loads(self.options) if self.options else {}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'video_id': self.video_id,
+            'kind': self.kind,
+            'options': self.get_options(),
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'last_error': self.last_error,
+            'result': json.loads(self.result) if self.result else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+def _max_attempts():
+    if has_app_context():
+        return current_app.config.get('MEDIA_JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    return DEFAULT_MAX_ATTEMPTS
+
+
+def is_uploaded_media(video_url):
+    """Only files stored by the upload endpoint can be processed locally"""
+    return bool(video_url) and video_url.startswith('/uploads/')
+
+
+@event.listens_for(Video, 'after_insert')
+def _enqueue_media_jobs(mapper, connection, target):
+    if not is_uploaded_media(target.video_url):
+        return
+    kinds = ['probe'] if target.thumbnail_url else ['probe', 'thumbnail']
+    # Transcodes are queued by the probe, once the source height is known
+    connection.execute(MediaJob.__table__.insert(), [
+        {'video_id': target.id, 'kind': kind, 'max_attempts': _max_attempts()}
+        for kind in kinds
+    ])
+
+
+_BACKFILL_JOBS = (
+    'INSERT INTO media_job (video_id, kind, status, attempts, max_attempts, run_after, created_at, updated_at) '
+    "SELECT id, :kind, 'queued', 0, :max_attempts, :now, :now, :now FROM video "
+    "WHERE video_url LIKE '/uploads/%' AND {condition} "
+    'AND NOT EXISTS (SELECT 1 FROM media_job WHERE media_job.video_id = video.id AND media_job.kind = :kind)'
+)
+
+
+def backfill_media_jobs():
+    """Queue processing for uploaded videos that were never probed or thumbnailed"""
+    now = datetime.utcnow()
+    queued = 0
+    for kind, condition in (('probe', 'duration IS NULL'), ('thumbnail', 'thumbnail_url IS NULL')):
+        queued += db.session.execute(
+            text(_BACKFILL_JOBS.format(condition=condition)),
+            {'kind': kind, 'max_attempts': _max_attempts(), 'now': now}
+        ).rowcount
+    return queued
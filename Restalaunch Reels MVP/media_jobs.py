@@ -0,0 +1,374 @@
+"""
+Background processing of uploaded media.
+
+Uploading a video only stores the file; probing it for duration and size,
+grabbing a thumbnail and encoding smaller renditions take seconds each, so
+they are queued as MediaJob rows and run here instead of in the request.
+
+The queue lives in SQLite, so any number of processes can share it: a job is
+claimed with a conditional UPDATE that only one of them can win. Each claimed
+job runs ffprobe/ffmpeg as a subprocess, and at most `concurrency` of those
+run at once per dispatcher. Failed jobs are retried with exponential backoff;
+jobs whose worker died mid-run are put back once their lease expires.
+
+Run the dispatcher with `flask media-worker`, or inside each web process by
+setting MEDIA_WORKERS.
+"""
+from src.models.user import db
+from src.models.video import Video
+from src.models.media_job import MediaJob, is_uploaded_media
+from flask import current_app
+from sqlalchemy import select, update, func
+from werkzeug.security import safe_join
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+THUMBNAIL_WIDTH = 480
+STALE_CHECK_SECONDS = 60
+
+
+class PermanentMediaError(Exception):
+    """A job failure that retrying cannot fix"""
+
+
+def queue_depth():
+    """Jobs waiting or running, across all workers"""
+    return db.session.execute(
+        select(func.count()).select_from(MediaJob).where(MediaJob.status.in_(('queued', 'running')))
+    ).scalar()
+
+
+def queue_is_full():
+    max_depth = current_app.config['MEDIA_QUEUE_MAX_DEPTH']
+    return max_depth > 0 and queue_depth() >= max_depth
+
+
+def claim_jobs(worker_id, limit):
+    """
+    Claim up to `limit` due jobs for this worker. The UPDATE only matches a
+    job that is still queued, so a job raced for by two workers goes to one.
+    """
+    now = datetime.utcnow()
+    candidates = db.session.execute(
+        select(MediaJob.id).where(
+            MediaJob.status == 'queued',
+            MediaJob.run_after <= now
+        ).order_by(MediaJob.run_after, MediaJob.id).limit(limit * 2)
+    ).scalars().all()
+
+    claimed = []
+    for job_id in candidates:
+        if len(claimed) == limit:
+            break
+        won = db.session.execute(
+            update(MediaJob).where(
+                MediaJob.id == job_id,
+                MediaJob.status == 'queued'
+            ).values(
+                status='running',
+                attempts=MediaJob.attempts + 1,
+                locked_by=worker_id,
+                locked_at=now,
+                updated_at=now
+            )
+        ).rowcount
+        if won:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def requeue_stale_jobs(lease_seconds):
+    """Release jobs held by workers that stopped without finishing them"""
+    now = datetime.utcnow()
+    stale = MediaJob.status == 'running', MediaJob.locked_at < now - timedelta(seconds=lease_seconds)
+    failed = db.session.execute(
+        update(MediaJob).where(*stale, MediaJob.attempts >= MediaJob.max_attempts).values(
+            status='failed', locked_by=None, locked_at=None,
+            last_error='Worker lease expired', updated_at=now
+        )
+    ).rowcount
+    requeued = db.session.execute(
+        update(MediaJob).where(*stale).values(
+            status='queued', locked_by=None, locked_at=None, run_after=now,
+            last_error='Worker lease expired', updated_at=now
+        )
+    ).rowcount
+    db.session.commit()
+    return requeued + failed
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS)
+
+
+def _run(command, timeout):
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=timeout, check=False)
+    except FileNotFoundError:
+        raise RuntimeError(f'{command[0]} is not installed')
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f'{os.path.basename(command[0])} timed out after {timeout}s')
+    if result.returncode != 0:
+        message = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise RuntimeError(f'{os.path.basename(command[0])} failed: {message[-1] if message else result.returncode}')
+    return result.stdout
+
+
+def _write_atomically(destination, produce):
+    """Let produce() write a temporary file, then move it into place"""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    root, extension = os.path.splitext(destination)
+    tmp_path = f'{root}.tmp-{os.getpid()}-{threading.get_ident()}{extension}'
+    try:
+        produce(tmp_path)
+        os.replace(tmp_path, destination)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def probe_media(source, config):
+    """Duration, dimensions and size of a video file"""
+    output = _run([
+        config['FFPROBE_PATH'], '-v', 'error', '-print_format', 'json',
+        '-show_format', '-show_streams', source
+    ], config['MEDIA_JOB_TIMEOUT'])
+    info = json.loads(output or b'{}')
+    stream = next((s for s in info.get('streams', []) if s.get('codec_type') == 'video'), None)
+    if stream is None:
+        raise PermanentMediaError('File has no video stream')
+
+    width, height = stream.get('width'), stream.get('height')
+    rotation = stream.get('tags', {}).get('rotate') or next(
+        (d.get('rotation') for d in stream.get('side_data_list', []) if 'rotation' in d), 0
+    )
+    if abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+    duration = info.get('format', {}).get('duration') or stream.get('duration')
+    return {
+        'duration': round(float(duration)) if duration else None,
+        'width': width,
+        'height': height,
+        'file_size': os.path.getsize(source),
+    }
+
+
+def make_thumbnail(source, destination, config):
+    # The thumbnail filter picks a representative frame from the first ones
+    _write_atomically(destination, lambda path: _run([
+        config['FFMPEG_PATH'], '-y', '-v', 'error', '-i', source,
+        '-vf', f'thumbnail,scale={THUMBNAIL_WIDTH}:-2', '-frames:v', '1', '-q:v', '3', path
+    ], config['MEDIA_JOB_TIMEOUT']))
+
+
+def transcode(source, destination, height, config):
+    _write_atomically(destination, lambda path: _run([
+        config['FFMPEG_PATH'], '-y', '-v', 'error', '-i', source,
+        '-vf', f'scale=-2:{height}', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+        '-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart', path
+    ], config['MEDIA_JOB_TIMEOUT']))
+
+
+def _output_name(video_url):
+    """Outputs are named after the source, which is itself content-addressed"""
+    return os.path.splitext(os.path.basename(video_url))[0]
+
+
+def _process(job, video, config):
+    """Run one job and return (result, video column updates)"""
+    upload_folder = config['UPLOAD_FOLDER']
+    source = safe_join(upload_folder, video.video_url[len('/uploads/'):])
+    if source is None or not os.path.isfile(source):
+        raise PermanentMediaError('Source file is missing')
+    name = _output_name(video.video_url)
+
+    if job.kind == 'probe':
+        metadata = probe_media(source, config)
+        return metadata, {field: value for field, value in metadata.items() if value is not None}
+
+    if job.kind == 'thumbnail':
+        make_thumbnail(source, os.path.join(upload_folder, 'thumbnails', f'{name}.jpg'), config)
+        url = f'/uploads/thumbnails/{name}.jpg'
+        return {'thumbnail_url': url}, {'thumbnail_url': url}
+
+    if job.kind == 'transcode':
+        height = job.get_options()['height']
+        transcode(source, os.path.join(upload_folder, 'renditions', f'{name}_{height}p.mp4'), height, config)
+        return {'height': height, 'url': f'/uploads/renditions/{name}_{height}p.mp4'}, {}
+
+    raise PermanentMediaError(f'Unknown job kind: {job.kind}')
+
+
+def _queue_renditions(video_id, source_height):
+    """After a probe, queue a transcode for each configured height below the source"""
+    heights = [h for h in current_app.config['MEDIA_RENDITION_HEIGHTS'] if source_height and h < source_height]
+    for height in heights:
+        db.session.add(MediaJob(
+            video_id=video_id,
+            kind='transcode',
+            options=json.dumps({'height': height}),
+            max_attempts=current_app.config['MEDIA_JOB_MAX_ATTEMPTS']
+        ))
+    return heights
+
+
+def _finish(job_id, worker_id, result, video_updates):
+    job = db.session.get(MediaJob, job_id)
+    if job is None or job.locked_by != worker_id:
+        return  # Deleted with its video, or the lease was taken over
+
+    if video_updates:
+        table = Video.__table__
+        statement = update(table).where(table.c.id == job.video_id)
+        if 'thumbnail_url' in video_updates:
+            # Never replace a thumbnail the creator chose
+            statement = statement.where(table.c.thumbnail_url.is_(None))
+        db.session.execute(statement.values(**video_updates))
+    if job.kind == 'probe':
+        _queue_renditions(job.video_id, result.get('height'))
+
+    job.status = 'done'
+    job.result = json.dumps(result)
+    job.last_error = None
+    job.locked_by = None
+    job.locked_at = None
+    db.session.commit()
+
+
+def _fail(job_id, worker_id, error, permanent):
+    job = db.session.get(MediaJob, job_id)
+    if job is None or job.locked_by != worker_id:
+        return
+    job.last_error = str(error)[:1000]
+    job.locked_by = None
+    job.locked_at = None
+    if permanent or job.attempts >= job.max_attempts:
+        job.status = 'failed'
+    else:
+        job.status = 'queued'
+        job.run_after = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+    db.session.commit()
+
+
+def run_job(job_id, worker_id):
+    """
+    Process one claimed job and return whether it succeeded. Must be called
+    inside an app context.
+    """
+    job = db.session.get(MediaJob, job_id)
+    video = db.session.get(Video, job.video_id) if job else None
+    if job is None or video is None:
+        return False
+    if not is_uploaded_media(video.video_url):
+        _fail(job_id, worker_id, 'Video is not an uploaded file', permanent=True)
+        return False
+    config = current_app.config
+    # Hold no transaction while ffmpeg runs
+    db.session.close()
+
+    try:
+        result, video_updates = _process(job, video, config)
+    except Exception as e:
+        permanent = isinstance(e, PermanentMediaError)
+        if not permanent and not isinstance(e, RuntimeError):
+            logger.exception('Media job %s failed', job_id)
+        _fail(job_id, worker_id, e, permanent)
+        return False
+    _finish(job_id, worker_id, result, video_updates)
+    return True
+
+
+class MediaJobDispatcher(threading.Thread):
+    """Claims due jobs and runs up to `concurrency` of them at a time"""
+
+    def __init__(self, app, concurrency=None, poll_interval=1.0):
+        super().__init__(name='media-job-dispatcher', daemon=True)
+        self.app = app
+        self.concurrency = concurrency or os.cpu_count() or 1
+        self.poll_interval = poll_interval
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{id(self):x}'
+        self.lease_seconds = app.config['MEDIA_JOB_TIMEOUT'] + STALE_CHECK_SECONDS
+        self._stop_event = threading.Event()
+
+        # Metrics
+        self.completed = 0
+        self.failed = 0
+
+    def _run_job(self, job_id):
+        with self.app.app_context():
+            try:
+                return run_job(job_id, self.worker_id)
+            except Exception:
+                db.session.rollback()
+                logger.exception('Media job %s could not be recorded', job_id)
+                raise
+            finally:
+                db.session.remove()
+
+    def _job_done(self, future):
+        if future.exception() is None and future.result():
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    def run(self):
+        in_flight = set()
+        last_stale_check = 0
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='media-job') as executor:
+            while not self._stop_event.is_set():
+                try:
+                    with self.app.app_context():
+                        try:
+                            if time.monotonic() - last_stale_check >= STALE_CHECK_SECONDS:
+                                requeue_stale_jobs(self.lease_seconds)
+                                last_stale_check = time.monotonic()
+                            free = self.concurrency - len(in_flight)
+                            claimed = claim_jobs(self.worker_id, free) if free else []
+                        finally:
+                            db.session.remove()
+                except Exception:
+                    logger.exception('Claiming media jobs failed')
+                    claimed = []
+
+                for job_id in claimed:
+                    future = executor.submit(self._run_job, job_id)
+                    future.add_done_callback(self._job_done)
+                    in_flight.add(future)
+
+                if in_flight and not claimed:
+                    _, in_flight = wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                elif not claimed:
+                    self._stop_event.wait(self.poll_interval)
+                in_flight = {future for future in in_flight if not future.done()}
+
+    def stop(self):
+        """Stop claiming jobs and wait for the running ones to finish"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def stats(self):
+        return {
+            'worker_id': self.worker_id,
+            'concurrency': self.concurrency,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+
+def start_media_worker(app, concurrency=None):
+    worker = MediaJobDispatcher(app, concurrency)
+    worker.start()
+    return worker
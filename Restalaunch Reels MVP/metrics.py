@@ -0,0 +1,375 @@
+"""
+Per-request performance instrumentation.
+
+Every request records its latency, the number of SQL statements it ran, the
+time spent in them and the response size, aggregated per endpoint into
+histograms that /metrics serves in the Prometheus text format. Each response
+also carries a Server-Timing header (db, app and total time) so the split is
+visible in browser dev tools, and requests slower than SLOW_REQUEST_MS are
+logged together with their slowest statements.
+
+SQL is timed with engine cursor events, so statements run by to_dict() chains
+and lazy loads are counted along with explicit queries. Statements outside a
+request (background workers) are not recorded.
+
+Under gunicorn every worker process keeps its own aggregates and a background
+thread writes them to METRICS_DIR as <pid>.json every second. /metrics, whichever
+worker serves it, sums the histograms of all workers (including workers that
+have exited, whose totals are folded into archive.json) and lists each live
+worker's gauges labelled with its pid. /metrics answers 404 unless
+METRICS_TOKEN is set, and then requires it as a bearer token.
+"""
+from flask import request, g, has_request_context, current_app, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from bisect import bisect_left
+import fcntl
+import hmac
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+MAX_STATEMENTS_PER_REQUEST = 200  # Kept for the slow-request log
+SLOW_LOG_STATEMENTS = 5
+SLOW_LOG_SQL_LENGTH = 500
+SNAPSHOT_INTERVAL = 1.0  # Seconds between writes of this process's aggregates
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, state):
+        counts, total, count = state
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+
+    def state(self):
+        return [self.counts, self.sum, self.count]
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {self.sum}')
+        lines.append(f'{name}_count{_labels(labels)} {self.count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    pairs = {**labels, **extra}
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs.items()) + '}'
+
+
+HISTOGRAMS = (
+    ('latency', 'restalaunch_request_duration_seconds', 'Request latency', LATENCY_BUCKETS),
+    ('queries', 'restalaunch_request_queries', 'SQL statements per request', QUERY_COUNT_BUCKETS),
+    ('db_time', 'restalaunch_request_db_seconds', 'Time spent in SQL per request', LATENCY_BUCKETS),
+    ('size', 'restalaunch_response_size_bytes', 'Response body size', SIZE_BUCKETS),
+)
+
+
+def _new_series():
+    return {field: Histogram(buckets) for field, _, _, buckets in HISTOGRAMS}
+
+
+def _merge_series(target, series):
+    """Add [[endpoint, method, status, {field: state}], ...] into {key: histograms}"""
+    for endpoint, method, status, states in series:
+        histograms = target.setdefault((endpoint, method, status), _new_series())
+        for field, state in states.items():
+            histograms[field].merge(state)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # Removed or archived meanwhile
+
+
+class RequestMetrics:
+    """
+    Per-endpoint aggregates, shared by all request threads in the process and,
+    through snapshot files in `directory`, with the other worker processes
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._series = {}  # (endpoint, method, status) -> histograms
+        self._sources = {}
+        self.started_at = time.time()
+        self.pid = os.getpid()
+        self.directory = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def configure(self, directory):
+        """Share aggregates through `directory`, folding in those of exited processes"""
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.archive_exited()
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.directory, f'{pid}.json')
+
+    def record(self, endpoint, method, status, duration, query_count, db_time, size):
+        key = (endpoint, method, str(status))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _new_series()
+            series['latency'].observe(duration)
+            series['queries'].observe(query_count)
+            series['db_time'].observe(db_time)
+            if size is not None:
+                series['size'].observe(size)
+
+    def _series_state(self):
+        with self._lock:
+            return [
+                [endpoint, method, status, {field: histogram.state() for field, histogram in histograms.items()}]
+                for (endpoint, method, status), histograms in self._series.items()
+            ]
+
+    def _gauges(self):
+        gauges = {}
+        for source, stats in sorted(self._sources.items()):
+            try:
+                values = stats()
+            except Exception:
+                logger.exception('Metrics source %s failed', source)
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)):
+                    gauges[re.sub(r'[^a-zA-Z0-9_]', '_', f'restalaunch_{source}_{key}')] = float(value)
+        return gauges
+
+    def write_snapshot(self, gauges=True):
+        """Write this process's aggregates for the other workers"""
+        with self._write_lock:
+            _write_json(self._snapshot_path(self.pid), {
+                'pid': self.pid,
+                'started_at': self.started_at,
+                'series': self._series_state(),
+                'gauges': self._gauges() if gauges else {},
+            })
+
+    def _run(self, app):
+        while not self._stop_event.wait(SNAPSHOT_INTERVAL):
+            try:
+                with app.app_context():
+                    self.write_snapshot()
+            except Exception:
+                logger.exception('Could not write metrics snapshot')
+
+    def start(self, app, directory):
+        """Share this process's aggregates through `directory` until stop()"""
+        self.pid = os.getpid()
+        self.configure(directory)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name='metrics-snapshot', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Leave this process's final totals for the archive"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        if self._series:
+            self.write_snapshot(gauges=False)
+
+    def archive_exited(self):
+        """Fold the snapshots of exited processes into archive.json, so their totals are kept"""
+        with open(os.path.join(self.directory, 'archive.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, 'archive.json')
+            archived = {}
+            _merge_series(archived, (_read_json(archive_path) or {}).get('series', []))
+            exited = []
+            for name in os.listdir(self.directory):
+                pid, extension = os.path.splitext(name)
+                if extension != '.json' or not pid.isdigit():
+                    continue
+                # A file under our own pid was left by an earlier process
+                if int(pid) == self.pid or not _pid_alive(int(pid)):
+                    snapshot = _read_json(os.path.join(self.directory, name))
+                    if snapshot is not None:
+                        _merge_series(archived, snapshot['series'])
+                    exited.append(name)
+            if not exited:
+                return
+            _write_json(archive_path, {'series': [
+                [*key, {field: histogram.state() for field, histogram in histograms.items()}]
+                for key, histograms in archived.items()
+            ]})
+            for name in exited:
+                os.remove(os.path.join(self.directory, name))
+
+    def register_source(self, name, stats):
+        """Export the numeric values of stats() as gauges named restalaunch_<name>_<key>"""
+        self._sources[name] = stats
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def _collect(self):
+        """Return (series summed over all processes, [(pid, started_at, gauges)] of live ones)"""
+        series = {}
+        _merge_series(series, self._series_state())
+        processes = [(self.pid, self.started_at, self._gauges())]
+        if self.directory:
+            for name in sorted(os.listdir(self.directory)):
+                key, extension = os.path.splitext(name)
+                if extension != '.json' or key == str(self.pid):
+                    continue
+                snapshot = _read_json(os.path.join(self.directory, name))
+                if snapshot is None:
+                    continue
+                _merge_series(series, snapshot['series'])
+                if 'pid' in snapshot and _pid_alive(snapshot['pid']):
+                    processes.append((snapshot['pid'], snapshot['started_at'], snapshot['gauges']))
+        return series, processes
+
+    def render(self):
+        series, processes = self._collect()
+        series = sorted(series.items())
+        lines = []
+        for field, name, description, _ in HISTOGRAMS:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for (endpoint, method, status), histogram_set in series:
+                labels = {'endpoint': endpoint, 'method': method, 'status': status}
+                lines.extend(histogram_set[field].render(name, labels))
+
+        lines.append('# TYPE restalaunch_process_start_time_seconds gauge')
+        for pid, started_at, _ in processes:
+            lines.append(f'restalaunch_process_start_time_seconds{_labels({"pid": pid})} {started_at}')
+        names = sorted({name for _, _, gauges in processes for name in gauges})
+        for name in names:
+            lines.append(f'# TYPE {name} gauge')
+            for pid, _, gauges in processes:
+                if name in gauges:
+                    lines.append(f'{name}{_labels({"pid": pid})} {gauges[name]}')
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_started' in g:
+        context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is None or not has_request_context() or 'metrics_started' not in g:
+        return
+    elapsed = time.perf_counter() - started
+    g.metrics_query_count += 1
+    g.metrics_db_time += elapsed
+    if len(g.metrics_statements) < MAX_STATEMENTS_PER_REQUEST:
+        g.metrics_statements.append((elapsed, statement))
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_query_count = 0
+    g.metrics_db_time = 0.0
+    g.metrics_statements = []
+
+
+def _after_request(response):
+    if 'metrics_started' not in g:
+        return response
+    duration = time.perf_counter() - g.metrics_started
+    endpoint = request.endpoint or 'unmatched'
+    db_time = g.metrics_db_time
+
+    request_metrics.record(
+        endpoint, request.method, response.status_code, duration,
+        g.metrics_query_count, db_time, response.calculate_content_length()
+    )
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={db_time * 1000:.1f};desc="{g.metrics_query_count} queries", '
+        f'app;dur={(duration - db_time) * 1000:.1f}, total;dur={duration * 1000:.1f}'
+    )
+
+    slow_ms = current_app.config['SLOW_REQUEST_MS']
+    if slow_ms and duration * 1000 >= slow_ms:
+        slowest = sorted(g.metrics_statements, key=lambda item: item[0], reverse=True)[:SLOW_LOG_STATEMENTS]
+        logger.warning(
+            'Slow request %s %s -> %s in %.0fms (%d queries, %.0fms in SQL)%s',
+            request.method, request.full_path.rstrip('?'), response.status_code, duration * 1000,
+            g.metrics_query_count, db_time * 1000,
+            ''.join(f'\n    {elapsed * 1000:.1f}ms  {" ".join(statement.split())[:SLOW_LOG_SQL_LENGTH]}' for elapsed, statement in slowest)
+        )
+    return response
+
+
+def _metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return {'error': 'Not found'}, 404  # Not exposed without a token
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return {'error': 'Unauthorized'}, 401
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """Install the request hooks and the /metrics endpoint"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', _metrics_view, methods=['GET'])
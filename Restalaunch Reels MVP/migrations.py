@@ -0,0 +1,291 @@
+"""
+Lightweight schema migrations.
+
+db.create_all() only creates missing tables, so columns and indexes added to
+existing models are applied here. Each migration runs once and is recorded in
+the schema_migration table.
+"""
+from src.models.user import db
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.schema import CreateTable
+from datetime import datetime
+import os
+
+MIGRATIONS = []
+
+
+def migration(name):
+    """Register an upgrade function to run once, in declaration order"""
+    def decorator(f):
+        MIGRATIONS.append((name, f))
+        return f
+    return decorator
+
+
+def column_exists(table, column):
+    # table_xinfo also lists generated columns
+    rows = db.session.execute(text(f'PRAGMA table_xinfo("{table}")')).fetchall()
+    return any(row[1] == column for row in rows)
+
+
+def add_column(table, column, definition):
+    """Add a column unless create_all() already created it"""
+    if not column_exists(table, column):
+        db.session.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {definition}'))
+
+
+def create_index(name, table, columns):
+    db.session.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({columns})'))
+
+
+def foreign_key_actions_differ(table):
+    """True if an existing table's ON DELETE actions differ from its model's"""
+    rows = db.session.execute(text(f'PRAGMA foreign_key_list("{table.name}")')).fetchall()
+    if not rows:
+        return False  # No such table, or no foreign keys
+    actual = {(row[3], row[6].upper()) for row in rows}
+    expected = {(fk.parent.name, (fk.ondelete or 'NO ACTION').upper()) for fk in table.foreign_keys}
+    return actual != expected
+
+
+def rebuild_table(connection, table):
+    """
+    Recreate a table from its model's definition, keeping its rows, indexes
+    and triggers. This is SQLite's create-copy-drop-rename procedure for
+    changing constraints; foreign_keys must be off on `connection`.
+    """
+    preparer = connection.dialect.identifier_preparer
+    name = preparer.format_table(table)
+    rebuilt = preparer.quote(f'{table.name}_rebuild')
+
+    existing = {row[1] for row in connection.exec_driver_sql(f'PRAGMA table_info({name})')}
+    unknown = existing - set(table.columns.keys())
+    if unknown:
+        raise RuntimeError(f'{table.name} has columns its model lacks: {", ".join(sorted(unknown))}')
+    columns = ', '.join(preparer.quote(column.name) for column in table.columns if column.name in existing)
+    dependents = [row[0] for row in connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE tbl_name = :name AND type IN ('index', 'trigger') AND sql IS NOT NULL"),
+        {'name': table.name}
+    )]
+
+    ddl = str(CreateTable(table).compile(dialect=connection.dialect))
+    connection.exec_driver_sql(f'DROP TABLE IF EXISTS {rebuilt}')
+    connection.exec_driver_sql(ddl.replace(f'CREATE TABLE {name} (', f'CREATE TABLE {rebuilt} (', 1))
+    connection.exec_driver_sql(f'INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {name}')
+    connection.exec_driver_sql(f'DROP TABLE {name}')
+    connection.exec_driver_sql(f'ALTER TABLE {rebuilt} RENAME TO {name}')
+    for sql in dependents:
+        connection.exec_driver_sql(sql)
+
+
+def run_migrations():
+    """Apply pending migrations. Must be called inside an app context."""
+    db.session.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migration '
+        '(name VARCHAR(100) PRIMARY KEY, applied_at DATETIME NOT NULL)'
+    ))
+    applied = {row[0] for row in db.session.execute(text('SELECT name FROM schema_migration'))}
+
+    for name, upgrade in MIGRATIONS:
+        if name in applied:
+            continue
+        try:
+            upgrade()
+            db.session.execute(
+                text('INSERT INTO schema_migration (name, applied_at) VALUES (:name, :applied_at)'),
+                {'name': name, 'applied_at': datetime.utcnow()}
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+@migration('0001_video_rank_score')
+def add_video_rank_score():
+    from src.services.ranking import refresh_rank_scores
+
+    add_column('video', 'rank_score', 'FLOAT NOT NULL DEFAULT 0')
+    create_index('ix_video_active_rank', 'video', 'is_active, rank_score')
+    db.session.flush()
+    refresh_rank_scores()
+
+
+@migration('0002_user_follow_counters')
+def add_user_follow_counters():
+    from src.models.user import reconcile_follow_counts
+
+    add_column('user', 'follower_count', 'INTEGER NOT NULL DEFAULT 0')
+    add_column('user', 'following_count', 'INTEGER NOT NULL DEFAULT 0')
+    reconcile_follow_counts()
+
+
+@migration('0003_hashtag_index')
+def backfill_hashtag_index():
+    from src.models.hashtag import backfill_hashtags
+
+    # Tables come from create_all(); only the data needs building
+    backfill_hashtags()
+
+
+@migration('0004_search_index')
+def add_search_index():
+    from src.models.search_index import create_search_indexes
+
+    create_search_indexes()
+
+
+@migration('0005_spatial_index')
+def add_spatial_index():
+    from src.models.spatial import create_spatial_indexes
+
+    create_spatial_indexes()
+
+
+@migration('0006_counter_flush_log')
+def add_counter_flush_log():
+    # Single-row table; rebuilt with one row per worker by 0015
+    db.session.execute(text(
+        'CREATE TABLE IF NOT EXISTS counter_flush_log '
+        '(id INTEGER PRIMARY KEY CHECK (id = 1), batch_id VARCHAR(32) NOT NULL, flushed_at DATETIME)'
+    ))
+
+
+@migration('0007_following_timelines')
+def backfill_following_timelines():
+    # backfill_timelines() reads user.timeline_pulled_at, which only exists
+    # from 0014 on; 0014 runs the backfill instead
+    pass
+
+
+@migration('0008_user_preferences')
+def backfill_user_preferences():
+    from src.models.preference import backfill_preferences
+
+    backfill_preferences()
+
+
+@migration('0009_query_indexes')
+def add_query_indexes():
+    # Creates every index declared in the models' __table_args__ that an
+    # older database is missing
+    connection = db.session.connection()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+@migration('0010_media_jobs')
+def queue_existing_media_jobs():
+    from src.models.media_job import backfill_media_jobs
+
+    backfill_media_jobs()
+
+
+@migration('0011_vendor_rating_aggregates')
+def add_vendor_rating_aggregates():
+    from src.models.vendor import recompute_vendor_ratings
+
+    add_column('vendor', 'rating_sum', 'INTEGER NOT NULL DEFAULT 0')
+    for star in range(1, 6):
+        add_column('vendor', f'rating_{star}', 'INTEGER NOT NULL DEFAULT 0')
+    recompute_vendor_ratings()
+
+
+@migration('0012_comment_root_id')
+def add_comment_root_id():
+    add_column('comment', 'root_id', 'INTEGER')
+    db.session.execute(text(
+        'WITH RECURSIVE thread (id, root_id) AS ('
+        ' SELECT id, id FROM comment WHERE parent_id IS NULL'
+        ' UNION ALL'
+        ' SELECT comment.id, thread.root_id FROM comment JOIN thread ON comment.parent_id = thread.id'
+        ') '
+        'UPDATE comment SET root_id = (SELECT root_id FROM thread WHERE thread.id = comment.id) '
+        'WHERE parent_id IS NOT NULL'
+    ))
+    create_index('ix_comment_root_created', 'comment', 'root_id, created_at, id')
+
+
+@migration('0013_drop_video_hashtag_created_index')
+def drop_video_hashtag_created_index():
+    # Trending filters on Video.created_at now; nothing reads this index
+    db.session.execute(text('DROP INDEX IF EXISTS ix_video_hashtag_created_tag'))
+
+
+@migration('0014_timeline_fanout_mode')
+def add_timeline_fanout_mode():
+    from src.models.timeline import sync_fanout_modes, backfill_timelines
+
+    add_column('user', 'timeline_pulled_at', 'DATETIME')
+    sync_fanout_modes()
+    # Creators that fell back below the old limit never had their pulled videos pushed
+    backfill_timelines()
+
+
+@migration('0015_counter_flush_log_per_worker')
+def key_counter_flush_log_by_worker():
+    db.session.execute(text(
+        'CREATE TABLE counter_flush_log_new '
+        '(spill_key VARCHAR(64) PRIMARY KEY, batch_id VARCHAR(32) NOT NULL, flushed_at DATETIME)'
+    ))
+    db.session.execute(text(
+        "INSERT INTO counter_flush_log_new (spill_key, batch_id, flushed_at) "
+        "SELECT 'legacy', batch_id, flushed_at FROM counter_flush_log"
+    ))
+    db.session.execute(text('DROP TABLE counter_flush_log'))
+    db.session.execute(text('ALTER TABLE counter_flush_log_new RENAME TO counter_flush_log'))
+
+    # A spill left by the single shared file is replayed like a dead worker's
+    spill_folder = current_app.config.get('COUNTER_SPILL_FOLDER')
+    if spill_folder and os.path.exists(spill_folder + '.json'):
+        os.makedirs(spill_folder, exist_ok=True)
+        os.replace(spill_folder + '.json', os.path.join(spill_folder, 'legacy.json'))
+
+
+def _apply_delete_actions(connection, table):
+    """Apply a table's ON DELETE actions to rows whose parent row is already gone"""
+    actions = {row[0]: (row[3], row[6]) for row in connection.exec_driver_sql(f'PRAGMA foreign_key_list("{table}")')}
+    while True:
+        orphans = connection.exec_driver_sql(f'PRAGMA foreign_key_check("{table}")').fetchall()
+        if not orphans:
+            return
+        for _, rowid, _, fk_id in orphans:
+            column, action = actions[fk_id]
+            if action == 'SET NULL':
+                connection.exec_driver_sql(f'UPDATE "{table}" SET {column} = NULL WHERE rowid = ?', (rowid,))
+            else:
+                connection.exec_driver_sql(f'DELETE FROM "{table}" WHERE rowid = ?', (rowid,))
+
+
+@migration('0016_foreign_key_actions')
+def add_foreign_key_actions():
+    # Tables created before their models declared ON DELETE actions refuse
+    # deletes once foreign keys are enforced
+    tables = [table for table in db.Model.metadata.sorted_tables if foreign_key_actions_differ(table)]
+    if not tables:
+        return
+
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('PRAGMA foreign_keys = OFF')  # Ignored inside a transaction
+        try:
+            connection.exec_driver_sql('BEGIN')
+            for table in tables:
+                rebuild_table(connection, table)
+            for table in db.Model.metadata.sorted_tables:  # Parents first
+                _apply_delete_actions(connection, table.name)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+
+
+@migration('0017_video_cuisine_key')
+def add_video_cuisine_key():
+    from src.models.video import CUISINE_KEY_SQL
+
+    add_column('video', 'cuisine_key', f'VARCHAR(100) GENERATED ALWAYS AS ({CUISINE_KEY_SQL}) VIRTUAL')
+    create_index('ix_video_cuisine_key_active', 'video', 'cuisine_key, is_active')
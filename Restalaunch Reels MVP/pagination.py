@@ -0,0 +1,71 @@
+"""
+Keyset (cursor) pagination for feed endpoints.
+
+A cursor is an opaque, URL-safe token holding the sort key values of the last
+item on the previous page. The next page is fetched with a row-value
+comparison on those keys instead of OFFSET, and no COUNT(*) is issued, so
+deep pages cost the same as the first one.
+"""
+from sqlalchemy import tuple_, literal, DateTime
+from datetime import datetime
+import base64
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_keys):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+    if not isinstance(values, list) or len(values) != len(sort_keys):
+        raise InvalidCursor('Invalid cursor')
+
+    decoded = []
+    for key, value in zip(sort_keys, values):
+        if value is not None and isinstance(getattr(key, 'type', None), DateTime):
+            try:
+                value = datetime.fromisoformat(value)
+            except (ValueError, TypeError):
+                raise InvalidCursor('Invalid cursor')
+        decoded.append(value)
+    return decoded
+
+
+def keyset_paginate(query, sort_keys, per_page, cursor=None, descending=True):
+    """
+    Fetch one page of `query` ordered by `sort_keys` (the last key must be
+    unique, usually the primary key). Returns (items, next_cursor); the cursor
+    is None on the last page.
+    """
+    labels = [key.label(f'_sort_key_{i}') for i, key in enumerate(sort_keys)]
+    query = query.order_by(None).add_columns(*labels)
+
+    if cursor:
+        values = decode_cursor(cursor, sort_keys)
+        boundary = tuple_(*[literal(value, key.type) for key, value in zip(sort_keys, values)])
+        if descending:
+            query = query.filter(tuple_(*sort_keys) < boundary)
+        else:
+            query = query.filter(tuple_(*sort_keys) > boundary)
+
+    query = query.order_by(*[key.desc() if descending else key.asc() for key in sort_keys])
+    rows = query.limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1][1:])
+
+    return [row[0] for row in rows], next_cursor
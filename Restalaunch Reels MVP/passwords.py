@@ -0,0 +1,126 @@
+"""
+Password hashing on a bounded worker pool.
+
+Password hashes are deliberately slow (scrypt takes tens of milliseconds of
+CPU). Run inline, a burst of logins ties up every request thread and the feed
+stalls behind it. Hashing is instead handed to a small pool of threads;
+hashlib releases the GIL while it works, so the pool bounds how many cores
+hashing can take, and request threads wait without holding anything.
+
+The pool is per process. By default it gets half the host's CPUs divided by
+the number of worker processes (`processes`, from WEB_CONCURRENCY), so all
+workers together hash on at most half the cores.
+
+The pool accepts at most `workers + queue_size` hashes at a time. Past that,
+PasswordHasherBusy is raised immediately, and the auth routes turn it into a
+503 with Retry-After rather than letting requests pile up.
+
+Hashes made with older parameters are reported by verify() so the caller can
+store a fresh hash while it still has the plaintext.
+"""
+from werkzeug.security import generate_password_hash, check_password_hash
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import os
+import threading
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hashes are already running or waiting"""
+
+    def __init__(self, retry_after=1):
+        super().__init__('Password hashing is overloaded')
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    def __init__(self, workers=None, queue_size=None, method=DEFAULT_METHOD, timeout=10.0, processes=1):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()  # Counters are bumped from every request thread
+        self.configure(workers, queue_size, method, timeout, processes)
+
+        # Metrics
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def configure(self, workers=None, queue_size=None, method=DEFAULT_METHOD, timeout=10.0, processes=1):
+        """
+        Set pool limits. Takes effect for a pool that has not started yet.
+        `processes` is how many worker processes share this host's CPUs.
+        """
+        self.workers = workers or max((os.cpu_count() or 2) // 2 // max(processes, 1), 1)
+        self.queue_size = self.workers * 4 if queue_size is None else queue_size
+        self.method = method
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+        return self._executor
+
+    def _call(self, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self._count('rejected')
+            raise PasswordHasherBusy()
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # The slot is held until the hash actually finishes, even if we stop waiting
+        future.add_done_callback(lambda f: slots.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            self._count('rejected')
+            raise PasswordHasherBusy()
+        self._count('completed')
+        return result
+
+    def _count(self, metric):
+        with self._metrics_lock:
+            setattr(self, metric, getattr(self, metric) + 1)
+
+    def hash(self, password):
+        return self._call(generate_password_hash, password, self.method)
+
+    def rehash(self, password):
+        """Hash a password again with the current parameters, to replace an outdated hash"""
+        password_hash = self.hash(password)
+        self._count('rehashed')
+        return password_hash
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with different parameters than the current ones"""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def verify(self, password_hash, password):
+        """Return (matches, needs_rehash)"""
+        matches = self._call(check_password_hash, password_hash, password)
+        return matches, matches and self.needs_rehash(password_hash)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'rehashed': self.rehashed,
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,107 @@
+"""
+Per-user taste profiles for the personalized for-you feed.
+
+Each like bumps a weight for the liked video's cuisine and food category, so
+the feed reads a handful of profile rows instead of loading every video the
+user ever liked. Profiles are maintained by mapper events on Like.
+"""
+from src.models.user import db
+from src.models.video import Like
+from sqlalchemy import event, text
+from datetime import datetime
+
+PREFERENCE_KINDS = {
+    'cuisine': 'cuisine_type',
+    'category': 'food_category',
+}
+
+
+class UserPreference(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # cuisine, category
+    value = db.Column(db.String(100), nullable=False)
+    weight = db.Column(db.Integer, default=0, nullable=False)  # Number of liked videos
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'kind', 'value', name='unique_user_preference'),
+    )
+
+    def __repr__(self):
+        return f'<UserPreference user:{self.user_id} {self.kind}:{self.value}>'
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'value': self.value,
+            'weight': self.weight,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+def _upsert_statement(column):
+    return text(
+        f'INSERT INTO user_preference (user_id, kind, value, weight, updated_at) '
+        f'SELECT :user_id, :kind, {column}, 1, :now FROM video '
+        f'WHERE id = :video_id AND {column} IS NOT NULL '
+        f'ON CONFLICT (user_id, kind, value) DO UPDATE SET '
+        f'weight = weight + 1, updated_at = excluded.updated_at'
+    )
+
+
+def _decrement_statement(column):
+    return text(
+        f'UPDATE user_preference SET weight = weight - 1, updated_at = :now '
+        f'WHERE user_id = :user_id AND kind = :kind '
+        f'AND value = (SELECT {column} FROM video WHERE id = :video_id)'
+    )
+
+
+_UPSERTS = {kind: _upsert_statement(column) for kind, column in PREFERENCE_KINDS.items()}
+_DECREMENTS = {kind: _decrement_statement(column) for kind, column in PREFERENCE_KINDS.items()}
+_PRUNE = text('DELETE FROM user_preference WHERE user_id = :user_id AND weight <= 0')
+
+
+@event.listens_for(Like, 'after_insert')
+def _record_like(mapper, connection, target):
+    params = {'user_id': target.user_id, 'video_id': target.video_id, 'now': datetime.utcnow()}
+    for kind, statement in _UPSERTS.items():
+        connection.execute(statement, {**params, 'kind': kind})
+
+
+@event.listens_for(Like, 'after_delete')
+def _forget_like(mapper, connection, target):
+    params = {'user_id': target.user_id, 'video_id': target.video_id, 'now': datetime.utcnow()}
+    for kind, statement in _DECREMENTS.items():
+        connection.execute(statement, {**params, 'kind': kind})
+    connection.execute(_PRUNE, params)
+
+
+def get_preferences(user_id, limit=5):
+    """Return {kind: [(value, weight)]}, strongest first"""
+    rows = db.session.execute(text(
+        'SELECT kind, value, weight FROM ('
+        'SELECT kind, value, weight, ROW_NUMBER() OVER '
+        '(PARTITION BY kind ORDER BY weight DESC, value) AS position '
+        'FROM user_preference WHERE user_id = :user_id AND weight > 0'
+        ') WHERE position <= :limit ORDER BY kind, weight DESC, value'
+    ), {'user_id': user_id, 'limit': limit}).fetchall()
+
+    preferences = {kind: [] for kind in PREFERENCE_KINDS}
+    for kind, value, weight in rows:
+        preferences[kind].append((value, weight))
+    return preferences
+
+
+def backfill_preferences():
+    """Rebuild every profile from the like table. The caller commits."""
+    db.session.execute(text('DELETE FROM user_preference'))
+    for kind, column in PREFERENCE_KINDS.items():
+        db.session.execute(text(
+            f'INSERT INTO user_preference (user_id, kind, value, weight, updated_at) '
+            f'SELECT "like".user_id, :kind, video.{column}, count(*), :now '
+            f'FROM "like" JOIN video ON video.id = "like".video_id '
+            f'WHERE video.{column} IS NOT NULL '
+            f'GROUP BY "like".user_id, video.{column}'
+        ), {'kind': kind, 'now': datetime.utcnow()})
@@ -0,0 +1,300 @@
+"""
+On-demand sampling profiler for a single endpoint.
+
+An admin starts a profiling session for one endpoint (e.g.
+'feed.search_content') with a sampling rate, a frequency and a duration.
+While the session runs, a fraction `rate` of that endpoint's requests is
+marked for profiling, and a sampler thread reads the marked threads' stacks
+`hz` times a second via sys._current_frames(). When the session ends, the
+stacks are written to PROFILE_DIR in the collapsed format
+("frame;frame;frame count") that flamegraph.pl and speedscope read.
+
+Sessions span all worker processes. Starting or stopping one rewrites the
+flag file PROFILE_DIR/session.json; every worker reads it at most once a
+second from its request hooks and joins a running session with its own
+sampler thread, which rereads the flag to notice an early stop. Each worker
+writes its own output file, whose name carries the pid.
+
+With no session running, the only cost per request is a clock check in the
+request hooks (and a read of the flag file once a second), and no sampler
+thread exists.
+"""
+from flask import request, current_app
+from collections import Counter
+from datetime import datetime
+import fcntl
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+MAX_DURATION_SECONDS = 600
+MAX_HZ = 1000
+MAX_STACK_DEPTH = 128
+POLL_INTERVAL = 1.0  # Seconds between reads of the session flag in each worker
+SESSION_FILE = 'session.json'
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileSession:
+    def __init__(self, endpoint, rate, hz, duration, output_dir, id=None, started_at=None, ends_at=None):
+        self.id = id or uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.rate = rate
+        self.hz = hz
+        self.duration = duration
+        self.output_dir = output_dir
+        self.started_at = started_at or datetime.utcnow()
+        self.ends_at = ends_at if ends_at is not None else time.time() + duration  # Wall clock, shared by workers
+        self.threads = set()  # Ids of threads serving a request being profiled
+        self.samples = Counter()
+        self.sample_count = 0
+        self.requests_profiled = 0
+        self.path = None
+        self.error = None
+        self.finished = False
+
+    @classmethod
+    def from_flag(cls, flag, output_dir):
+        return cls(
+            flag['endpoint'], flag['rate'], flag['hz'], flag['duration'], output_dir,
+            id=flag['id'], started_at=datetime.fromisoformat(flag['started_at']), ends_at=flag['ends_at']
+        )
+
+    def to_flag(self):
+        return {
+            'id': self.id,
+            'endpoint': self.endpoint,
+            'rate': self.rate,
+            'hz': self.hz,
+            'duration': self.duration,
+            'started_at': self.started_at.isoformat(),
+            'ends_at': self.ends_at,
+            'stopped': False
+        }
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'endpoint': self.endpoint,
+            'rate': self.rate,
+            'hz': self.hz,
+            'duration': self.duration,
+            'started_at': self.started_at.isoformat(),
+            'remaining_seconds': 0 if self.finished else max(self.ends_at - time.time(), 0),
+            'pid': os.getpid(),
+            'requests_profiled': self.requests_profiled,
+            'samples': self.sample_count,
+            'output': self.path,
+            'error': self.error
+        }
+
+
+def _read_flag(output_dir):
+    try:
+        with open(os.path.join(output_dir, SESSION_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_flag(output_dir, flag):
+    path = os.path.join(output_dir, SESSION_FILE)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(flag, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _running(flag):
+    return flag is not None and not flag['stopped'] and time.time() < flag['ends_at']
+
+
+class _FlagLock:
+    """Serializes start and stop across worker processes"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def __enter__(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.file = open(os.path.join(self.output_dir, 'session.lock'), 'a')
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__') or os.path.basename(code.co_filename)
+    return f'{module}:{code.co_name}:{code.co_firstlineno}'.replace(';', ':').replace(' ', '_')
+
+
+def collapse_stack(frame):
+    """Render a stack as 'outermost;...;innermost'"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.session = None
+        self.last_session = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._next_poll = 0.0
+
+    def start(self, endpoint, rate=1.0, hz=100, duration=60, output_dir='.'):
+        """Start a session in every worker. Returns None if one is already running."""
+        with _FlagLock(output_dir):
+            if _running(_read_flag(output_dir)):
+                return None
+            session = ProfileSession(endpoint, rate, hz, duration, output_dir)
+            _write_flag(output_dir, session.to_flag())
+        self._stop_local()  # A session stopped elsewhere that this worker has not noticed yet
+        return self._join(session)
+
+    def stop(self, output_dir='.'):
+        """
+        End the running session early in every worker. Returns this worker's
+        part of it, with its output written, or None if no session was running.
+        """
+        with _FlagLock(output_dir):
+            flag = _read_flag(output_dir)
+            if not _running(flag):
+                return None
+            flag['stopped'] = True
+            _write_flag(output_dir, flag)
+        with self._lock:
+            session, thread = self.session, self._thread
+            if session is None or session.id != flag['id']:
+                # This worker was not sampling; the others write their output within POLL_INTERVAL
+                session = ProfileSession.from_flag(flag, output_dir)
+                session.finished = True
+                return session
+            self._stop_event.set()
+        thread.join()
+        return session
+
+    def _stop_local(self):
+        with self._lock:
+            thread = self._thread
+            self._stop_event.set()
+        if thread is not None:
+            thread.join()
+
+    def poll(self, output_dir):
+        """Join the session named by the flag file, if one is running and this worker is not in it"""
+        flag = _read_flag(output_dir)
+        if not _running(flag) or self.session is not None:
+            return
+        if self.last_session is not None and self.last_session.id == flag['id']:
+            return
+        self._join(ProfileSession.from_flag(flag, output_dir))
+
+    def _join(self, session):
+        with self._lock:
+            if self.session is not None:
+                return self.session if self.session.id == session.id else None
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(
+                target=self._sample, args=(session, self._stop_event), name='profiler-sampler', daemon=True
+            )
+            self.session = session
+            self._thread.start()
+            return session
+
+    def _stopped_elsewhere(self, session):
+        flag = _read_flag(session.output_dir)
+        return flag is None or flag['id'] != session.id or flag['stopped']
+
+    def _sample(self, session, stop_event):
+        interval = 1.0 / session.hz
+        own_id = threading.get_ident()
+        next_poll = time.monotonic() + POLL_INTERVAL
+        while not stop_event.wait(interval) and time.time() < session.ends_at:
+            if time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + POLL_INTERVAL
+                if self._stopped_elsewhere(session):
+                    break
+            thread_ids = list(session.threads)
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own_id:
+                    session.samples[collapse_stack(frame)] += 1
+                    session.sample_count += 1
+            del frames
+        self._finish(session)
+
+    def _finish(self, session):
+        with self._lock:
+            self.session = None
+            self._thread = None
+        session.threads.clear()
+        try:
+            session.path = self._write(session)
+        except OSError as e:
+            logger.exception('Could not write profile for %s', session.endpoint)
+            session.error = str(e)
+        session.finished = True
+        self.last_session = session
+
+    def _write(self, session):
+        os.makedirs(session.output_dir, exist_ok=True)
+        name = f'{session.endpoint}-{session.started_at:%Y%m%dT%H%M%S}-{os.getpid()}.collapsed'
+        path = os.path.join(session.output_dir, name)
+        with open(path, 'w') as f:
+            for stack, count in session.samples.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
+
+    def before_request(self):
+        now = time.monotonic()
+        if now >= self._next_poll:
+            self._next_poll = now + POLL_INTERVAL
+            self.poll(current_app.config['PROFILE_DIR'])
+        session = self.session
+        if session is None:
+            return
+        if request.endpoint == session.endpoint and random.random() < session.rate:
+            session.threads.add(threading.get_ident())
+            session.requests_profiled += 1
+
+    def teardown_request(self, exc):
+        session = self.session
+        if session is not None:
+            session.threads.discard(threading.get_ident())
+
+    def status(self, output_dir='.'):
+        flag = _read_flag(output_dir)
+        session = None
+        if _running(flag):
+            session = self.session
+            if session is None or session.id != flag['id']:
+                session = ProfileSession.from_flag(flag, output_dir)
+        return {
+            'running': session is not None,
+            'session': session.to_dict() if session else None,
+            'last_session': self.last_session.to_dict() if self.last_session else None
+        }
+
+
+profiler = SamplingProfiler()
+
+
+def init_profiler(app):
+    """Install the request hooks that mark requests for sampling"""
+    app.before_request(profiler.before_request)
+    app.teardown_request(profiler.teardown_request)
@@ -0,0 +1,178 @@
+"""
+Query-plan regression check for the feed, comment and auth endpoints.
+
+Each endpoint in QUERY_PLAN_ENDPOINTS is requested through the test client
+while every SELECT it issues is captured; each statement is then run through
+EXPLAIN QUERY PLAN and any full SCAN of a real table is reported. Run it with
+`flask check-query-plans`.
+
+Plans are taken from an in-memory copy of the schema with no statistics, so
+the result depends on the indexes alone: on a small database SQLite would
+rightly choose to scan tiny tables, hiding missing indexes.
+"""
+from src.models.user import db, User
+from src.models.hashtag import Hashtag
+from src.models.video import Video, Comment
+from src.models.spatial import haversine_km
+from src.services.discover import rebuild_discover_snapshot
+from src.models.timeline import following_feed_query
+from src.services.recommendations import ranked_feed_cache, new_session_seed, encode_session_cursor
+from src.utils.pagination import encode_cursor
+from src.utils.response_cache import response_cache
+from sqlalchemy import event, DateTime
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import jwt
+import re
+import sqlite3
+
+# (label, method, url template, needs auth). Cursor entries continue after a
+# sample row, so the keyset boundary is part of the plan.
+QUERY_PLAN_ENDPOINTS = [
+    ('for-you', 'GET', '/api/feed/for-you', False),
+    ('for-you cursor', 'GET', '/api/feed/for-you?cursor={for_you_cursor}', False),
+    # A new cursor session, so the candidates are ranked rather than loaded from a stored session
+    ('for-you personalized', 'GET', '/api/feed/for-you?user_id={user_id}&lat=40.7&lng=-74.0&cursor=', False),
+    ('for-you personalized cursor', 'GET', '/api/feed/for-you?user_id={user_id}&cursor={session_cursor}', False),
+    ('following', 'GET', '/api/feed/following', True),
+    ('following cursor', 'GET', '/api/feed/following?cursor={following_cursor}', True),
+    ('local', 'GET', '/api/feed/local?lat=40.7&lng=-74.0', False),
+    ('cuisine', 'GET', '/api/feed/cuisine/{cuisine}', False),
+    ('cuisine cursor', 'GET', '/api/feed/cuisine/{cuisine}?cursor={cuisine_cursor}', False),
+    ('hashtag', 'GET', '/api/feed/hashtag/{hashtag}', False),
+    ('search', 'GET', '/api/feed/search?q={hashtag}', False),
+    ('comment threads', 'GET', '/api/videos/{video_id}/comment-threads', False),
+    ('comment threads cursor', 'GET', '/api/videos/{video_id}/comment-threads?cursor={thread_cursor}', False),
+    ('thread replies', 'GET', '/api/videos/{video_id}/comment-threads/{comment_id}/replies', False),
+    ('thread replies cursor', 'GET', '/api/videos/{video_id}/comment-threads/{comment_id}/replies?cursor={reply_cursor}', False),
+    ('login', 'POST', '/api/auth/login', False),
+]
+
+# Scans that are expected, with the reason; keyed by (label, table)
+KNOWN_SCANS = {}
+
+_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(\w+)\b(?! VIRTUAL TABLE)')
+
+
+@contextmanager
+def capture_selects():
+    """Collect (statement, parameters) for every SELECT run inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def schema_copy():
+    """An in-memory database with the app's tables and indexes but no data or statistics"""
+    copy = sqlite3.connect(':memory:')
+    copy.create_function('haversine_km', 4, haversine_km, deterministic=True)
+    rows = db.session.execute(db.text(
+        "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND type IN ('table', 'index') "
+        "AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+    )).fetchall()
+    for (sql,) in rows:
+        try:
+            copy.execute(sql)
+        except sqlite3.OperationalError:
+            # Shadow tables already created by their FTS5/R*Tree virtual table
+            pass
+    return copy
+
+
+def explain(connection, statement, parameters):
+    """Return the detail lines of EXPLAIN QUERY PLAN for a statement"""
+    rows = connection.execute(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def find_scans(plan):
+    """Names of real tables the plan reads in full"""
+    matches = (_SCAN.match(line) for line in plan)
+    # Materialized subqueries and CTEs show up as scans of their alias
+    return [match.group(1) for match in matches if match and match.group(1) in db.metadata.tables]
+
+
+def _sample_cursor(query, sort_keys):
+    """A cursor pointing just after the first row of a feed, or at an arbitrary boundary if it is empty"""
+    row = query.order_by(None).with_entities(*sort_keys).first()
+    if row is None:
+        row = [datetime.utcnow() if isinstance(key.type, DateTime) else 0 for key in sort_keys]
+    return encode_cursor(row)
+
+
+def _sample_values():
+    user = User.query.order_by(User.id).first()
+    video = Video.query.filter(Video.cuisine_type.isnot(None)).first()
+    hashtag = Hashtag.query.order_by(Hashtag.usage_count.desc()).first()
+    comment = Comment.query.filter(Comment.parent_id.is_(None)).first()
+    reply = Comment.query.filter(Comment.parent_id.isnot(None)).first()
+    if reply is not None:
+        comment = db.session.get(Comment, reply.root_id or reply.parent_id)
+    engagement = Video.like_count + Video.comment_count + Video.view_count
+    following_query, following_keys = following_feed_query(user.id if user else 0)
+    return {
+        'video_id': comment.video_id if comment else (video.id if video else 1),
+        'comment_id': comment.id if comment else 1,
+        'user_id': user.id if user else 1,
+        'cuisine': video.cuisine_type if video else 'italian',
+        'hashtag': hashtag.name if hashtag else 'food',
+        'for_you_cursor': _sample_cursor(Video.query, [Video.rank_score, Video.id]),
+        'session_cursor': encode_session_cursor(user.id if user else 1, new_session_seed(), 1, None, None),
+        'following_cursor': _sample_cursor(following_query, following_keys),
+        'cuisine_cursor': _sample_cursor(Video.query.filter(Video.cuisine_type.isnot(None)), [engagement, Video.id]),
+        'thread_cursor': _sample_cursor(Comment.query.filter(Comment.parent_id.is_(None)), [Comment.created_at, Comment.id]),
+        'reply_cursor': _sample_cursor(Comment.query.filter(Comment.parent_id.isnot(None)), [Comment.created_at, Comment.id]),
+    }, user
+
+
+def check_query_plans(app):
+    """
+    Request every endpoint and EXPLAIN its queries. Returns a list of
+    (label, table, statement, plan) for each unexpected full table scan.
+    """
+    failures = []
+    with app.app_context():
+        connection = schema_copy()
+        values, user = _sample_values()
+        headers = {}
+        if user is not None:
+            token = jwt.encode({
+                'user_id': user.id,
+                'exp': datetime.utcnow() + timedelta(minutes=5)
+            }, app.config['SECRET_KEY'], algorithm='HS256')
+            headers['Authorization'] = f'Bearer {token}'
+
+        checks = [(label, method, url.format(**values), needs_auth) for label, method, url, needs_auth in QUERY_PLAN_ENDPOINTS]
+        # The discover payload is built off the request path, so check it directly
+        checks.append(('discover', None, None, False))
+
+        client = app.test_client()
+        for label, method, url, needs_auth in checks:
+            if needs_auth and not headers:
+                continue
+            response_cache.clear()
+            ranked_feed_cache.clear()
+            with capture_selects() as statements:
+                if method is None:
+                    rebuild_discover_snapshot()
+                elif method == 'POST':
+                    client.post(url, json={'username': 'query-plan-check', 'password': 'x'})
+                else:
+                    client.get(url, headers=headers if needs_auth else {})
+
+            for statement, parameters in statements:
+                plan = explain(connection, statement, parameters)
+                for table in find_scans(plan):
+                    if (label, table) not in KNOWN_SCANS:
+                        failures.append((label, table, statement, plan))
+        connection.close()
+    return failures
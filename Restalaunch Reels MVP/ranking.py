@@ -0,0 +1,128 @@
+"""
+Maintenance of the materialized Video.rank_score column.
+
+ORM writes keep rank_score current through the Video before_update hook.
+Counters changed with plain SQL (bulk updates, imports, manual fixes) are
+picked up here, either explicitly through schedule_rank_refresh() or by the
+periodic sweep over recently updated videos.
+"""
+from src.models.user import db
+from src.models.video import Video, compute_rank_score
+from sqlalchemy import select, update, bindparam
+from datetime import datetime
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_pending_ids = set()
+_pending_lock = threading.Lock()
+
+
+def _score_rows(rows):
+    """Write new scores for the rows whose score actually changed"""
+    table = Video.__table__
+    updates = []
+    for row in rows:
+        score = compute_rank_score(row.view_count, row.like_count, row.comment_count, row.created_at)
+        if row.rank_score is None or abs(score - row.rank_score) > 1e-9:
+            updates.append({'_id': row.id, '_score': score})
+
+    if updates:
+        # Leave updated_at untouched: a new score is not a content change
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('_id')).values(
+                rank_score=bindparam('_score'),
+                updated_at=table.c.updated_at
+            ),
+            updates
+        )
+    return len(updates)
+
+
+def refresh_rank_scores(video_ids=None, updated_since=None, batch_size=500):
+    """
+    Recompute rank_score for the given videos (default: every video, or
+    every video updated since a given time). The caller commits.
+    """
+    table = Video.__table__
+    query = select(
+        table.c.id, table.c.view_count, table.c.like_count,
+        table.c.comment_count, table.c.created_at, table.c.rank_score
+    )
+    if updated_since is not None:
+        query = query.where(table.c.updated_at >= updated_since)
+
+    changed = 0
+    if video_ids is not None:
+        video_ids = sorted(set(video_ids))
+        for i in range(0, len(video_ids), batch_size):
+            batch = video_ids[i:i + batch_size]
+            changed += _score_rows(db.session.execute(query.where(table.c.id.in_(batch))).fetchall())
+        return changed
+
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            query.where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        changed += _score_rows(rows)
+        last_id = rows[-1].id
+    return changed
+
+
+def schedule_rank_refresh(video_ids):
+    """Queue videos whose counters were changed outside the ORM"""
+    with _pending_lock:
+        _pending_ids.update(video_ids)
+
+
+class RankScoreWorker(threading.Thread):
+    """Background thread that applies queued and swept rank_score updates"""
+
+    def __init__(self, app, interval=60):
+        super().__init__(name='rank-score-worker', daemon=True)
+        self.app = app
+        self.interval = interval
+        self.last_sweep = datetime.utcnow()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Rank score refresh failed')
+
+    def run_once(self):
+        with _pending_lock:
+            video_ids = list(_pending_ids)
+            _pending_ids.clear()
+        sweep_started = datetime.utcnow()
+
+        with self.app.app_context():
+            try:
+                changed = refresh_rank_scores(updated_since=self.last_sweep)
+                if video_ids:
+                    changed += refresh_rank_scores(video_ids=video_ids)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                schedule_rank_refresh(video_ids)
+                raise
+            finally:
+                db.session.remove()
+
+        self.last_sweep = sweep_started
+        return changed
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_rank_score_worker(app, interval=60):
+    worker = RankScoreWorker(app, interval)
+    worker.start()
+    return worker
@@ -0,0 +1,280 @@
+"""
+Candidate generation and ranking for the personalized for-you feed.
+
+A feed session is ranked once: each candidate source (followed creators,
+preferred cuisines and categories, trending, nearby) contributes a bounded
+slice read in index order, the union is scored in one pass, and the ranked id
+list is stored under (user_id, seed) in the feed_session table, with a copy
+cached in the process. Pages are slices of that list, so they never overlap
+and a cursor resumes at the same place whichever worker serves it. The seed drives
+a small score jitter, giving each session a different but repeatable order.
+Cursors carry the seed and the session's rounded location with an HMAC over
+them and the user id, so clients can only page through sessions the server
+started, not mint new rankings by editing the seed.
+Videos the user has already watched (per their seen filter) are moved behind
+everything unseen, so they only come back once the fresh candidates run out.
+"""
+from src.models.video import Video
+from src.models.preference import get_preferences
+from src.models.timeline import following_feed_query
+from src.models.spatial import ids_within_box, video_location_index
+from src.models.seen import load_seen_filters, was_seen
+from src.models.feed_session import load_feed_session, store_feed_session
+from src.utils.pagination import encode_cursor, decode_cursor, InvalidCursor
+from flask import current_app
+from collections import OrderedDict
+from datetime import date
+import hashlib
+import hmac
+import random
+import threading
+import time
+
+# Maximum candidates read from each source
+SOURCE_LIMITS = {
+    'followed': 200,
+    'cuisine': 200,
+    'category': 150,
+    'trending': 300,
+    'local': 150,
+}
+
+# Bonus added for each source a candidate came from
+SOURCE_WEIGHTS = {
+    'followed': 1.0,
+    'cuisine': 0.6,
+    'local': 0.5,
+    'category': 0.4,
+    'trending': 0.2,
+}
+
+AFFINITY_WEIGHT = 0.8  # Scales the user's share of likes in a cuisine/category
+JITTER = 0.15  # Range of the seeded random component
+CREATOR_DECAY = 0.85  # Applied again for each further video by the same creator
+LOCAL_RADIUS_KM = 25
+
+_CANDIDATE_COLUMNS = (
+    Video.id, Video.user_id, Video.cuisine_type, Video.food_category, Video.rank_score
+)
+
+
+def _base_query(user_id):
+    return Video.query.with_entities(*_CANDIDATE_COLUMNS).filter(
+        Video.is_active == True,
+        Video.user_id != user_id
+    )
+
+
+def generate_candidates(user_id, preferences, lat=None, lng=None):
+    """Return {video_id: (row, {source, ...})} from every candidate source"""
+    sources = {}
+
+    followed, sort_keys = following_feed_query(user_id)
+    sources['followed'] = followed.with_entities(*_CANDIDATE_COLUMNS).order_by(
+        *[key.desc() for key in sort_keys]
+    ).limit(SOURCE_LIMITS['followed']).all()
+
+    cuisines = [value for value, _ in preferences['cuisine']]
+    if cuisines:
+        sources['cuisine'] = _base_query(user_id).filter(
+            Video.cuisine_type.in_(cuisines)
+        ).order_by(Video.rank_score.desc()).limit(SOURCE_LIMITS['cuisine']).all()
+
+    categories = [value for value, _ in preferences['category']]
+    if categories:
+        sources['category'] = _base_query(user_id).filter(
+            Video.food_category.in_(categories)
+        ).order_by(Video.rank_score.desc()).limit(SOURCE_LIMITS['category']).all()
+
+    sources['trending'] = _base_query(user_id).order_by(
+        Video.rank_score.desc()
+    ).limit(SOURCE_LIMITS['trending']).all()
+
+    if lat is not None and lng is not None:
+        sources['local'] = _base_query(user_id).filter(
+            Video.id.in_(ids_within_box(video_location_index, lat, lng, LOCAL_RADIUS_KM))
+        ).order_by(Video.rank_score.desc()).limit(SOURCE_LIMITS['local']).all()
+
+    candidates = {}
+    for source, rows in sources.items():
+        for row in rows:
+            entry = candidates.get(row.id)
+            if entry is None:
+                candidates[row.id] = (row, {source})
+            else:
+                entry[1].add(source)
+    return candidates
+
+
+def score_candidates(candidates, preferences, seed):
+    """Rank candidates best first and return their ids"""
+    if not candidates:
+        return []
+
+    scores = [row.rank_score or 0.0 for row, _ in candidates.values()]
+    low, high = min(scores), max(scores)
+    spread = (high - low) or 1.0
+
+    shares = {}
+    for kind, values in preferences.items():
+        total = sum(weight for _, weight in values) or 1
+        shares[kind] = {value: weight / total for value, weight in values}
+
+    # Iterate in id order so the seeded jitter is reproducible
+    rng = random.Random(seed)
+    scored = []
+    for video_id in sorted(candidates):
+        row, sources = candidates[video_id]
+        score = ((row.rank_score or 0.0) - low) / spread
+        score += sum(SOURCE_WEIGHTS[source] for source in sources)
+        score += AFFINITY_WEIGHT * (
+            shares['cuisine'].get(row.cuisine_type, 0.0) +
+            shares['category'].get(row.food_category, 0.0)
+        )
+        score += rng.random() * JITTER
+        scored.append((score, video_id, row.user_id))
+    scored.sort(reverse=True)
+
+    # Spread out creators so one prolific account can't fill a page
+    seen_creators = {}
+    diversified = []
+    for score, video_id, creator_id in scored:
+        repeats = seen_creators.get(creator_id, 0)
+        seen_creators[creator_id] = repeats + 1
+        diversified.append((score * CREATOR_DECAY ** repeats, video_id))
+    diversified.sort(reverse=True)
+    return [video_id for _, video_id in diversified]
+
+
+class RankedFeedCache:
+    """
+    Bounded LRU of ranked id lists per (user_id, seed), expiring after `ttl`
+    seconds. A per-process copy of the stored feed sessions.
+    """
+
+    def __init__(self, maxsize=2000, ttl=900):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, video_ids):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, video_ids)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+ranked_feed_cache = RankedFeedCache()
+
+
+SEED_BITS = 31
+LOCATION_DECIMALS = 2  # About 1 km; sessions are keyed by the rounded location
+
+
+def new_session_seed():
+    return random.getrandbits(SEED_BITS)
+
+
+def session_location(lat, lng):
+    """Round a feed location so nearby requests share a session"""
+    if lat is None or lng is None:
+        return None, None
+    return round(lat, LOCATION_DECIMALS), round(lng, LOCATION_DECIMALS)
+
+
+def _session_signature(user_id, seed, lat, lng):
+    message = f'{user_id}:{seed}:{lat}:{lng}'.encode()
+    return hmac.new(current_app.config['SECRET_KEY'].encode(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def encode_session_cursor(user_id, seed, offset, lat, lng):
+    return encode_cursor([seed, offset, lat, lng, _session_signature(user_id, seed, lat, lng)])
+
+
+def decode_session_cursor(cursor, user_id):
+    """Return (seed, offset, lat, lng) from a cursor this server signed for user_id"""
+    seed, offset, lat, lng, signature = decode_cursor(cursor, ('seed', 'offset', 'lat', 'lng', 'signature'))
+    if not (
+        isinstance(seed, int) and 0 <= seed < 2 ** SEED_BITS
+        and isinstance(offset, int) and offset >= 0
+        and isinstance(signature, str)
+        and all(value is None or isinstance(value, (int, float)) for value in (lat, lng))
+        and hmac.compare_digest(signature, _session_signature(user_id, seed, lat, lng))
+    ):
+        raise InvalidCursor('Invalid cursor')
+    return seed, offset, lat, lng
+
+
+def daily_session_seed(user_id):
+    """Seed shared by page-numbered requests so page N is stable for the day"""
+    digest = hashlib.blake2b(f'{user_id}:{date.today().isoformat()}'.encode(), digest_size=4).digest()
+    return int.from_bytes(digest, 'big') >> 1
+
+
+def demote_seen(user_id, video_ids):
+    """Keep the ranked order but move already watched videos to the end"""
+    filters = load_seen_filters(user_id)
+    if not filters:
+        return video_ids
+    unseen, seen = [], []
+    for video_id in video_ids:
+        (seen if was_seen(filters, video_id) else unseen).append(video_id)
+    return unseen + seen
+
+
+def get_ranked_video_ids(user_id, seed, lat=None, lng=None):
+    """
+    Return the ranked id list for a feed session, building it on first use.
+    lat/lng must already be rounded by session_location().
+    """
+    key = (user_id, seed, lat, lng)
+    video_ids = ranked_feed_cache.get(key)
+    if video_ids is None:
+        session_key = ':'.join(str(part) for part in key)
+        video_ids = load_feed_session(session_key)
+        if video_ids is None:
+            preferences = get_preferences(user_id)
+            candidates = generate_candidates(user_id, preferences, lat, lng)
+            video_ids = demote_seen(user_id, score_candidates(candidates, preferences, seed))
+            # If another worker built this session meanwhile, its list wins
+            video_ids = store_feed_session(user_id, session_key, video_ids, ranked_feed_cache.ttl)
+        ranked_feed_cache.put(key, video_ids)
+    return video_ids
+
+
+def load_videos_in_order(video_ids):
+    """Fetch videos by id, keeping the given order and dropping any since deactivated"""
+    if not video_ids:
+        return []
+    videos = {
+        video.id: video
+        for video in Video.query.filter(Video.id.in_(video_ids), Video.is_active == True)
+    }
+    return [videos[video_id] for video_id in video_ids if video_id in videos]
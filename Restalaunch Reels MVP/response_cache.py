@@ -0,0 +1,277 @@
+"""
+In-process cache of serialized responses for anonymous feed endpoints.
+
+A cached view is rendered once per distinct (endpoint, path args, query args)
+and the JSON body is reused until its TTL expires or one of its tags is
+invalidated. Every response carries a strong ETag over the body and a
+Cache-Control max-age of the remaining TTL, so clients revalidate with
+If-None-Match and get a 304 without the body being re-sent.
+
+Tags are (kind, value) tuples. Writes to Video invalidate the tags they
+affect once the transaction commits; engagement counters are left to the TTL.
+
+Under gunicorn each worker has its own cache, so invalidated tags are also
+appended to a shared log file (RESPONSE_CACHE_INVALIDATION_LOG). Every worker
+stats the log on each lookup and applies the lines it has not read yet, so
+other workers stop serving an invalidated entry from their next request on.
+Without the log, they serve it until its TTL (at most 60s) expires.
+"""
+from flask import request, current_app
+from src.models.video import Video
+from sqlalchemy import event
+from sqlalchemy.orm import Session, attributes
+from collections import OrderedDict
+from functools import wraps
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+
+MAX_INVALIDATION_LOG_SIZE = 1024 * 1024  # The log is replaced by an empty one past this
+
+
+class CachedResponse:
+    def __init__(self, body, mimetype, expires_at, tags):
+        self.body = body
+        self.mimetype = mimetype
+        self.expires_at = expires_at
+        self.tags = tags
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+
+
+class ResponseCache:
+    def __init__(self, maxsize=2000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0  # Bumped on every invalidation
+        self.log_path = None
+        self._log_position = None  # (inode, offset) of the log read so far
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def configure(self, log_path):
+        """Share invalidations with other processes through the log at `log_path`"""
+        self.log_path = log_path
+        self._log_position = None
+        if log_path:
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            open(log_path, 'ab').close()
+            st = os.stat(log_path)
+            self._log_position = (st.st_ino, st.st_size)  # Nothing is cached yet, so skip the history
+
+    def _drop_tagged(self, tags):
+        """Drop the entries carrying any of `tags`. The caller holds the lock."""
+        self._generation += 1
+        stale = [key for key, entry in self._entries.items() if not entry.tags.isdisjoint(tags)]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def _read_log(self):
+        """Apply invalidations logged by any process since the last read"""
+        if not self.log_path:
+            return
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return
+        if (st.st_ino, st.st_size) == self._log_position:
+            return
+        with self._lock:
+            inode, offset = self._log_position
+            with open(self.log_path, 'rb') as f:
+                current_inode = os.fstat(f.fileno()).st_ino
+                if current_inode != inode:
+                    # Replaced after growing too large; lines this process missed are gone
+                    self._generation += 1
+                    self.invalidations += len(self._entries)
+                    self._entries.clear()
+                    offset = 0
+                f.seek(offset)
+                data = f.read()
+            complete = data[:data.rfind(b'\n') + 1]  # A line being appended is read next time
+            tags = set()
+            for line in complete.splitlines():
+                tags.update(tuple(tag) for tag in json.loads(line))
+            if tags:
+                self._drop_tagged(tags)
+            self._log_position = (current_inode, offset + len(complete))
+
+    def _append_log(self, tags):
+        line = (json.dumps(sorted(tags)) + '\n').encode()
+        while True:
+            with open(self.log_path, 'ab') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    if os.fstat(f.fileno()).st_ino != os.stat(self.log_path).st_ino:
+                        continue  # Replaced while waiting for the lock; append to the new one
+                except FileNotFoundError:
+                    continue
+                f.write(line)
+                f.flush()
+                if f.tell() >= MAX_INVALIDATION_LOG_SIZE:
+                    tmp_path = f'{self.log_path}.{os.getpid()}.tmp'
+                    open(tmp_path, 'wb').close()
+                    os.replace(tmp_path, self.log_path)  # Still under the old file's lock
+                return
+
+    @property
+    def generation(self):
+        self._read_log()
+        return self._generation
+
+    def get(self, key):
+        self._read_log()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry, generation):
+        """Store an entry unless an invalidation ran while it was being rendered"""
+        self._read_log()
+        with self._lock:
+            if generation != self._generation:
+                return False
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate(self, tags):
+        """Drop every entry carrying one of `tags`, here and in the other processes"""
+        with self._lock:
+            dropped = self._drop_tagged(tags)
+        if self.log_path:
+            self._append_log(tags)
+        return dropped
+
+    def clear(self):
+        """Empty this process's cache"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+
+response_cache = ResponseCache()
+
+
+def _cache_key():
+    args = tuple(sorted(request.args.items(multi=True)))
+    view_args = tuple(sorted((request.view_args or {}).items()))
+    return (request.endpoint, view_args, args)
+
+
+def _send(entry, cache_status):
+    response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = f'public, max-age={max(0, round(entry.expires_at - time.time()))}'
+    response.headers['X-Cache'] = cache_status
+    return response.make_conditional(request)
+
+
+def cached_response(ttl, tags=None, when=None):
+    """
+    Cache a GET view's successful responses for `ttl` seconds. `tags` maps
+    the view's keyword arguments to the entry's invalidation tags, and `when`
+    can veto caching for a request (for example a personalized one).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or (when is not None and not when()):
+                return view(*args, **kwargs)
+
+            key = _cache_key()
+            entry = response_cache.get(key)
+            if entry is not None:
+                return _send(entry, 'HIT')
+
+            generation = response_cache.generation
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            entry = CachedResponse(
+                response.get_data(),
+                response.mimetype,
+                time.time() + ttl,
+                frozenset(tags(**kwargs) if tags is not None else ())
+            )
+            response_cache.put(key, entry, generation)
+            return _send(entry, 'MISS')
+        return wrapper
+    return decorator
+
+
+# Video columns whose changes do not alter which videos a feed lists
+_VOLATILE_COLUMNS = {'view_count', 'like_count', 'comment_count', 'share_count', 'rank_score', 'updated_at'}
+
+
+def _video_tags(video, changed):
+    """Tags touched by a video, including values it had before this flush"""
+    tags = {('feed', 'for-you')}
+    cuisines = {video.cuisine_type}
+    hashtags = set(video.get_hashtags_list())
+    if changed:
+        cuisines.update(attributes.get_history(video, 'cuisine_type').deleted or ())
+        for old in attributes.get_history(video, 'hashtags').deleted or ():
+            hashtags.update(tag.strip() for tag in (old or '').split(',') if tag.strip())
+    tags.update(('cuisine', cuisine.strip().lower()) for cuisine in cuisines if cuisine)
+    tags.update(('hashtag', tag.lstrip('#').strip().lower()) for tag in hashtags if tag)
+    return tags
+
+
+def _listed_fields_changed(video):
+    state = attributes.instance_state(video)
+    return any(
+        attr.key not in _VOLATILE_COLUMNS and attr.history.has_changes()
+        for attr in state.attrs
+        if attr.key in Video.__table__.columns
+    )
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_video_tags(session, flush_context):
+    pending = session.info.setdefault('response_cache_tags', set())
+    for video in session.new:
+        if isinstance(video, Video):
+            pending.update(_video_tags(video, False))
+    for video in session.deleted:
+        if isinstance(video, Video):
+            pending.update(_video_tags(video, False))
+    for video in session.dirty:
+        if isinstance(video, Video) and _listed_fields_changed(video):
+            pending.update(_video_tags(video, True))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    pending = session.info.pop('response_cache_tags', None)
+    if not pending:
+        return
+    response_cache.invalidate(pending)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop('response_cache_tags', None)
@@ -0,0 +1,109 @@
+"""
+SQLite FTS5 full-text index for /api/feed/search.
+
+Each searchable table gets an external-content FTS5 table (the text is read
+from the base table, not duplicated) kept in sync by triggers, so every
+writer, ORM or raw SQL, updates the index. Results are ranked by BM25 with
+per-column weights, and every term is matched as a prefix.
+"""
+from src.models.user import db
+from sqlalchemy import text
+import re
+
+
+class SearchIndex:
+    def __init__(self, name, table, columns, weights, active_column=None):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.weights = weights
+        self.active_column = active_column
+
+    def create_statements(self):
+        columns = ', '.join(self.columns)
+        new_values = ', '.join(f'new.{column}' for column in self.columns)
+        old_values = ', '.join(f'old.{column}' for column in self.columns)
+        delete_old = (
+            f"INSERT INTO {self.name}({self.name}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values});"
+        )
+        insert_new = f"INSERT INTO {self.name}(rowid, {columns}) VALUES (new.id, {new_values});"
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.name} USING fts5("
+            f"{columns}, content='{self.table}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+            f'CREATE TRIGGER IF NOT EXISTS {self.name}_ai AFTER INSERT ON "{self.table}" BEGIN {insert_new} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.name}_ad AFTER DELETE ON "{self.table}" BEGIN {delete_old} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.name}_au AFTER UPDATE OF {columns} ON "{self.table}" '
+            f'BEGIN {delete_old} {insert_new} END',
+        ]
+
+    def _matches(self):
+        """SELECT of (id, score) for rows matching :match, best first"""
+        weights = ', '.join(str(weight) for weight in self.weights)
+        # CROSS JOIN keeps the FTS table as the outer loop. Left to the planner,
+        # the count query walks every active row and runs MATCH once per row.
+        sql = (
+            f'SELECT "{self.table}".id AS id, bm25({self.name}, {weights}) AS score '
+            f'FROM {self.name} CROSS JOIN "{self.table}" ON "{self.table}".id = {self.name}.rowid '
+            f'WHERE {self.name} MATCH :match'
+        )
+        if self.active_column:
+            sql += f' AND "{self.table}".{self.active_column} = 1'
+        return sql
+
+    def search(self, match, limit, offset=0, after=None):
+        """
+        Return [(id, score)] ranked by BM25. `after` is the (score, id) of the
+        last row already returned, for keyset paging.
+        """
+        params = {'match': match, 'limit': limit, 'offset': offset}
+        sql = f'SELECT id, score FROM ({self._matches()})'
+        if after is not None:
+            sql += ' WHERE (score, id) > (:after_score, :after_id)'
+            params.update(after_score=after[0], after_id=after[1], offset=0)
+        sql += ' ORDER BY score, id LIMIT :limit OFFSET :offset'
+        return db.session.execute(text(sql), params).fetchall()
+
+    def count(self, match):
+        return db.session.execute(
+            text(f'SELECT count(*) FROM ({self._matches()})'), {'match': match}
+        ).scalar()
+
+    def rebuild(self):
+        db.session.execute(text(f"INSERT INTO {self.name}({self.name}) VALUES ('rebuild')"))
+
+
+SEARCH_INDEXES = {
+    'videos': SearchIndex(
+        'video_fts', 'video', ('title', 'description', 'hashtags', 'cuisine_type'),
+        weights=(10.0, 2.0, 5.0, 3.0), active_column='is_active'
+    ),
+    'vendors': SearchIndex(
+        'vendor_fts', 'vendor', ('business_name', 'description', 'cuisine_type'),
+        weights=(10.0, 2.0, 4.0), active_column='is_active'
+    ),
+    'users': SearchIndex(
+        'user_fts', 'user', ('username', 'full_name', 'bio'),
+        weights=(10.0, 6.0, 1.0)
+    ),
+}
+
+
+def build_match_query(query):
+    """
+    Turn free text into an FTS5 query: every word must match, as a prefix.
+    Returns None when the text has no searchable words.
+    """
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def create_search_indexes(rebuild=True):
+    for index in SEARCH_INDEXES.values():
+        for statement in index.create_statements():
+            db.session.execute(text(statement))
+        if rebuild:
+            index.rebuild()
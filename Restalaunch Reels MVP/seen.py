@@ -0,0 +1,123 @@
+"""
+Per-user record of videos already watched, kept as bloom filters.
+
+Each user has two fixed-size filters stored as blobs: the current one and
+the one it replaced. Views go into the current filter; once it holds
+SEEN_FILTER_CAPACITY ids it becomes the previous filter and a fresh one
+starts. Memory per user is therefore bounded (about 12 KB) while remembering
+the last SEEN_FILTER_CAPACITY to 2 x SEEN_FILTER_CAPACITY views. A lookup
+may wrongly report a video as seen (about 1% of the time) but never misses
+one that was recorded.
+"""
+from src.models.user import db
+from sqlalchemy import insert
+from datetime import datetime
+import hashlib
+import math
+
+SEEN_FILTER_CAPACITY = 5000
+SEEN_FILTER_ERROR_RATE = 0.01
+
+
+class BloomFilter:
+    def __init__(self, bit_count, hash_count, data=None):
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.data = bytearray(data) if data else bytearray((bit_count + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate):
+        bit_count = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        hash_count = max(1, round(bit_count / capacity * math.log(2)))
+        return cls(bit_count, hash_count)
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bit_count for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class UserSeenFilter(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    bit_count = db.Column(db.Integer, nullable=False)
+    hash_count = db.Column(db.Integer, nullable=False)
+    current_bits = db.Column(db.LargeBinary, nullable=False)
+    current_items = db.Column(db.Integer, default=0, nullable=False)  # Ids added to current_bits
+    previous_bits = db.Column(db.LargeBinary, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UserSeenFilter user:{self.user_id} items:{self.current_items}>'
+
+    @classmethod
+    def create(cls, user_id):
+        bloom = BloomFilter.for_capacity(SEEN_FILTER_CAPACITY, SEEN_FILTER_ERROR_RATE)
+        return cls(
+            user_id=user_id,
+            bit_count=bloom.bit_count,
+            hash_count=bloom.hash_count,
+            current_bits=bytes(bloom.data),
+            current_items=0
+        )
+
+    def filters(self):
+        filters = [BloomFilter(self.bit_count, self.hash_count, self.current_bits)]
+        if self.previous_bits:
+            filters.append(BloomFilter(self.bit_count, self.hash_count, self.previous_bits))
+        return filters
+
+    def add(self, video_ids):
+        """Record video ids as seen, rotating the filters when the current one is full"""
+        current = BloomFilter(self.bit_count, self.hash_count, self.current_bits)
+        count = self.current_items
+        for video_id in video_ids:
+            if count >= SEEN_FILTER_CAPACITY:
+                self.previous_bits = bytes(current.data)
+                current = BloomFilter(self.bit_count, self.hash_count)
+                count = 0
+            if video_id not in current:
+                current.add(video_id)
+                count += 1
+        self.current_bits = bytes(current.data)
+        self.current_items = count
+
+
+def record_seen(user_id, video_ids):
+    """
+    Add video ids to a user's seen filter. The caller commits.
+
+    The insert runs first so the transaction holds SQLite's write lock
+    before the filter is read: concurrent calls for the same user queue up
+    behind it instead of overwriting each other's bits.
+    """
+    empty = UserSeenFilter.create(user_id)
+    db.session.execute(insert(UserSeenFilter).prefix_with('OR IGNORE').values(
+        user_id=user_id,
+        bit_count=empty.bit_count,
+        hash_count=empty.hash_count,
+        current_bits=empty.current_bits,
+        current_items=0,
+        updated_at=datetime.utcnow()
+    ))
+    seen = db.session.get(UserSeenFilter, user_id, populate_existing=True)
+    seen.add(video_ids)
+    return seen
+
+
+def load_seen_filters(user_id):
+    """Return the user's bloom filters (empty if they have not seen anything)"""
+    seen = db.session.get(UserSeenFilter, user_id)
+    return seen.filters() if seen is not None else []
+
+
+def was_seen(filters, video_id):
+    return any(video_id in bloom for bloom in filters)
@@ -0,0 +1,121 @@
+"""
+Batched serialization for lists of models.
+
+The per-object to_dict() methods load each related user lazily, one query per
+object. These helpers produce the same JSON for a whole page while loading
+every referenced user with a fixed number of queries.
+"""
+from src.models.user import db, User
+from src.models.video import Comment
+from src.utils.pagination import encode_cursor
+from sqlalchemy import select, func
+
+
+def load_public_users(user_ids):
+    """Return {user_id: User.to_public_dict()} for the given ids in one query"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+
+    users = User.query.filter(User.id.in_(user_ids)).all()
+    return {user.id: user.to_public_dict() for user in users}
+
+
+def serialize_users(users):
+    return [user.to_public_dict() for user in users]
+
+
+def serialize_videos(videos, include_creator=True):
+    creators = load_public_users(video.user_id for video in videos) if include_creator else {}
+
+    results = []
+    for video in videos:
+        result = video.to_dict(include_creator=False)
+        if video.user_id in creators:
+            result['creator'] = creators[video.user_id]
+        results.append(result)
+    return results
+
+
+def serialize_comments(comments, include_replies=False):
+    replies_by_parent = {}
+    if include_replies and comments:
+        replies = Comment.query.filter(
+            Comment.parent_id.in_([comment.id for comment in comments])
+        ).order_by(Comment.id).all()
+        for reply in replies:
+            replies_by_parent.setdefault(reply.parent_id, []).append(reply)
+
+    all_comments = list(comments) + [reply for group in replies_by_parent.values() for reply in group]
+    users = load_public_users(comment.user_id for comment in all_comments)
+
+    def serialize(comment):
+        result = comment.to_dict(include_user=False)
+        result['user'] = users.get(comment.user_id)
+        return result
+
+    results = []
+    for comment in comments:
+        result = serialize(comment)
+        if include_replies:
+            result['replies'] = [serialize(reply) for reply in replies_by_parent.get(comment.id, [])]
+        results.append(result)
+    return results
+
+
+def serialize_comment_threads(roots, reply_limit=3):
+    """
+    Serialize top-level comments with the first `reply_limit` replies of each
+    thread, its total reply count and a cursor for the rest. Replies at any
+    depth are flattened into their thread, oldest first. Two queries
+    regardless of page size: replies (with counts) and users.
+    """
+    replies_by_root = {}
+    reply_counts = {}
+    root_ids = [root.id for root in roots]
+    if root_ids:
+        ranked = select(
+            Comment.id,
+            func.row_number().over(
+                partition_by=Comment.root_id, order_by=(Comment.created_at, Comment.id)
+            ).label('position'),
+            func.count().over(partition_by=Comment.root_id).label('reply_count')
+        ).where(Comment.root_id.in_(root_ids)).subquery('reply_rank')
+        rows = db.session.query(Comment, ranked.c.reply_count).join(
+            ranked, ranked.c.id == Comment.id
+        ).filter(ranked.c.position <= reply_limit).order_by(ranked.c.position).all()
+        for reply, reply_count in rows:
+            replies_by_root.setdefault(reply.root_id, []).append(reply)
+            reply_counts[reply.root_id] = reply_count
+
+    all_comments = list(roots) + [reply for group in replies_by_root.values() for reply in group]
+    users = load_public_users(comment.user_id for comment in all_comments)
+
+    def serialize(comment):
+        result = comment.to_dict(include_user=False)
+        result['user'] = users.get(comment.user_id)
+        return result
+
+    results = []
+    for root in roots:
+        replies = replies_by_root.get(root.id, [])
+        result = serialize(root)
+        result['replies'] = [serialize(reply) for reply in replies]
+        result['reply_count'] = reply_counts.get(root.id, 0)
+        result['replies_next_cursor'] = (
+            encode_cursor([replies[-1].created_at, replies[-1].id])
+            if result['reply_count'] > len(replies) else None
+        )
+        results.append(result)
+    return results
+
+
+def serialize_reviews(reviews):
+    users = load_public_users(review.user_id for review in reviews)
+
+    results = []
+    for review in reviews:
+        result = review.to_dict(include_user=False)
+        result['user'] = users.get(review.user_id)
+        results.append(result)
+    return results
@@ -0,0 +1,126 @@
+"""
+Spatial indexing for location-based queries.
+
+Vendor and video coordinates are mirrored into SQLite R*Tree tables by
+triggers, so a bounding-box lookup touches only nearby rows. Exact great-circle
+distances are computed with a haversine_km() SQL function registered on each
+connection and used for filtering and ordering.
+"""
+from src.models.user import db
+from src.models.vendor import Vendor
+from sqlalchemy import event, select, table, column, func, and_, union_all, text, Float
+from sqlalchemy.engine import Engine
+import math
+import sqlite3
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.195
+
+vendor_location_index = table(
+    'vendor_location_rtree',
+    column('id'), column('min_lat'), column('max_lat'), column('min_lng'), column('max_lng')
+)
+video_location_index = table(
+    'video_location_rtree',
+    column('id'), column('min_lat'), column('max_lat'), column('min_lng'), column('max_lng')
+)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in kilometres"""
+    if lat1 is None or lng1 is None or lat2 is None or lng2 is None:
+        return None
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+@event.listens_for(Engine, 'connect')
+def _register_sql_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('haversine_km', 4, haversine_km, deterministic=True)
+
+
+def bounding_boxes(lat, lng, radius_km):
+    """
+    Return [(min_lat, max_lat, min_lng, max_lng), ...] enclosing the search
+    circle: two boxes when it crosses the antimeridian, one otherwise
+    """
+    lat_range = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(-90.0, lat - lat_range), min(90.0, lat + lat_range)
+    cos_lat = math.cos(math.radians(lat))
+    # Near the poles every longitude is within range
+    if cos_lat < 1e-6 or abs(lat) + lat_range >= 90:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+    lng_range = radius_km / (KM_PER_DEGREE * cos_lat)
+    if lng_range >= 180.0:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+
+    min_lng, max_lng = lng - lng_range, lng + lng_range
+    if min_lng < -180.0:
+        return [(min_lat, max_lat, -180.0, max_lng), (min_lat, max_lat, min_lng + 360.0, 180.0)]
+    if max_lng > 180.0:
+        return [(min_lat, max_lat, min_lng, 180.0), (min_lat, max_lat, -180.0, max_lng - 360.0)]
+    return [(min_lat, max_lat, min_lng, max_lng)]
+
+
+def distance_km(lat, lng, target_lat, target_lng):
+    """SQL expression for the distance from (lat, lng) to a coordinate pair"""
+    return func.haversine_km(lat, lng, target_lat, target_lng, type_=Float)
+
+
+def ids_within_box(index, lat, lng, radius_km):
+    """Subquery of ids from an R*Tree index whose point lies in the search boxes"""
+    # One R*Tree range scan per box; the R*Tree cannot search an OR of ranges
+    selects = [
+        select(index.c.id).where(
+            and_(
+                index.c.min_lat <= max_lat,
+                index.c.max_lat >= min_lat,
+                index.c.min_lng <= max_lng,
+                index.c.max_lng >= min_lng
+            )
+        )
+        for min_lat, max_lat, min_lng, max_lng in bounding_boxes(lat, lng, radius_km)
+    ]
+    return selects[0] if len(selects) == 1 else union_all(*selects)
+
+
+def nearby_vendors(lat, lng, radius_km):
+    """Active vendors within radius_km, nearest first"""
+    distance = distance_km(lat, lng, Vendor.latitude, Vendor.longitude)
+    return Vendor.query.filter(
+        and_(
+            Vendor.id.in_(ids_within_box(vendor_location_index, lat, lng, radius_km)),
+            Vendor.is_active == True,
+            distance <= radius_km
+        )
+    ).order_by(distance, Vendor.id)
+
+
+def _index_statements(name, source):
+    insert_new = (
+        f'INSERT OR REPLACE INTO {name} (id, min_lat, max_lat, min_lng, max_lng) '
+        f'SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude '
+        f'WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;'
+    )
+    return [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING rtree(id, min_lat, max_lat, min_lng, max_lng)',
+        f'CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {source} BEGIN {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF latitude, longitude ON {source} '
+        f'BEGIN DELETE FROM {name} WHERE id = old.id; {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {source} '
+        f'BEGIN DELETE FROM {name} WHERE id = old.id; END',
+        f'INSERT OR REPLACE INTO {name} (id, min_lat, max_lat, min_lng, max_lng) '
+        f'SELECT id, latitude, latitude, longitude, longitude FROM {source} '
+        f'WHERE latitude IS NOT NULL AND longitude IS NOT NULL',
+    ]
+
+
+def create_spatial_indexes():
+    """Create and populate the R*Tree indexes and their sync triggers"""
+    for statement in _index_statements('vendor_location_rtree', 'vendor') + \
+            _index_statements('video_location_rtree', 'video'):
+        db.session.execute(text(statement))
@@ -0,0 +1,112 @@
+"""
+Shared fixtures.
+
+The app is imported once with a throwaway SQLite file as its database and
+every background worker disabled. Each test gets that file freshly created
+with all tables and migrations, and the in-process caches emptied.
+
+Run from the project root, so `src` is importable:
+
+    python -m pytest tests
+"""
+from contextlib import contextmanager
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+_DB_PATH = os.path.join(tempfile.mkdtemp(prefix='restalaunch-tests-'), 'app.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{_DB_PATH}'
+os.environ['METRICS_DIR'] = os.path.join(os.path.dirname(_DB_PATH), 'metrics')
+os.environ['PROFILE_DIR'] = os.path.join(os.path.dirname(_DB_PATH), 'profiles')
+os.environ['RESPONSE_CACHE_INVALIDATION_LOG'] = os.path.join(os.path.dirname(_DB_PATH), 'response_cache_invalidations.log')
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'  # Fast hashes; the pool still runs them
+for _name in ('RANK_SCORE_REFRESH_SECONDS', 'DISCOVER_REFRESH_SECONDS', 'COUNTER_FLUSH_INTERVAL_MS', 'MEDIA_WORKERS'):
+    os.environ[_name] = '0'
+
+from src.main import app as flask_app, init_database  # noqa: E402
+from src.models.user import db, User  # noqa: E402
+from src.models.video import Video  # noqa: E402
+from src.routes.auth import token_cache  # noqa: E402
+from src.utils.response_cache import response_cache  # noqa: E402
+from src.services.recommendations import ranked_feed_cache  # noqa: E402
+from src.services import discover  # noqa: E402
+
+
+def _remove_database():
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(_DB_PATH + suffix):
+            os.remove(_DB_PATH + suffix)
+
+
+@pytest.fixture
+def app():
+    _remove_database()
+    init_database()
+    with flask_app.app_context():
+        yield flask_app
+        db.session.remove()
+        db.engine.dispose()
+    response_cache.clear()
+    token_cache.clear()
+    ranked_feed_cache.clear()
+    discover._snapshot = None
+    _remove_database()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def count_queries(app):
+    """
+    Context manager collecting every statement sent to the database:
+
+        with count_queries() as statements:
+            ...
+        assert len(statements) == 2
+    """
+    @contextmanager
+    def counting():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return counting
+
+
+@pytest.fixture
+def make_user(app):
+    counter = iter(range(1, 1000000))
+
+    def make(**fields):
+        n = next(counter)
+        fields.setdefault('username', f'user{n}')
+        fields.setdefault('email', f'user{n}@example.com')
+        fields.setdefault('password_hash', 'unusable')
+        user = User(**fields)
+        db.session.add(user)
+        db.session.flush()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_video(app):
+    def make(user, **fields):
+        fields.setdefault('video_url', 'https://cdn.example.com/video.mp4')
+        fields.setdefault('thumbnail_url', 'https://cdn.example.com/video.jpg')
+        video = Video(user_id=user.id, **fields)
+        db.session.add(video)
+        db.session.flush()
+        return video
+    return make
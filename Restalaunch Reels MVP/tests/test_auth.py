@@ -0,0 +1,97 @@
+"""Token cache behaviour across processes, and password hashing under load."""
+from src.models.user import db
+from src.routes.auth import token_cache
+from src.utils.passwords import PasswordHasher, PasswordHasherBusy, password_hasher
+from werkzeug.security import generate_password_hash
+from sqlalchemy import text
+from datetime import datetime
+import os
+import threading
+
+
+def _register(client, username='cook'):
+    response = client.post('/api/auth/register', json={
+        'username': username, 'email': f'{username}@example.com', 'password': 'secret-1'
+    })
+    assert response.status_code == 201
+    return {'Authorization': f'Bearer {response.get_json()["token"]}'}
+
+
+def _update_elsewhere(statement, **params):
+    """Change a user the way another worker would: no ORM event fires here"""
+    db.session.execute(text(statement), {'now': datetime.utcnow(), **params})
+    db.session.commit()
+
+
+def test_cache_hit_sees_changes_made_by_other_processes(client):
+    headers = _register(client)
+    assert client.get('/api/auth/me', headers=headers).get_json()['user']['full_name'] is None
+    assert client.get('/api/auth/me', headers=headers).status_code == 200
+    assert token_cache.hits == 1
+
+    _update_elsewhere("UPDATE user SET full_name = 'Chef', updated_at = :now WHERE username = 'cook'")
+
+    assert client.get('/api/auth/me', headers=headers).get_json()['user']['full_name'] == 'Chef'
+    assert token_cache.stale == 1
+
+
+def test_deleted_user_is_rejected_despite_cached_token(client):
+    headers = _register(client)
+    assert client.get('/api/auth/me', headers=headers).status_code == 200
+
+    _update_elsewhere("DELETE FROM user WHERE username = 'cook'")
+
+    assert client.get('/api/auth/me', headers=headers).status_code == 401
+
+
+def test_cached_snapshot_omits_password_hash(client):
+    headers = _register(client)
+    client.get('/api/auth/me', headers=headers)
+
+    entries = list(token_cache._entries.values())
+    assert entries and all('password_hash' not in entry['user'] for entry in entries)
+
+    # The hash still loads on demand for a cached user
+    response = client.post('/api/auth/change-password', headers=headers, json={
+        'current_password': 'secret-1', 'new_password': 'secret-2'
+    })
+    assert response.status_code == 200
+    assert client.post('/api/auth/login', json={'username': 'cook', 'password': 'secret-2'}).status_code == 200
+
+
+def test_login_keeps_old_hash_when_the_pool_is_busy(client, monkeypatch):
+    _register(client)
+    old_hash = generate_password_hash('secret-1', 'pbkdf2:sha256:500')
+    _update_elsewhere("UPDATE user SET password_hash = :hash, updated_at = :now WHERE username = 'cook'", hash=old_hash)
+
+    def busy(password):
+        raise PasswordHasherBusy()
+
+    monkeypatch.setattr(password_hasher, 'hash', busy)
+    response = client.post('/api/auth/login', json={'username': 'cook', 'password': 'secret-1'})
+
+    assert response.status_code == 200
+    assert db.session.execute(text("SELECT password_hash FROM user WHERE username = 'cook'")).scalar() == old_hash
+
+
+def test_hash_pool_splits_half_the_cpus_between_processes(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 8)
+
+    assert PasswordHasher().workers == 4
+    assert PasswordHasher(processes=2).workers == 2
+    assert PasswordHasher(processes=9).workers == 1
+
+
+def test_rehashes_are_counted_by_the_hasher():
+    hasher = PasswordHasher(workers=2, queue_size=64, method='pbkdf2:sha256:1000')
+    threads = [threading.Thread(target=lambda: [hasher.rehash('secret') for _ in range(5)]) for _ in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        hasher.shutdown()
+
+    assert hasher.stats()['rehashed'] == 40
+    assert hasher.stats()['completed'] == 40
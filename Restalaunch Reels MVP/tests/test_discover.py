@@ -0,0 +1,55 @@
+"""The discover snapshot is built once, however many requests arrive together."""
+from src.services import discover
+from datetime import timedelta
+import threading
+import time
+
+
+def _count_builds(monkeypatch, delay=0.2):
+    builds = []
+    build = discover.build_discover_payload
+
+    def slow_build():
+        builds.append(threading.get_ident())
+        time.sleep(delay)
+        return build()
+
+    monkeypatch.setattr(discover, 'build_discover_payload', slow_build)
+    return builds
+
+
+def _get_concurrently(app, count):
+    responses = []
+
+    def get():
+        responses.append(app.test_client().get('/api/feed/discover').status_code)
+
+    threads = [threading.Thread(target=get) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def test_concurrent_first_requests_build_once(app, monkeypatch):
+    builds = _count_builds(monkeypatch)
+
+    assert _get_concurrently(app, 8) == [200] * 8
+    assert len(builds) == 1
+
+
+def test_stale_snapshot_starts_one_background_refresh(app, client, monkeypatch):
+    assert client.get('/api/feed/discover').status_code == 200
+    stale = discover._snapshot
+    stale.built_at -= timedelta(days=1)
+    builds = _count_builds(monkeypatch)
+
+    # Every request is answered from the stale snapshot without waiting
+    assert _get_concurrently(app, 8) == [200] * 8
+    deadline = time.monotonic() + 5
+    while discover._snapshot is stale and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(builds) == 1
+    assert discover._snapshot is not stale
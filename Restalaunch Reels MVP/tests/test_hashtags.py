@@ -0,0 +1,53 @@
+"""Hashtag index maintenance and trending."""
+from src.models.user import db
+from src.models.video import Video
+from src.models.hashtag import Hashtag, VideoHashtag
+from src.services.discover import build_discover_payload
+from datetime import datetime, timedelta
+
+
+def _usage():
+    return {tag.name: tag.usage_count for tag in Hashtag.query.all()}
+
+
+def test_editing_many_videos_loads_links_in_one_query(make_user, make_video, count_queries):
+    user = make_user()
+    videos = [make_video(user, hashtags='#tacos,#salsa') for _ in range(10)]
+    db.session.commit()
+    db.session.expire_all()
+    videos = Video.query.order_by(Video.id).all()
+
+    for video in videos:
+        video.set_hashtags_from_list(['tacos', 'birria'])
+    with count_queries() as statements:
+        db.session.flush()
+
+    selects = [statement for statement in statements if statement.lstrip().upper().startswith('SELECT')]
+    assert len(selects) <= 3  # Current links, wanted tags, tags with changed counts
+    db.session.commit()
+    assert _usage() == {'tacos': 10, 'salsa': 0, 'birria': 10}
+
+
+def test_deleting_videos_updates_usage_counts(make_user, make_video):
+    user = make_user()
+    videos = [make_video(user, hashtags='#tacos') for _ in range(3)]
+    db.session.commit()
+
+    db.session.delete(videos[0])
+    db.session.commit()
+    assert _usage() == {'tacos': 2}
+    assert VideoHashtag.query.count() == 2
+
+
+def test_trending_counts_recent_videos_not_recent_links(make_user, make_video):
+    user = make_user()
+    old = make_video(user, created_at=datetime.utcnow() - timedelta(days=30))
+    make_video(user, hashtags='#fresh')
+    db.session.commit()
+
+    # Tagging an old video creates a new link, but the video is not recent
+    old.set_hashtags_from_list(['stale'])
+    db.session.commit()
+
+    trending = build_discover_payload()['trending_hashtags']
+    assert trending == [{'hashtag': 'fresh', 'count': 1}]
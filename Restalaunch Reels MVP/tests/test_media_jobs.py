@@ -0,0 +1,143 @@
+"""Media job queue: enqueue, claim, complete, retry and lease expiry, with ffmpeg stubbed out."""
+from src.models.user import db
+from src.models.video import Video
+from src.models.media_job import MediaJob
+from src.services import media_jobs
+from src.services.media_jobs import claim_jobs, run_job, requeue_stale_jobs, PermanentMediaError, RETRY_BASE_SECONDS
+from datetime import datetime, timedelta
+import pytest
+
+SOURCE = 'a' * 64 + '.mp4'
+
+
+@pytest.fixture
+def uploaded(app, tmp_path, monkeypatch, make_user, make_video):
+    """An uploaded video whose file exists, with its probe and thumbnail jobs queued"""
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    (tmp_path / SOURCE).write_bytes(b'not really a video')
+    video = make_video(make_user(), video_url=f'/uploads/{SOURCE}', thumbnail_url=None)
+    db.session.commit()
+    return video
+
+
+def _jobs(video):
+    db.session.expire_all()
+    return {job.kind: job for job in MediaJob.query.filter_by(video_id=video.id)}
+
+
+def _probe_returns(monkeypatch, **metadata):
+    monkeypatch.setattr(media_jobs, 'probe_media', lambda source, config: {
+        'duration': 12, 'width': 1080, 'height': 1920, 'file_size': 18, **metadata
+    })
+
+
+def test_only_uploaded_videos_are_queued(uploaded, make_user, make_video):
+    assert sorted(_jobs(uploaded)) == ['probe', 'thumbnail']
+
+    with_thumbnail = make_video(make_user(), video_url=f'/uploads/{"b" * 64}.mp4')
+    external = make_video(make_user(), video_url='https://cdn.example.com/video.mp4')
+    db.session.commit()
+    assert sorted(_jobs(with_thumbnail)) == ['probe']
+    assert _jobs(external) == {}
+
+
+def test_each_job_is_claimed_by_one_worker(uploaded):
+    first = claim_jobs('worker-a', 10)
+    assert sorted(first) == sorted(job.id for job in _jobs(uploaded).values())
+    assert claim_jobs('worker-b', 10) == []
+    assert {(job.status, job.attempts, job.locked_by) for job in _jobs(uploaded).values()} == {('running', 1, 'worker-a')}
+
+
+def test_jobs_are_not_claimed_before_run_after(uploaded):
+    MediaJob.query.update({MediaJob.run_after: datetime.utcnow() + timedelta(minutes=5)})
+    db.session.commit()
+    assert claim_jobs('worker-a', 10) == []
+
+
+def test_probe_updates_the_video_and_queues_renditions(app, uploaded, monkeypatch):
+    monkeypatch.setitem(app.config, 'MEDIA_RENDITION_HEIGHTS', [720, 480, 2160])
+    _probe_returns(monkeypatch)
+    probe = _jobs(uploaded)['probe']
+    claim_jobs('worker-a', 10)
+
+    assert run_job(probe.id, 'worker-a')
+
+    jobs = MediaJob.query.filter_by(video_id=uploaded.id, kind='transcode').all()
+    assert sorted(job.get_options()['height'] for job in jobs) == [480, 720]
+    probe = _jobs(uploaded)['probe']
+    assert (probe.status, probe.locked_by, probe.result is not None) == ('done', None, True)
+    video = db.session.get(Video, uploaded.id)  # run_job closed the session
+    assert (video.duration, video.height) == (12, 1920)
+
+
+def test_finish_is_dropped_after_losing_the_lease(uploaded, monkeypatch):
+    _probe_returns(monkeypatch)
+    probe = _jobs(uploaded)['probe']
+    claim_jobs('worker-a', 10)
+    MediaJob.query.filter_by(id=probe.id).update({MediaJob.locked_by: 'worker-b'})
+    db.session.commit()
+
+    run_job(probe.id, 'worker-a')
+
+    assert _jobs(uploaded)['probe'].status == 'running'
+
+
+def test_failures_back_off_then_give_up(uploaded, monkeypatch):
+    def ffprobe_fails(source, config):
+        raise RuntimeError('ffprobe failed: moov atom not found')
+
+    monkeypatch.setattr(media_jobs, 'probe_media', ffprobe_fails)
+    probe = _jobs(uploaded)['probe']
+    MediaJob.query.filter_by(id=probe.id).update({MediaJob.max_attempts: 2})
+    db.session.commit()
+
+    claim_jobs('worker-a', 10)
+    before = datetime.utcnow()
+    assert not run_job(probe.id, 'worker-a')
+    probe = _jobs(uploaded)['probe']
+    assert (probe.status, probe.attempts, probe.locked_by) == ('queued', 1, None)
+    assert 'moov atom' in probe.last_error
+    assert probe.run_after >= before + timedelta(seconds=RETRY_BASE_SECONDS)
+    assert media_jobs.retry_delay(2) == 2 * RETRY_BASE_SECONDS
+
+    MediaJob.query.filter_by(id=probe.id).update({MediaJob.run_after: datetime.utcnow()})
+    db.session.commit()
+    claim_jobs('worker-a', 10)
+    assert not run_job(probe.id, 'worker-a')
+    assert _jobs(uploaded)['probe'].status == 'failed'
+
+
+def test_permanent_errors_are_not_retried(uploaded, monkeypatch):
+    def no_video_stream(source, config):
+        raise PermanentMediaError('File has no video stream')
+
+    monkeypatch.setattr(media_jobs, 'probe_media', no_video_stream)
+    probe = _jobs(uploaded)['probe']
+    claim_jobs('worker-a', 10)
+
+    assert not run_job(probe.id, 'worker-a')
+    probe = _jobs(uploaded)['probe']
+    assert (probe.status, probe.attempts) == ('failed', 1)
+
+
+def test_expired_leases_are_requeued_or_failed(uploaded):
+    jobs = _jobs(uploaded)
+    claim_jobs('worker-a', 10)
+    expired = datetime.utcnow() - timedelta(seconds=120)
+    MediaJob.query.update({MediaJob.locked_at: expired})
+    MediaJob.query.filter_by(id=jobs['thumbnail'].id).update({MediaJob.max_attempts: 1})
+    db.session.commit()
+
+    assert requeue_stale_jobs(60) == 2
+
+    jobs = _jobs(uploaded)
+    assert (jobs['probe'].status, jobs['probe'].locked_by) == ('queued', None)
+    assert jobs['thumbnail'].status == 'failed'
+    assert jobs['probe'].last_error == jobs['thumbnail'].last_error == 'Worker lease expired'
+    assert claim_jobs('worker-b', 10) == [jobs['probe'].id]
+
+
+def test_live_leases_are_kept(uploaded):
+    claim_jobs('worker-a', 10)
+    assert requeue_stale_jobs(60) == 0
+    assert {job.status for job in _jobs(uploaded).values()} == {'running'}
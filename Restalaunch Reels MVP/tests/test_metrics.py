@@ -0,0 +1,50 @@
+"""/metrics is private by default and reports every worker process."""
+from src.utils.metrics import RequestMetrics
+import os
+import subprocess
+import sys
+
+
+def _exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def _metrics(directory, pid):
+    metrics = RequestMetrics()
+    metrics.pid = pid
+    metrics.configure(str(directory))
+    metrics.register_source('cache', lambda: {'entries': pid})
+    return metrics
+
+
+def test_metrics_endpoint_needs_a_token(app, client, monkeypatch):
+    assert client.get('/metrics').status_code == 404
+
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'scrape-me')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+    assert response.status_code == 200
+    assert 'restalaunch_request_duration_seconds_count' in response.get_data(as_text=True)
+
+
+def test_render_sums_workers_and_keeps_exited_totals(tmp_path):
+    exited = _metrics(tmp_path, _exited_pid())
+    exited.record('feed.get_for_you_feed', 'GET', 200, 0.01, 2, 0.001, 100)
+    exited.write_snapshot()
+
+    other = _metrics(tmp_path, os.getppid())
+    other.record('feed.get_for_you_feed', 'GET', 200, 0.02, 2, 0.001, 100)
+    other.write_snapshot()
+
+    this = _metrics(tmp_path, os.getpid())
+    this.record('feed.get_for_you_feed', 'GET', 200, 0.03, 2, 0.001, 100)
+    lines = this.render().splitlines()
+
+    assert 'restalaunch_request_duration_seconds_count{endpoint="feed.get_for_you_feed",method="GET",status="200"} 3' in lines
+    assert sorted(line for line in lines if line.startswith('restalaunch_cache_entries')) == sorted(
+        f'restalaunch_cache_entries{{pid="{pid}"}} {float(pid)}' for pid in (os.getpid(), os.getppid())
+    )
+    assert sorted(os.listdir(tmp_path)) == sorted(['archive.json', 'archive.lock', f'{os.getppid()}.json'])
@@ -0,0 +1,67 @@
+"""Tables from before ON DELETE actions are rebuilt in place."""
+from src.models.user import db
+from src.models.video import Video, Like
+from src.models.search_index import SEARCH_INDEXES, build_match_query
+from src.models.migrations import run_migrations
+from sqlalchemy import text
+
+
+def _strip_delete_actions(tables):
+    """Rewrite tables' schema the way an older create_all() left them"""
+    db.session.commit()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('PRAGMA writable_schema = ON')
+        for table in tables:
+            connection.execute(text(
+                "UPDATE sqlite_master SET sql = replace(replace(sql, ' ON DELETE CASCADE', ''), ' ON DELETE SET NULL', '') "
+                "WHERE type = 'table' AND name = :name"
+            ), {'name': table})
+        connection.exec_driver_sql('PRAGMA writable_schema = OFF')
+    db.session.remove()
+    db.engine.dispose()
+    db.session.execute(text("DELETE FROM schema_migration WHERE name = '0016_foreign_key_actions'"))
+    db.session.commit()
+
+
+def _delete_actions(table):
+    return {row[6] for row in db.session.execute(text(f'PRAGMA foreign_key_list("{table}")'))}
+
+
+def test_rebuild_keeps_rows_indexes_and_triggers(app, make_user, make_video):
+    fan = make_user()
+    video = make_video(make_user(), title='Birria tacos')
+    db.session.add(Like(user_id=fan.id, video_id=video.id))
+    db.session.commit()
+    video_id = video.id
+    indexes = db.session.execute(text("SELECT name FROM sqlite_master WHERE tbl_name = 'video' ORDER BY name")).scalars().all()
+
+    _strip_delete_actions(['video', 'like'])
+    assert _delete_actions('like') == {'NO ACTION'}
+    run_migrations()
+
+    assert _delete_actions('like') == {'CASCADE'}
+    assert _delete_actions('video') == {'CASCADE', 'SET NULL'}
+    assert db.session.execute(text("SELECT name FROM sqlite_master WHERE tbl_name = 'video' ORDER BY name")).scalars().all() == indexes
+    assert SEARCH_INDEXES['videos'].count(build_match_query('birria')) == 1
+
+    db.session.execute(text('DELETE FROM video WHERE id = :id'), {'id': video_id})
+    db.session.commit()
+    assert Like.query.count() == 0
+    assert SEARCH_INDEXES['videos'].count(build_match_query('birria')) == 0
+
+
+def test_rebuild_applies_delete_actions_to_orphans(app, make_user, make_video):
+    video = make_video(make_user())
+    db.session.add(Like(user_id=make_user().id, video_id=video.id))
+    db.session.commit()
+    video_id = video.id
+    _strip_delete_actions(['like'])
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+        connection.exec_driver_sql(f'DELETE FROM video WHERE id = {video_id}')
+    db.engine.dispose()
+
+    run_migrations()
+
+    assert Like.query.count() == 0
+    assert Video.query.count() == 0
@@ -0,0 +1,100 @@
+"""Keyset cursors walk a feed once, in order, without COUNT or OFFSET."""
+from datetime import datetime
+
+from src.models.user import db
+from src.models.video import Video
+from src.utils.pagination import keyset_paginate, encode_cursor, decode_cursor
+
+
+def _walk(client, url, per_page):
+    ids, cursor, pages = [], '', 0
+    while cursor is not None:
+        response = client.get(url, query_string={'per_page': per_page, 'cursor': cursor})
+        assert response.status_code == 200
+        body = response.get_json()
+        assert 'total' not in body
+        ids += [video['id'] for video in body['videos']]
+        cursor = body['next_cursor']
+        pages += 1
+    return ids, pages
+
+
+def test_cursor_pages_cover_the_feed_in_order(client, make_user, make_video):
+    author = make_user()
+    videos = [make_video(author, cuisine_type='Thai', like_count=n // 3) for n in range(25)]
+    make_video(author, cuisine_type='Greek', like_count=100)
+    db.session.commit()
+
+    ids, pages = _walk(client, '/api/feed/cuisine/thai', 10)
+
+    # Ties on engagement fall back to the id, newest first
+    expected = sorted(videos, key=lambda video: (video.like_count, video.id), reverse=True)
+    assert ids == [video.id for video in expected]
+    assert pages == 3
+
+
+def test_cursor_is_not_shifted_by_new_rows(client, make_user, make_video):
+    author = make_user()
+    for n in range(6):
+        make_video(author, cuisine_type='Thai', like_count=n)
+    db.session.commit()
+
+    first = client.get('/api/feed/cuisine/thai', query_string={'per_page': 3, 'cursor': ''}).get_json()
+    make_video(author, cuisine_type='Thai', like_count=50)
+    db.session.commit()
+    second = client.get('/api/feed/cuisine/thai', query_string={'per_page': 3, 'cursor': first['next_cursor']}).get_json()
+
+    first_ids = [video['id'] for video in first['videos']]
+    second_ids = [video['id'] for video in second['videos']]
+    assert not set(first_ids) & set(second_ids)
+    assert len(first_ids + second_ids) == 6
+    assert second['next_cursor'] is None
+
+
+def test_page_mode_still_reports_totals(client, make_user, make_video):
+    author = make_user()
+    for _ in range(5):
+        make_video(author, cuisine_type='Thai')
+    db.session.commit()
+
+    body = client.get('/api/feed/cuisine/thai', query_string={'per_page': 2, 'page': 3}).get_json()
+
+    assert body['total'] == 5
+    assert body['pages'] == 3
+    assert body['current_page'] == 3
+    assert len(body['videos']) == 1
+    assert 'next_cursor' not in body
+
+
+def test_invalid_cursors_are_rejected(client):
+    for cursor in ('not-base64!', encode_cursor([1]), encode_cursor({'id': 1})):
+        response = client.get('/api/feed/cuisine/thai', query_string={'cursor': cursor})
+        assert response.status_code == 400
+
+
+def test_datetime_keys_round_trip(app, make_user, make_video):
+    author = make_user()
+    moment = datetime(2024, 5, 1, 12, 30)
+    videos = [make_video(author, created_at=moment) for _ in range(4)]
+    db.session.commit()
+    sort_keys = [Video.created_at, Video.id]
+
+    first, cursor = keyset_paginate(Video.query, sort_keys, 2, '')
+    assert decode_cursor(cursor, sort_keys) == [moment, first[-1].id]
+    second, cursor = keyset_paginate(Video.query, sort_keys, 2, cursor)
+
+    assert [video.id for video in first + second] == [video.id for video in reversed(videos)]
+    assert cursor is None
+
+
+def test_cursor_pages_are_one_query_without_count(app, make_user, make_video, count_queries):
+    author = make_user()
+    ids = [make_video(author).id for _ in range(5)]
+    db.session.commit()
+
+    with count_queries() as statements:
+        items, cursor = keyset_paginate(Video.query, [Video.id], 2, encode_cursor([ids[3]]))
+
+    assert [video.id for video in items] == [ids[2], ids[1]]
+    assert len(statements) == 1
+    assert 'count(' not in statements[0].lower()
@@ -0,0 +1,49 @@
+"""Profiling sessions reach every worker and report output they could not write."""
+from src.utils.profiler import SamplingProfiler, profiler, POLL_INTERVAL
+import time
+
+ADMIN = {'X-Admin-Token': 'admin-secret'}
+
+
+def _wait_until(condition, timeout=5 * POLL_INTERVAL):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_other_workers_join_and_leave_the_session(tmp_path):
+    # Two profilers in one directory stand in for two gunicorn workers
+    serving, other = SamplingProfiler(), SamplingProfiler()
+    session = serving.start('feed.search_content', duration=60, output_dir=str(tmp_path))
+    assert serving.start('feed.search_content', duration=60, output_dir=str(tmp_path)) is None
+
+    other.poll(str(tmp_path))
+    assert other.session.id == session.id
+    assert other.status(str(tmp_path))['running']
+
+    stopped = serving.stop(str(tmp_path))
+    assert stopped is session and stopped.path is not None
+    _wait_until(lambda: other.session is None)
+    assert other.last_session.id == session.id and other.last_session.path is not None
+    assert serving.stop(str(tmp_path)) is None
+
+
+def test_stop_reports_a_profile_that_could_not_be_written(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'ADMIN_TOKEN', 'admin-secret')
+
+    def disk_full(session):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(profiler, '_write', disk_full)
+    response = client.post('/api/admin/profiler', json={'endpoint': 'feed.search_content'}, headers=ADMIN)
+    assert response.status_code == 201
+
+    response = client.post('/api/admin/profiler/stop', headers=ADMIN)
+    assert response.status_code == 500
+    assert 'No space left on device' in response.get_json()['error']
+    assert response.get_json()['session']['output'] is None
+
+    assert client.post('/api/admin/profiler/stop', headers=ADMIN).status_code == 409
+    status = client.get('/api/admin/profiler', headers=ADMIN).get_json()
+    assert not status['running'] and status['last_session']['error']
@@ -0,0 +1,31 @@
+"""The query-plan check finds no full table scans on a populated schema."""
+from src.models.user import db
+from src.models.video import Comment
+from src.utils.query_plans import check_query_plans
+
+
+def test_no_unexpected_table_scans(app, make_user, make_video):
+    fan, creator = make_user(), make_user()
+    fan.follow(creator)
+    for n in range(3):
+        video = make_video(creator, cuisine_type='Mexican', hashtags='#tacos,#birria', title=f'Birria {n}')
+    root = Comment(user_id=fan.id, video_id=video.id, content='root')
+    db.session.add(root)
+    db.session.flush()
+    db.session.add(Comment(user_id=creator.id, video_id=video.id, parent_id=root.id, content='reply'))
+    db.session.commit()
+
+    failures = check_query_plans(app)
+
+    assert [(label, table) for label, table, _, _ in failures] == []
+
+
+def test_cuisine_feed_matches_whole_normalized_name(client, make_user, make_video):
+    creator = make_user()
+    for cuisine in ('Mexican', ' mexican ', 'Mexican Fusion', 'Thai'):
+        make_video(creator, cuisine_type=cuisine)
+    db.session.commit()
+
+    response = client.get('/api/feed/cuisine/MEXICAN')
+
+    assert sorted(video['cuisine_type'] for video in response.get_json()['videos']) == [' mexican ', 'Mexican']
@@ -0,0 +1,88 @@
+"""Personalized for-you sessions page consistently across worker processes."""
+from src.models.user import db
+from src.models.video import Video
+from src.models.feed_session import FeedSession, store_feed_session, load_feed_session
+from src.services.recommendations import ranked_feed_cache
+from src.utils.pagination import encode_cursor, decode_cursor
+
+
+def _page(client, user, cursor):
+    response = client.get('/api/feed/for-you', query_string={'user_id': user.id, 'per_page': 10, 'cursor': cursor})
+    assert response.status_code == 200
+    body = response.get_json()
+    return [video['id'] for video in body['videos']], body['next_cursor']
+
+
+def test_pages_come_from_one_stored_ranking(client, make_user, make_video):
+    viewer = make_user()
+    for n in range(30):
+        make_video(make_user(), rank_score=float(n))
+    db.session.commit()
+
+    first, cursor = _page(client, viewer, '')
+
+    # Another worker serves the next page after the ranking inputs changed
+    ranked_feed_cache.clear()
+    for video in Video.query.all():
+        video.rank_score = -video.rank_score
+    make_video(make_user(), rank_score=1000.0)
+    db.session.commit()
+
+    second, cursor = _page(client, viewer, cursor)
+    third, cursor = _page(client, viewer, cursor)
+
+    seen = first + second + third
+    assert cursor is None
+    assert len(seen) == len(set(seen)) == 30
+    assert FeedSession.query.count() == 1
+
+
+def test_first_stored_ranking_wins(app, make_user):
+    user = make_user()
+    db.session.commit()
+
+    assert store_feed_session(user.id, 'k', [3, 1, 2], ttl=60) == [3, 1, 2]
+    assert store_feed_session(user.id, 'k', [9, 8], ttl=60) == [3, 1, 2]
+    assert load_feed_session('k') == [3, 1, 2]
+
+
+def test_cursors_only_resume_sessions_the_server_started(client, make_user, make_video):
+    viewer, other = make_user(), make_user()
+    for n in range(15):
+        make_video(make_user(), rank_score=float(n))
+    db.session.commit()
+    _, cursor = _page(client, viewer, '')
+    seed, offset, lat, lng, signature = decode_cursor(cursor, range(5))
+
+    forged = [
+        encode_cursor([seed + 1, offset, lat, lng, signature]),
+        encode_cursor([seed, offset, 40.7, -74.0, signature]),
+        encode_cursor([2 ** 40, offset, lat, lng, signature]),
+        encode_cursor([seed, offset]),
+    ]
+    for bad in forged:
+        response = client.get('/api/feed/for-you', query_string={'user_id': viewer.id, 'cursor': bad})
+        assert response.status_code == 400
+    # A cursor is bound to the user it was issued to
+    response = client.get('/api/feed/for-you', query_string={'user_id': other.id, 'cursor': cursor})
+    assert response.status_code == 400
+    assert FeedSession.query.count() == 1
+
+
+def test_sessions_are_keyed_by_a_rounded_location(client, make_user, make_video):
+    viewer = make_user()
+    for n in range(15):
+        make_video(make_user(), rank_score=float(n))
+    db.session.commit()
+
+    response = client.get('/api/feed/for-you', query_string={
+        'user_id': viewer.id, 'per_page': 10, 'cursor': '', 'lat': 40.712776, 'lng': -74.005974
+    })
+    cursor = response.get_json()['next_cursor']
+    assert decode_cursor(cursor, range(5))[2:4] == [40.71, -74.01]
+    (session_key,) = db.session.execute(db.select(FeedSession.session_key)).scalars()
+    assert session_key.endswith(':40.71:-74.01')
+
+    # Later pages keep the session's location whatever the request says
+    second, _ = _page(client, viewer, cursor)
+    assert len(second) == 5 and FeedSession.query.count() == 1
@@ -0,0 +1,102 @@
+"""Anonymous feed responses: hits, ETags, invalidation on commit and across workers."""
+from src.models.user import db
+from src.models.video import Video
+from src.utils import response_cache
+from src.utils.response_cache import ResponseCache, CachedResponse
+import time
+
+
+def test_repeat_requests_hit_and_revalidate(client, make_user, make_video):
+    make_video(make_user(), cuisine_type='Mexican')
+    db.session.commit()
+
+    first = client.get('/api/feed/cuisine/mexican')
+    assert first.status_code == 200 and first.headers['X-Cache'] == 'MISS'
+    second = client.get('/api/feed/cuisine/mexican')
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_data() == first.get_data() and second.headers['ETag'] == first.headers['ETag']
+    assert second.headers['Cache-Control'].startswith('public, max-age=')
+
+    revalidated = client.get('/api/feed/cuisine/mexican', headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304 and revalidated.get_data() == b''
+
+
+def test_personalized_requests_are_not_cached(client, make_user):
+    user = make_user()
+    db.session.commit()
+    assert 'X-Cache' not in client.get(f'/api/feed/for-you?user_id={user.id}').headers
+
+
+def test_committed_video_writes_invalidate_their_tags(client, make_user, make_video):
+    creator = make_user()
+    make_video(creator, cuisine_type='Mexican')
+    db.session.commit()
+    client.get('/api/feed/cuisine/mexican')
+    client.get('/api/feed/cuisine/thai')
+
+    video = make_video(creator, cuisine_type=' mexican ')
+    assert client.get('/api/feed/cuisine/mexican').headers['X-Cache'] == 'HIT'  # Not committed yet
+    db.session.commit()
+
+    response = client.get('/api/feed/cuisine/mexican')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert video.id in [item['id'] for item in response.get_json()['videos']]
+    assert client.get('/api/feed/cuisine/thai').headers['X-Cache'] == 'HIT'
+
+
+def test_rolled_back_writes_keep_the_cache(client, make_user, make_video):
+    make_video(make_user(), cuisine_type='Mexican')
+    db.session.commit()
+    client.get('/api/feed/cuisine/mexican')
+
+    Video.query.update({Video.cuisine_type: 'Thai'})
+    make_video(make_user(), cuisine_type='Mexican')
+    db.session.rollback()
+
+    assert client.get('/api/feed/cuisine/mexican').headers['X-Cache'] == 'HIT'
+
+
+def _workers(tmp_path):
+    # Caches sharing one log stand in for gunicorn workers
+    path = str(tmp_path / 'invalidations.log')
+    caches = ResponseCache(), ResponseCache()
+    for cache in caches:
+        cache.configure(path)
+    return caches
+
+
+KEY = ('feed.get_cuisine_feed', (('cuisine_type', 'thai'),), ())
+
+
+def _entry():
+    return CachedResponse(b'[]', 'application/json', time.time() + 60, frozenset({('cuisine', 'thai')}))
+
+
+def test_invalidation_reaches_other_workers(tmp_path):
+    writer, other = _workers(tmp_path)
+    key, entry = KEY, _entry()
+
+    generation = other.generation
+    assert other.put(key, entry, generation)
+    assert other.get(key) is entry
+
+    writer.invalidate({('cuisine', 'mexican')})
+    assert other.get(key) is entry
+    writer.invalidate({('cuisine', 'thai')})
+    assert other.get(key) is None
+    assert not other.put(key, entry, generation)  # Rendered before the invalidation
+    assert other.put(key, entry, other.generation)
+    assert other.get(key) is entry
+
+
+def test_a_replaced_log_empties_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, 'MAX_INVALIDATION_LOG_SIZE', 1)
+    writer, other = _workers(tmp_path)
+    assert other.put(KEY, _entry(), other.generation)
+
+    writer.invalidate({('cuisine', 'mexican')})  # Replaces the log right after appending
+
+    assert other.get(KEY) is None
+    writer.invalidate({('cuisine', 'mexican')})
+    assert other.put(KEY, _entry(), other.generation)
+    assert other.get(KEY) is not None
@@ -0,0 +1,114 @@
+"""Search ranks through the FTS5 indexes, which triggers keep current."""
+from src.models.user import db
+from src.models.vendor import Vendor
+from src.models.search_index import build_match_query
+
+
+def _search(client, **params):
+    response = client.get('/api/feed/search', query_string=params)
+    assert response.status_code == 200
+    return response.get_json()['results']
+
+
+def _ids(section):
+    return [item['id'] for item in section['items']]
+
+
+def test_match_query_prefixes_every_word():
+    assert build_match_query('Pad  Thai!') == '"pad"* "thai"*'
+    assert build_match_query(' ?! ') is None
+
+
+def test_words_match_as_prefixes_in_any_column(client, make_user, make_video):
+    author = make_user()
+    noodles = make_video(author, title='Pad thai noodles')
+    tagged = make_video(author, title='Lunch rush', hashtags='#thaifood')
+    make_video(author, title='Tacos al pastor')
+    db.session.commit()
+
+    results = _search(client, q='tha', type='videos')
+
+    assert sorted(_ids(results['videos'])) == sorted([noodles.id, tagged.id])
+    assert results['videos']['total'] == 2
+
+
+def test_title_matches_outrank_description_matches(client, make_user, make_video):
+    author = make_user()
+    in_description = make_video(author, title='Friday special', description='Slow cooked birria')
+    in_title = make_video(author, title='Birria tacos')
+    db.session.commit()
+
+    results = _search(client, q='birria', type='videos')
+
+    assert _ids(results['videos']) == [in_title.id, in_description.id]
+
+
+def test_inactive_rows_are_left_out(client, make_user, make_video):
+    author = make_user()
+    make_video(author, title='Hidden dumplings', is_active=False)
+    shown = make_video(author, title='Steamed dumplings')
+    db.session.add(Vendor(
+        user_id=author.id, business_name='Dumpling House', business_type='restaurant', is_active=False
+    ))
+    db.session.commit()
+
+    results = _search(client, q='dumpling')
+
+    assert _ids(results['videos']) == [shown.id]
+    assert results['videos']['total'] == 1
+    assert results['vendors']['total'] == 0
+
+
+def test_index_follows_updates_and_deletes(client, make_user, make_video):
+    author = make_user()
+    video = make_video(author, title='Jerk chicken')
+    db.session.commit()
+    assert _ids(_search(client, q='jerk', type='videos')['videos']) == [video.id]
+
+    video.title = 'Oxtail stew'
+    db.session.commit()
+    assert _ids(_search(client, q='jerk', type='videos')['videos']) == []
+    assert _ids(_search(client, q='oxtail', type='videos')['videos']) == [video.id]
+
+    db.session.delete(video)
+    db.session.commit()
+    assert _ids(_search(client, q='oxtail', type='videos')['videos']) == []
+
+
+def test_users_and_vendors_are_searched(client, make_user):
+    chef = make_user(username='chefmaria', full_name='Maria Lopez')
+    vendor = Vendor(user_id=chef.id, business_name='Maria Tamales', business_type='street_vendor')
+    db.session.add(vendor)
+    db.session.commit()
+
+    results = _search(client, q='maria')
+
+    assert _ids(results['users']) == [chef.id]
+    assert _ids(results['vendors']) == [vendor.id]
+
+
+def test_cursor_pages_cover_every_match_once(client, make_user, make_video):
+    author = make_user()
+    videos = [make_video(author, title=f'Ramen bowl {n}') for n in range(7)]
+    make_video(author, title='Ramen', description='ramen ramen')
+    db.session.commit()
+
+    ids, cursor, pages = [], '', 0
+    while cursor is not None:
+        section = _search(client, q='ramen', type='videos', per_page=3, cursor=cursor)['videos']
+        assert 'total' not in section
+        ids += _ids(section)
+        cursor = section['next_cursor']
+        pages += 1
+
+    assert len(ids) == len(set(ids)) == len(videos) + 1
+    assert pages == 3
+
+
+def test_search_requires_a_query(client):
+    assert client.get('/api/feed/search', query_string={'q': '  '}).status_code == 400
+
+
+def test_search_rejects_a_bad_cursor(client):
+    response = client.get('/api/feed/search', query_string={'q': 'ramen', 'type': 'videos', 'cursor': 'nope!'})
+    assert response.status_code == 400
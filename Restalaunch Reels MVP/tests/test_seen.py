@@ -0,0 +1,45 @@
+"""Seen filters must keep every id when requests for one user overlap."""
+from src.models.user import db
+from src.models.seen import UserSeenFilter, record_seen, load_seen_filters, was_seen
+from src.services.counters import record_view
+import threading
+
+
+def test_concurrent_records_keep_every_id(app, make_user):
+    user_id = make_user().id
+    db.session.commit()
+    batches = [list(range(start, start + 20)) for start in range(1, 161, 20)]
+    errors = []
+    barrier = threading.Barrier(len(batches))
+
+    def record(video_ids):
+        with app.app_context():
+            try:
+                barrier.wait()
+                record_seen(user_id, video_ids)
+                db.session.commit()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=record, args=(batch,)) for batch in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    db.session.expire_all()
+    filters = load_seen_filters(user_id)
+    assert all(was_seen(filters, video_id) for batch in batches for video_id in batch)
+    assert db.session.get(UserSeenFilter, user_id).current_items == 160
+
+
+def test_views_are_recorded_as_seen(app, make_user, make_video):
+    viewer = make_user()
+    video = make_video(make_user())
+    record_view(video, viewer.id)
+    db.session.commit()
+
+    assert was_seen(load_seen_filters(viewer.id), video.id)
@@ -0,0 +1,109 @@
+"""The batched serializers must not issue more queries as the page grows."""
+from src.models.user import db
+from src.models.vendor import Vendor, Review
+from src.models.video import Video, Comment
+from src.models.serializers import (
+    serialize_videos, serialize_comments, serialize_comment_threads, serialize_reviews
+)
+import pytest
+
+PAGE_SIZES = (5, 20)
+
+
+def _fresh(model, ids):
+    """Reload rows the way a route would, so nothing is served from the identity map"""
+    db.session.expire_all()
+    return model.query.filter(model.id.in_(ids)).order_by(model.id).all()
+
+
+@pytest.mark.parametrize('page_size', PAGE_SIZES)
+def test_serialize_videos_loads_creators_in_one_query(page_size, make_user, make_video, count_queries):
+    ids = [make_video(make_user()).id for _ in range(page_size)]
+    db.session.commit()
+    videos = _fresh(Video, ids)
+
+    with count_queries() as statements:
+        results = serialize_videos(videos)
+
+    assert len(statements) == 1
+    assert [result['creator']['id'] for result in results] == [video.user_id for video in videos]
+
+
+@pytest.mark.parametrize('page_size', PAGE_SIZES)
+def test_serialize_comments_with_replies(page_size, make_user, make_video, count_queries):
+    video = make_video(make_user())
+    ids = []
+    for _ in range(page_size):
+        comment = Comment(user_id=make_user().id, video_id=video.id, content='root')
+        db.session.add(comment)
+        db.session.flush()
+        db.session.add(Comment(user_id=make_user().id, video_id=video.id, parent_id=comment.id, content='reply'))
+        ids.append(comment.id)
+    db.session.commit()
+    comments = _fresh(Comment, ids)
+
+    with count_queries() as statements:
+        results = serialize_comments(comments, include_replies=True)
+
+    assert len(statements) == 2  # Replies, then every user on the page
+    assert all(len(result['replies']) == 1 and result['replies'][0]['user'] for result in results)
+
+
+@pytest.mark.parametrize('page_size', PAGE_SIZES)
+def test_serialize_comment_threads(page_size, make_user, make_video, count_queries):
+    video = make_video(make_user())
+    ids = []
+    for _ in range(page_size):
+        root = Comment(user_id=make_user().id, video_id=video.id, content='root')
+        db.session.add(root)
+        db.session.flush()
+        for _ in range(4):
+            db.session.add(Comment(user_id=make_user().id, video_id=video.id, parent_id=root.id, content='reply'))
+        ids.append(root.id)
+    db.session.commit()
+    roots = _fresh(Comment, ids)
+
+    with count_queries() as statements:
+        results = serialize_comment_threads(roots, reply_limit=3)
+
+    assert len(statements) == 2
+    assert all(result['reply_count'] == 4 and len(result['replies']) == 3 for result in results)
+    assert all(result['replies_next_cursor'] for result in results)
+
+
+@pytest.mark.parametrize('page_size', PAGE_SIZES)
+def test_serialize_reviews(page_size, make_user, count_queries):
+    vendor = Vendor(user_id=make_user(is_vendor=True).id, business_name='Taqueria', business_type='food_truck')
+    db.session.add(vendor)
+    db.session.flush()
+    ids = []
+    for _ in range(page_size):
+        review = Review(vendor_id=vendor.id, user_id=make_user().id, rating=4)
+        db.session.add(review)
+        db.session.flush()
+        ids.append(review.id)
+    db.session.commit()
+    reviews = _fresh(Review, ids)
+
+    with count_queries() as statements:
+        results = serialize_reviews(reviews)
+
+    assert len(statements) == 1
+    assert all(result['user'] for result in results)
+
+
+@pytest.mark.parametrize('path', ['/api/feed/for-you', '/api/feed/cuisine/mexican'])
+def test_feed_pages_use_fixed_query_count(path, client, make_user, make_video, count_queries):
+    for _ in range(max(PAGE_SIZES)):
+        make_video(make_user(), cuisine_type='mexican')
+    db.session.commit()
+
+    counts = []
+    for page_size in PAGE_SIZES:
+        with count_queries() as statements:
+            response = client.get(f'{path}?per_page={page_size}&cursor=')
+        assert response.status_code == 200
+        assert len(response.get_json()['videos']) == page_size
+        counts.append(len(statements))
+
+    assert counts[0] == counts[1]
@@ -0,0 +1,100 @@
+"""R*Tree bounding boxes and the local feed's radius and ordering."""
+from src.models.user import db
+from src.models.vendor import Vendor
+from src.models.spatial import (
+    bounding_boxes, ids_within_box, nearby_vendors, haversine_km, vendor_location_index, video_location_index
+)
+from sqlalchemy import select
+import pytest
+
+
+@pytest.fixture
+def make_vendor(app, make_user):
+    def make(lat, lng, **fields):
+        vendor = Vendor(
+            user_id=make_user().id, business_name='Stand', business_type='street_vendor',
+            latitude=lat, longitude=lng, **fields
+        )
+        db.session.add(vendor)
+        db.session.flush()
+        return vendor
+    return make
+
+
+def _ids(index, lat, lng, radius_km):
+    return set(db.session.execute(ids_within_box(index, lat, lng, radius_km)).scalars())
+
+
+def test_boxes_split_at_the_antimeridian():
+    (box,) = bounding_boxes(10.0, 0.0, 50)
+    assert box[2] < 0 < box[3]
+
+    east, west = bounding_boxes(10.0, 179.9, 50)
+    assert east[2] < 179.9 and east[3] == 180.0
+    assert west[2] == -180.0 and -180.0 < west[3] < -179.0
+
+    west, east = bounding_boxes(-10.0, -179.9, 50)
+    assert west[2] == -180.0 and east[3] == 180.0
+
+    assert bounding_boxes(89.9, 0.0, 50) == [(pytest.approx(89.45, abs=0.01), 90.0, -180.0, 180.0)]
+
+
+def test_box_lookup_reaches_across_the_antimeridian(make_vendor):
+    here = make_vendor(10.0, 179.9)
+    across = make_vendor(10.0, -179.9)  # About 22 km east
+    make_vendor(10.0, 179.0)  # About 99 km west
+    make_vendor(10.0, -179.0)
+    db.session.commit()
+
+    assert _ids(vendor_location_index, 10.0, 179.9, 50) == {here.id, across.id}
+    assert _ids(vendor_location_index, 10.0, -179.9, 50) == {here.id, across.id}
+    assert [vendor.id for vendor in nearby_vendors(10.0, 179.95, 50)] == [here.id, across.id]
+
+
+def test_box_index_follows_moved_and_deleted_rows(make_user, make_video):
+    video = make_video(make_user(), latitude=40.7, longitude=-74.0)
+    db.session.commit()
+    assert _ids(video_location_index, 40.7, -74.0, 5) == {video.id}
+
+    video.latitude, video.longitude = 34.05, -118.25
+    db.session.commit()
+    assert _ids(video_location_index, 40.7, -74.0, 5) == set()
+    assert _ids(video_location_index, 34.05, -118.25, 5) == {video.id}
+
+    db.session.delete(video)
+    db.session.commit()
+    assert db.session.execute(select(video_location_index.c.id)).all() == []
+
+
+def test_local_feed_filters_by_radius_and_orders_by_distance(client, make_user, make_video, make_vendor):
+    creator = make_user()
+    near_vendor = make_vendor(40.70, -74.00)
+    far_vendor = make_vendor(40.70, -73.80)  # About 17 km east
+    closed_vendor = make_vendor(40.70, -74.00, is_active=False)
+    own_location = make_video(creator, latitude=40.72, longitude=-74.00)  # About 2.2 km north
+    at_vendor = make_video(creator, vendor_id=near_vendor.id)
+    moved_away = make_video(creator, vendor_id=near_vendor.id, latitude=41.5, longitude=-74.0)
+    make_video(creator, vendor_id=far_vendor.id)
+    make_video(creator, vendor_id=closed_vendor.id)
+    make_video(creator, latitude=40.70, longitude=-74.00, is_active=False)
+    db.session.commit()
+
+    response = client.get('/api/feed/local?lat=40.70&lng=-74.00&radius=10')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [video['id'] for video in body['videos']] == [at_vendor.id, own_location.id]
+    assert moved_away.id not in [video['id'] for video in body['videos']]
+    assert body['local_vendors_count'] == 1
+
+
+def test_local_feed_reaches_across_the_antimeridian(client, make_user, make_video):
+    creator = make_user()
+    across = make_video(creator, latitude=-17.0, longitude=-179.95)
+    here = make_video(creator, latitude=-17.0, longitude=179.9)
+    db.session.commit()
+
+    body = client.get('/api/feed/local?lat=-17.0&lng=179.97&radius=50').get_json()
+
+    assert [video['id'] for video in body['videos']] == [here.id, across.id]
+    assert haversine_km(-17.0, 179.97, -17.0, -179.95) < 10
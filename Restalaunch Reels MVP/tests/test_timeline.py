@@ -0,0 +1,81 @@
+"""Following feeds across push/pull fan-out mode changes."""
+from src.models.user import db
+from src.models.timeline import TimelineEntry, following_feed_query
+from src.models import timeline
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def small_thresholds(monkeypatch):
+    monkeypatch.setattr(timeline, 'FANOUT_MAX_FOLLOWERS', 3)
+    monkeypatch.setattr(timeline, 'FANOUT_RESUME_FOLLOWERS', 2)
+
+
+def _feed(user):
+    query, sort_keys = following_feed_query(user.id)
+    return [video.id for video in query.order_by(*[key.desc() for key in sort_keys])]
+
+
+def _pulled(user):
+    db.session.refresh(user)
+    return user.timeline_pulled_at is not None
+
+
+def test_videos_posted_while_pulled_survive_the_switch_back(make_user, make_video):
+    creator = make_user()
+    early = make_video(creator)
+    fans = [make_user() for _ in range(3)]
+    for fan in fans:
+        fan.follow(creator)
+    db.session.commit()
+    assert _pulled(creator)
+
+    late = make_video(creator)
+    latecomer = make_user()
+    latecomer.follow(creator)  # Not backfilled: the creator is pulled
+    db.session.commit()
+    assert TimelineEntry.query.filter_by(video_id=late.id).count() == 0
+    assert _feed(fans[0]) == [late.id, early.id]
+
+    # 4 -> 3 -> 2 followers: still at or above the resume limit, so still pulled
+    fans[2].unfollow(creator)
+    fans[1].unfollow(creator)
+    db.session.commit()
+    assert _pulled(creator)
+
+    # 2 -> 1 follower crosses below it: pushed again, with timelines repaired
+    latecomer.unfollow(creator)
+    db.session.commit()
+    assert not _pulled(creator)
+    assert TimelineEntry.query.filter_by(user_id=fans[0].id).count() == 2
+    assert _feed(fans[0]) == [late.id, early.id]
+
+    # New videos are pushed again
+    newest = make_video(creator)
+    db.session.commit()
+    assert TimelineEntry.query.filter_by(video_id=newest.id).count() == 1
+
+
+def test_count_hovering_at_the_limit_does_not_flip_the_mode(make_user):
+    creator = make_user()
+    fans = [make_user() for _ in range(3)]
+    for fan in fans:
+        fan.follow(creator)
+    db.session.commit()
+
+    for _ in range(3):
+        fans[2].unfollow(creator)
+        db.session.commit()
+        assert _pulled(creator)
+        fans[2].follow(creator)
+        db.session.commit()
+        assert _pulled(creator)
+
+
+def test_follow_backfills_the_whole_history(make_user, make_video):
+    creator, fan = make_user(), make_user()
+    videos = [make_video(creator) for _ in range(150)]
+    fan.follow(creator)
+    db.session.commit()
+
+    assert sorted(_feed(fan)) == sorted(video.id for video in videos)
@@ -0,0 +1,55 @@
+"""Chunks are only written at the offset the database holds under the staging lock."""
+from src.models.user import db
+from src.models.upload_session import UploadSession
+from src.routes import upload
+from sqlalchemy import update
+import hashlib
+
+
+def _start_upload(client, total_size):
+    response = client.post('/api/auth/register', json={
+        'username': 'cook', 'email': 'cook@example.com', 'password': 'secret-1'
+    })
+    headers = {'Authorization': f'Bearer {response.get_json()["token"]}'}
+    response = client.post('/api/uploads', json={'filename': 'clip.mp4', 'total_size': total_size}, headers=headers)
+    return response.get_json()['upload']['id'], headers
+
+
+def _put_chunk(client, upload_id, headers, offset, data):
+    return client.put(
+        f'/api/uploads/{upload_id}?offset={offset}', data=data,
+        headers={**headers, 'X-Chunk-SHA256': hashlib.sha256(data).hexdigest()}
+    )
+
+
+def test_chunk_rechecks_offset_after_taking_the_lock(app, client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_STAGING_FOLDER', str(tmp_path))
+    upload_id, headers = _start_upload(client, 8)
+
+    class RacingLock(upload._StagingLock):
+        """Another request stores the first chunk just before this one gets the lock"""
+
+        def __enter__(self):
+            with open(tmp_path / f'{upload_id}.part', 'r+b') as f:
+                f.write(b'aaaa')
+            with db.engine.begin() as connection:
+                connection.execute(update(UploadSession).where(UploadSession.id == upload_id).values(received_size=4))
+            return super().__enter__()
+
+    monkeypatch.setattr(upload, '_StagingLock', RacingLock)
+    response = _put_chunk(client, upload_id, headers, 0, b'cccc')
+
+    assert response.status_code == 409
+    assert response.get_json()['received_size'] == 4
+    assert (tmp_path / f'{upload_id}.part').read_bytes() == b'aaaa'
+
+
+def test_chunks_in_order_advance_the_offset(app, client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_STAGING_FOLDER', str(tmp_path))
+    upload_id, headers = _start_upload(client, 8)
+
+    assert _put_chunk(client, upload_id, headers, 0, b'aaaa').status_code == 200
+    response = _put_chunk(client, upload_id, headers, 4, b'bbbb')
+
+    assert response.get_json()['upload']['received_size'] == 8
+    assert (tmp_path / f'{upload_id}.part').read_bytes() == b'aaaabbbb'
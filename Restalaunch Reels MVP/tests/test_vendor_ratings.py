@@ -0,0 +1,70 @@
+"""Vendor rating aggregates follow review changes and can be rebuilt."""
+from src.models.user import db
+from src.models.vendor import Vendor, Review
+from sqlalchemy import update
+
+
+def _vendor(make_user):
+    vendor = Vendor(user_id=make_user().id, business_name='Tacos', business_type='food_truck')
+    db.session.add(vendor)
+    db.session.flush()
+    return vendor
+
+
+def _aggregates(vendor):
+    db.session.refresh(vendor)
+    return (
+        vendor.rating_sum, vendor.total_reviews, vendor.average_rating,
+        [getattr(vendor, f'rating_{star}') for star in range(1, 6)]
+    )
+
+
+def test_review_changes_update_the_aggregates(make_user):
+    vendor, other = _vendor(make_user), _vendor(make_user)
+    reviews = [Review(vendor_id=vendor.id, user_id=make_user().id, rating=rating) for rating in (5, 4, 4)]
+    db.session.add_all(reviews)
+    db.session.commit()
+    assert _aggregates(vendor) == (13, 3, 13 / 3, [0, 0, 0, 2, 1])
+
+    reviews[0].rating = 1
+    db.session.commit()
+    assert _aggregates(vendor) == (9, 3, 3.0, [1, 0, 0, 2, 0])
+
+    reviews[1].vendor_id = other.id
+    db.session.commit()
+    assert _aggregates(vendor) == (5, 2, 2.5, [1, 0, 0, 1, 0])
+    assert _aggregates(other) == (4, 1, 4.0, [0, 0, 0, 1, 0])
+
+    db.session.delete(reviews[2])
+    db.session.commit()
+    assert _aggregates(vendor) == (1, 1, 1.0, [1, 0, 0, 0, 0])
+
+    db.session.delete(reviews[0])
+    db.session.commit()
+    assert _aggregates(vendor) == (0, 0, 0.0, [0, 0, 0, 0, 0])
+
+
+def test_loaded_vendor_sees_new_reviews(make_user):
+    vendor = _vendor(make_user)
+    db.session.add(Review(vendor_id=vendor.id, user_id=make_user().id, rating=3))
+    db.session.commit()
+    assert vendor.average_rating == 3.0 and vendor.get_rating_distribution()['3'] == 1
+
+
+def test_recompute_command_repairs_drifted_aggregates(app, make_user):
+    vendor, untouched = _vendor(make_user), _vendor(make_user)
+    db.session.add_all(Review(vendor_id=vendor.id, user_id=make_user().id, rating=rating) for rating in (2, 5))
+    db.session.add(Review(vendor_id=untouched.id, user_id=make_user().id, rating=4))
+    db.session.commit()
+    db.session.execute(update(Vendor).where(Vendor.id == vendor.id).values(
+        rating_sum=99, total_reviews=7, average_rating=1.5, rating_2=0, rating_5=3
+    ))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['recompute-vendor-ratings'])
+
+    assert result.exit_code == 0, result.output
+    assert 'Repaired rating aggregates for 1 vendors' in result.output
+    db.session.expire_all()
+    assert _aggregates(vendor) == (7, 2, 3.5, [0, 1, 0, 0, 1])
+    assert _aggregates(untouched) == (4, 1, 4.0, [0, 0, 0, 1, 0])
@@ -0,0 +1,211 @@
+"""
+Materialized following-feed timelines (hybrid fan-out).
+
+When a creator posts, the video is pushed into the timeline of each of their
+followers, so reading the following feed is a range scan over one user's
+timeline rows. A creator who reaches FANOUT_MAX_FOLLOWERS followers switches
+to pull mode (User.timeline_pulled_at is set): their videos are no longer
+fanned out and are pulled in at read time instead.
+
+A pulled creator switches back to push mode only below
+FANOUT_RESUME_FOLLOWERS, so a count hovering around the limit does not flip
+the mode on every follow. On switching back, every follower is given all of
+the creator's videos, as on a new follow; without that, videos posted while
+pulled would vanish from their feeds.
+
+Timelines are maintained by mapper events, so any code path that creates
+videos or follows/unfollows users keeps them current.
+"""
+from src.models.user import db, User, Follow
+from src.models.video import Video
+from sqlalchemy import event, select, text, or_, and_, exists
+from datetime import datetime
+
+# Creators reaching this many followers are pulled, not pushed
+FANOUT_MAX_FOLLOWERS = 5000
+
+# Pulled creators are pushed again once they drop below this many followers
+FANOUT_RESUME_FOLLOWERS = 4500
+
+
+class TimelineEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)  # Timeline owner
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id', ondelete='CASCADE'), nullable=False)
+    creator_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)  # Copied from the video
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'video_id', name='unique_timeline_entry'),
+        db.Index('ix_timeline_entry_user_created', 'user_id', 'created_at', 'video_id'),
+        db.Index('ix_timeline_entry_user_creator', 'user_id', 'creator_id'),
+        db.Index('ix_timeline_entry_video', 'video_id'),
+    )
+
+    def __repr__(self):
+        return f'<TimelineEntry user:{self.user_id} video:{self.video_id}>'
+
+
+_FAN_OUT_VIDEO = text(
+    'INSERT OR IGNORE INTO timeline_entry (user_id, video_id, creator_id, created_at) '
+    'SELECT follower_id, :video_id, :creator_id, :created_at FROM follow '
+    'WHERE followed_id = :creator_id '
+    'AND (SELECT timeline_pulled_at FROM user WHERE id = :creator_id) IS NULL'
+)
+
+_BACKFILL_FOLLOW = text(
+    'INSERT OR IGNORE INTO timeline_entry (user_id, video_id, creator_id, created_at) '
+    'SELECT :follower_id, id, user_id, created_at FROM video '
+    'WHERE user_id = :creator_id AND is_active = 1 '
+    'AND (SELECT timeline_pulled_at FROM user WHERE id = :creator_id) IS NULL'
+)
+
+_START_PULLING = text(
+    'UPDATE user SET timeline_pulled_at = :now '
+    'WHERE id = :creator_id AND timeline_pulled_at IS NULL AND follower_count >= :max_followers'
+)
+
+# Gives every follower all of the creator's videos, as a follow would have.
+# Covers both videos posted while pulled and followers gained while pulled.
+_RESUME_PUSHING = text(
+    'INSERT OR IGNORE INTO timeline_entry (user_id, video_id, creator_id, created_at) '
+    'SELECT follow.follower_id, video.id, video.user_id, video.created_at '
+    'FROM follow JOIN video ON video.user_id = follow.followed_id '
+    'WHERE follow.followed_id = :creator_id AND video.is_active = 1'
+)
+
+
+@event.listens_for(Video, 'after_insert')
+def _fan_out_video(mapper, connection, target):
+    connection.execute(_FAN_OUT_VIDEO, {
+        'video_id': target.id,
+        'creator_id': target.user_id,
+        'created_at': target.created_at or datetime.utcnow()
+    })
+
+
+@event.listens_for(Video, 'before_delete')
+def _remove_video_entries(mapper, connection, target):
+    connection.execute(
+        TimelineEntry.__table__.delete().where(TimelineEntry.video_id == target.id)
+    )
+
+
+def _resume_pushing(connection, creator_id):
+    """Switch a pulled creator below FANOUT_RESUME_FOLLOWERS back to push mode"""
+    switched = connection.execute(
+        User.__table__.update().where(
+            and_(
+                User.id == creator_id,
+                User.timeline_pulled_at.isnot(None),
+                User.follower_count < FANOUT_RESUME_FOLLOWERS
+            )
+        ).values(timeline_pulled_at=None)
+    ).rowcount
+    if switched:
+        connection.execute(_RESUME_PUSHING, {'creator_id': creator_id})
+    return bool(switched)
+
+
+@event.listens_for(Follow, 'after_insert')
+def _backfill_timeline(mapper, connection, target):
+    # The follower count is already updated (see User.follow)
+    connection.execute(_START_PULLING, {
+        'creator_id': target.followed_id,
+        'now': datetime.utcnow(),
+        'max_followers': FANOUT_MAX_FOLLOWERS
+    })
+    connection.execute(_BACKFILL_FOLLOW, {
+        'follower_id': target.follower_id,
+        'creator_id': target.followed_id
+    })
+
+
+@event.listens_for(Follow, 'after_delete')
+def _trim_timeline(mapper, connection, target):
+    connection.execute(
+        TimelineEntry.__table__.delete().where(
+            and_(
+                TimelineEntry.user_id == target.follower_id,
+                TimelineEntry.creator_id == target.followed_id
+            )
+        )
+    )
+    _resume_pushing(connection, target.followed_id)
+
+
+def sync_fanout_modes():
+    """
+    Apply the push/pull thresholds to every creator, e.g. after follower
+    counts were repaired in bulk. Returns the number of creators switched.
+    The caller commits.
+    """
+    connection = db.session.connection()
+    switched = connection.execute(
+        User.__table__.update().where(
+            and_(
+                User.timeline_pulled_at.is_(None),
+                User.follower_count >= FANOUT_MAX_FOLLOWERS
+            )
+        ).values(timeline_pulled_at=datetime.utcnow())
+    ).rowcount
+    resumable = connection.execute(
+        select(User.id).where(
+            and_(
+                User.timeline_pulled_at.isnot(None),
+                User.follower_count < FANOUT_RESUME_FOLLOWERS
+            )
+        )
+    ).scalars().all()
+    for creator_id in resumable:
+        switched += _resume_pushing(connection, creator_id)
+    return switched
+
+
+def following_feed_query(user_id):
+    """
+    Return (query, sort_keys) for a user's following feed. Without followed
+    mega-creators this is a single range read over the user's timeline.
+    """
+    pulled_creators = select(Follow.followed_id).join(
+        User, User.id == Follow.followed_id
+    ).where(
+        and_(
+            Follow.follower_id == user_id,
+            User.timeline_pulled_at.isnot(None)
+        )
+    )
+
+    if not db.session.query(exists(pulled_creators)).scalar():
+        query = Video.query.join(
+            TimelineEntry, TimelineEntry.video_id == Video.id
+        ).filter(
+            and_(
+                TimelineEntry.user_id == user_id,
+                Video.is_active == True
+            )
+        )
+        return query, [TimelineEntry.created_at, TimelineEntry.video_id]
+
+    pushed_videos = select(TimelineEntry.video_id).where(TimelineEntry.user_id == user_id)
+    query = Video.query.filter(
+        and_(
+            Video.is_active == True,
+            or_(
+                Video.id.in_(pushed_videos),
+                Video.user_id.in_(pulled_creators)
+            )
+        )
+    )
+    return query, [Video.created_at, Video.id]
+
+
+def backfill_timelines():
+    """Build timelines for existing follows. The caller commits."""
+    db.session.execute(text(
+        'INSERT OR IGNORE INTO timeline_entry (user_id, video_id, creator_id, created_at) '
+        'SELECT follow.follower_id, video.id, video.user_id, video.created_at '
+        'FROM follow JOIN user ON user.id = follow.followed_id '
+        'JOIN video ON video.user_id = follow.followed_id '
+        'WHERE user.timeline_pulled_at IS NULL AND video.is_active = 1'
+    ))
@@ -0,0 +1,316 @@
+from flask import Blueprint, request, jsonify, current_app
+from src.models.user import db
+from src.models.upload_session import UploadSession
+from src.services.media_jobs import queue_is_full
+from src.routes.auth import token_required
+from sqlalchemy import update
+from datetime import datetime
+import errno
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+
+upload_bp = Blueprint('upload', __name__)
+
+ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'mov', 'm4v', 'webm'}
+READ_BLOCK_SIZE = 1024 * 1024
+QUEUE_FULL_RETRY_AFTER = 30  # Seconds
+
+def _staging_path(upload_id):
+    return os.path.join(current_app.config['UPLOAD_STAGING_FOLDER'], f'{upload_id}.part')
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+def _get_upload(current_user, upload_id):
+    """Return (upload, error_response)"""
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None or upload.user_id != current_user.id:
+        return None, (jsonify({'error': 'Upload not found'}), 404)
+    if upload.status == 'uploading' and upload.is_expired:
+        return None, (jsonify({'error': 'Upload session has expired'}), 410)
+    return upload, None
+
+class _StagingLock:
+    """Exclusive, non-blocking lock on an upload's staging file, across processes"""
+    
+    def __init__(self, path):
+        self.file = open(path, 'r+b')
+    
+    def __enter__(self):
+        try:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            raise
+        return self.file
+    
+    def __exit__(self, *exc_info):
+        self.file.close()  # Also releases the lock
+
+def _file_sha256(f):
+    f.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+@upload_bp.route('', methods=['POST'])
+@token_required
+def init_upload(current_user):
+    """
+    Start a resumable upload. Chunks are then PUT in order at their byte offset.
+    """
+    try:
+        data = request.get_json() or {}
+        filename = os.path.basename(data.get('filename') or '')
+        total_size = data.get('total_size')
+        sha256 = (data.get('sha256') or '').lower() or None
+        
+        if not filename or _extension(filename) not in ALLOWED_VIDEO_EXTENSIONS:
+            return jsonify({'error': f'filename must end in one of: {", ".join(sorted(ALLOWED_VIDEO_EXTENSIONS))}'}), 400
+        if not isinstance(total_size, int) or total_size <= 0:
+            return jsonify({'error': 'total_size must be a positive integer'}), 400
+        if total_size > current_app.config['UPLOAD_MAX_FILE_SIZE']:
+            return jsonify({'error': 'File too large'}), 413
+        if sha256 is not None and not re.fullmatch(r'[0-9a-f]{64}', sha256):
+            return jsonify({'error': 'sha256 must be a hex digest'}), 400
+        
+        upload = UploadSession(
+            user_id=current_user.id,
+            filename=filename,
+            content_type=data.get('content_type'),
+            total_size=total_size,
+            sha256=sha256
+        )
+        db.session.add(upload)
+        db.session.flush()
+        
+        os.makedirs(current_app.config['UPLOAD_STAGING_FOLDER'], exist_ok=True)
+        open(_staging_path(upload.id), 'wb').close()
+        db.session.commit()
+        
+        return jsonify({
+            'upload': upload.to_dict(),
+            'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE']
+        }), 201
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@upload_bp.route('/<upload_id>', methods=['GET'])
+@token_required
+def get_upload(current_user, upload_id):
+    """
+    Upload progress; a client resumes by sending the chunk at received_size
+    """
+    try:
+        upload, error = _get_upload(current_user, upload_id)
+        if error:
+            return error
+        
+        return jsonify({'upload': upload.to_dict()}), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@upload_bp.route('/<upload_id>', methods=['PUT'])
+@token_required
+def upload_chunk(current_user, upload_id):
+    """
+    Write one chunk at ?offset=N. The body is streamed straight into the
+    staging file and checked against the X-Chunk-SHA256 header.
+    """
+    try:
+        upload, error = _get_upload(current_user, upload_id)
+        if error:
+            return error
+        if upload.status != 'uploading':
+            return jsonify({'error': 'Upload is already complete'}), 409
+        
+        offset = request.args.get('offset', type=int)
+        length = request.content_length
+        expected_sha256 = (request.headers.get('X-Chunk-SHA256') or '').lower()
+        
+        if offset is None or offset < 0:
+            return jsonify({'error': 'offset is required'}), 400
+        if not length:
+            return jsonify({'error': 'Content-Length is required'}), 411
+        if length > current_app.config['UPLOAD_MAX_CHUNK_SIZE']:
+            return jsonify({'error': 'Chunk too large'}), 413
+        if offset + length > upload.total_size:
+            return jsonify({'error': 'Chunk extends past total_size'}), 400
+        if not expected_sha256:
+            return jsonify({'error': 'X-Chunk-SHA256 header is required'}), 400
+        
+        # A retried chunk that was already stored
+        if offset + length <= upload.received_size:
+            return jsonify({'upload': upload.to_dict()}), 200
+        if offset != upload.received_size:
+            return jsonify({
+                'error': 'Chunk does not start at the end of the received data',
+                'received_size': upload.received_size
+            }), 409
+        
+        try:
+            lock = _StagingLock(_staging_path(upload.id))
+        except FileNotFoundError:
+            return jsonify({'error': 'Upload data is missing; start a new upload'}), 410
+        
+        try:
+            with lock as f:
+                # Another request may have written a chunk since the checks above
+                db.session.refresh(upload)
+                if upload.status != 'uploading' or offset != upload.received_size:
+                    return jsonify({
+                        'error': 'Chunk does not start at the end of the received data',
+                        'received_size': upload.received_size
+                    }), 409
+                
+                f.seek(offset)
+                digest = hashlib.sha256()
+                remaining = length
+                while remaining:
+                    block = request.stream.read(min(READ_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    digest.update(block)
+                    f.write(block)
+                    remaining -= len(block)
+                
+                if remaining or digest.hexdigest() != expected_sha256:
+                    f.truncate(offset)
+                    message = 'Chunk was incomplete' if remaining else 'Chunk checksum mismatch'
+                    return jsonify({'error': message, 'received_size': offset}), 400
+                
+                f.flush()
+                os.fsync(f.fileno())
+                
+                # Only advance if no other request moved the offset meanwhile
+                advanced = db.session.execute(
+                    update(UploadSession).where(
+                        UploadSession.id == upload.id,
+                        UploadSession.received_size == offset
+                    ).values(received_size=offset + length, updated_at=datetime.utcnow())
+                ).rowcount
+                db.session.commit()
+        except BlockingIOError:
+            return jsonify({'error': 'Another chunk is being written to this upload'}), 409
+        
+        db.session.refresh(upload)
+        if not advanced:
+            return jsonify({
+                'error': 'Upload offset changed during the request',
+                'received_size': upload.received_size
+            }), 409
+        
+        return jsonify({'upload': upload.to_dict()}), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@upload_bp.route('/<upload_id>/complete', methods=['POST'])
+@token_required
+def complete_upload(current_user, upload_id):
+    """
+    Verify the assembled file and move it to its content-addressed location
+    """
+    try:
+        upload, error = _get_upload(current_user, upload_id)
+        if error:
+            return error
+        if upload.status == 'complete':
+            return jsonify({'upload': upload.to_dict(), 'video_url': upload.video_url}), 200
+        if upload.received_size != upload.total_size:
+            return jsonify({
+                'error': 'Upload is not finished',
+                'received_size': upload.received_size
+            }), 409
+        if queue_is_full():
+            # Processing is backed up; the staged upload keeps until the client retries
+            response = jsonify({'error': 'Media processing is busy; try again shortly'})
+            response.headers['Retry-After'] = str(QUEUE_FULL_RETRY_AFTER)
+            return response, 503
+        
+        staging_path = _staging_path(upload.id)
+        try:
+            with _StagingLock(staging_path) as f:
+                sha256 = _file_sha256(f)
+                if upload.sha256 and sha256 != upload.sha256:
+                    f.truncate(0)
+                    upload.received_size = 0
+                    db.session.commit()
+                    return jsonify({'error': 'File checksum mismatch; upload again'}), 422
+                
+                name = f'{sha256}.{_extension(upload.filename)}'
+                video_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'videos')
+                os.makedirs(video_folder, exist_ok=True)
+                destination = os.path.join(video_folder, name)
+                
+                if os.path.exists(destination):
+                    # Identical content was uploaded before
+                    os.remove(staging_path)
+                else:
+                    try:
+                        os.replace(staging_path, destination)
+                    except OSError as e:
+                        if e.errno != errno.EXDEV:
+                            raise
+                        shutil.move(staging_path, destination)
+        except FileNotFoundError:
+            return jsonify({'error': 'Upload data is missing; start a new upload'}), 410
+        except BlockingIOError:
+            return jsonify({'error': 'A chunk is still being written to this upload'}), 409
+        
+        upload.status = 'complete'
+        upload.sha256 = sha256
+        upload.video_url = f'/uploads/videos/{name}'
+        db.session.commit()
+        
+        return jsonify({
+            'upload': upload.to_dict(),
+            'video_url': upload.video_url,
+            'file_size': upload.total_size,
+            'sha256': sha256
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@upload_bp.route('/<upload_id>', methods=['DELETE'])
+@token_required
+def abort_upload(current_user, upload_id):
+    try:
+        upload, error = _get_upload(current_user, upload_id)
+        if error:
+            return error
+        
+        if upload.status == 'uploading' and os.path.exists(_staging_path(upload.id)):
+            os.remove(_staging_path(upload.id))
+        db.session.delete(upload)
+        db.session.commit()
+        
+        return jsonify({'message': 'Upload cancelled'}), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+def purge_expired_uploads():
+    """Delete expired, unfinished upload sessions and their staging files"""
+    expired = UploadSession.query.filter(
+        UploadSession.status == 'uploading',
+        UploadSession.expires_at <= datetime.utcnow()
+    ).all()
+    for upload in expired:
+        path = _staging_path(upload.id)
+        if os.path.exists(path):
+            os.remove(path)
+        db.session.delete(upload)
+    db.session.commit()
+    return len(expired)
@@ -0,0 +1,46 @@
+from src.models.user import db
+from datetime import datetime, timedelta
+import uuid
+
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+
+
+class UploadSession(db.Model):
+    """A resumable, chunked video upload in progress"""
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)  # Original client filename
+    content_type = db.Column(db.String(100), nullable=True)
+    total_size = db.Column(db.Integer, nullable=False)  # Bytes
+    received_size = db.Column(db.Integer, default=0, nullable=False)  # Contiguous bytes written so far
+    sha256 = db.Column(db.String(64), nullable=True)  # Optional whole-file checksum from the client
+    status = db.Column(db.String(20), default='uploading', nullable=False)  # uploading, complete
+    video_url = db.Column(db.String(255), nullable=True)  # Set once complete
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, default=lambda: datetime.utcnow() + UPLOAD_SESSION_TTL)
+
+    __table_args__ = (
+        db.Index('ix_upload_session_user', 'user_id'),
+        db.Index('ix_upload_session_status_expires', 'status', 'expires_at'),
+    )
+
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.received_size}/{self.total_size}>'
+
+    @property
+    def is_expired(self):
+        return self.expires_at is not None and self.expires_at <= datetime.utcnow()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'content_type': self.content_type,
+            'total_size': self.total_size,
+            'received_size': self.received_size,
+            'status': self.status,
+            'video_url': self.video_url,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select, update, func, or_
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from src.models.db_setup import RoutingSession
+from src.utils.passwords import password_hasher, PasswordHasherBusy
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -14,6 +16,14 @@ class User(db.Model):
     bio = db.Column(db.Text, nullable=True)
     is_vendor = db.Column(db.Boolean, default=False, nullable=False)
     is_verified = db.Column(db.Boolean, default=False, nullable=False)
+    
+    # Denormalized follow counters, maintained by follow()/unfollow()
+    follower_count = db.Column(db.Integer, default=0, nullable=False)
+    following_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    # Set while followers pull this creator's videos instead of receiving them (see timeline.py)
+    timeline_pulled_at = db.Column(db.DateTime, nullable=True)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -29,29 +39,59 @@ class User(db.Model):
         return f'<User {self.username}>'
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """
+        Check a password, upgrading a hash made with outdated parameters.
+        The caller commits if the hash changed.
+        """
+        matches, needs_rehash = password_hasher.verify(self.password_hash, password)
+        if needs_rehash:
+            try:
+                self.password_hash = password_hasher.rehash(password)
+            except PasswordHasherBusy:
+                pass  # The password was right; keep the old hash and upgrade on a later login
+        return matches
 
     def follow(self, user):
         if not self.is_following(user):
+            self._adjust_follow_counts(user, 1)
             follow = Follow(follower_id=self.id, followed_id=user.id)
             db.session.add(follow)
 
     def unfollow(self, user):
         follow = self.follows.filter_by(followed_id=user.id).first()
         if follow:
+            self._adjust_follow_counts(user, -1)
             db.session.delete(follow)
 
+    def _adjust_follow_counts(self, user, delta):
+        """
+        Atomic increments in the current transaction, committed together with
+        the Follow row. Both attributes reload with the new values on next access.
+        """
+        db.session.execute(
+            update(User).where(User.id == self.id).values(
+                following_count=User.following_count + delta
+            ).execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            update(User).where(User.id == user.id).values(
+                follower_count=User.follower_count + delta
+            ).execution_options(synchronize_session=False)
+        )
+        db.session.expire(self, ['following_count'])
+        db.session.expire(user, ['follower_count'])
+
     def is_following(self, user):
         return self.follows.filter_by(followed_id=user.id).first() is not None
 
     def get_follower_count(self):
-        return self.followers.count()
+        return self.follower_count or 0
 
     def get_following_count(self):
-        return self.follows.count()
+        return self.following_count or 0
 
     def to_dict(self):
         return {
@@ -84,11 +124,14 @@ class User(db.Model):
 
 class Follow(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    follower_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    followed_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    follower_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    followed_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('follower_id', 'followed_id', name='unique_follow'),)
+    __table_args__ = (
+        db.UniqueConstraint('follower_id', 'followed_id', name='unique_follow'),
+        db.Index('ix_follow_followed_follower', 'followed_id', 'follower_id'),
+    )
 
     def to_dict(self):
         return {
@@ -98,3 +141,22 @@ class Follow(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+
+def reconcile_follow_counts():
+    """Repair drifted follower/following counters in bulk. The caller commits."""
+    follower_total = select(func.count(Follow.id)).where(
+        Follow.followed_id == User.id
+    ).scalar_subquery()
+    following_total = select(func.count(Follow.id)).where(
+        Follow.follower_id == User.id
+    ).scalar_subquery()
+
+    result = db.session.execute(
+        update(User).where(
+            or_(User.follower_count != follower_total, User.following_count != following_total)
+        ).values(
+            follower_count=follower_total,
+            following_count=following_total
+        ).execution_options(synchronize_session=False)
+    )
+    return result.rowcount
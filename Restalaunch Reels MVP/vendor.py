@@ -1,9 +1,13 @@
 from src.models.user import db
+from sqlalchemy import event, select, update, func, case, or_, bindparam
+from sqlalchemy.orm import Session, attributes, column_property
 from datetime import datetime
 
+RATING_STARS = (1, 2, 3, 4, 5)
+
 class Vendor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     business_name = db.Column(db.String(100), nullable=False)
     business_type = db.Column(db.String(50), nullable=False)  # restaurant, food_truck, street_vendor, catering, etc.
     description = db.Column(db.Text, nullable=True)
@@ -28,9 +32,15 @@ class Vendor(db.Model):
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     is_verified = db.Column(db.Boolean, default=False, nullable=False)
     
-    # Ratings and metrics
+    # Ratings and metrics, kept current by the Review flush hook below
     average_rating = db.Column(db.Float, default=0.0)
     total_reviews = db.Column(db.Integer, default=0)
+    rating_sum = db.Column(db.Integer, default=0, nullable=False)
+    rating_1 = db.Column(db.Integer, default=0, nullable=False)  # Reviews per star count
+    rating_2 = db.Column(db.Integer, default=0, nullable=False)
+    rating_3 = db.Column(db.Integer, default=0, nullable=False)
+    rating_4 = db.Column(db.Integer, default=0, nullable=False)
+    rating_5 = db.Column(db.Integer, default=0, nullable=False)
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -39,31 +49,29 @@ class Vendor(db.Model):
     # Relationships
     menu_items = db.relationship('MenuItem', backref='vendor', lazy='dynamic', cascade='all, delete-orphan')
     reviews = db.relationship('Review', backref='vendor', lazy='dynamic', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_vendor_user', 'user_id'),
+        db.Index('ix_vendor_active_rating', 'is_active', 'average_rating'),
+    )
 
     def __repr__(self):
         return f'<Vendor {self.business_name}>'
 
     def update_rating(self):
-        """Update average rating based on reviews"""
-        reviews = self.reviews.all()
-        if reviews:
-            total_rating = sum(review.rating for review in reviews)
-            self.average_rating = total_rating / len(reviews)
-            self.total_reviews = len(reviews)
-        else:
-            self.average_rating = 0.0
-            self.total_reviews = 0
+        """Reload the rating aggregates, which the Review flush hook keeps current"""
+        db.session.refresh(self, _AGGREGATE_COLUMNS + ['average_rating'])
+
+    def get_rating_distribution(self):
+        return {str(star): getattr(self, f'rating_{star}') or 0 for star in RATING_STARS}
 
     def get_distance_from(self, lat, lng):
-        """Calculate distance from given coordinates (simplified)"""
-        if not self.latitude or not self.longitude:
+        """Calculate great-circle distance in km from given coordinates"""
+        if self.latitude is None or self.longitude is None:
             return None
         
-        # Simple distance calculation (not accurate for long distances)
-        import math
-        lat_diff = self.latitude - lat
-        lng_diff = self.longitude - lng
-        return math.sqrt(lat_diff**2 + lng_diff**2) * 111  # Rough km conversion
+        from src.models.spatial import haversine_km
+        return haversine_km(lat, lng, self.latitude, self.longitude)
 
     def to_dict(self):
         return {
@@ -86,6 +94,7 @@ class Vendor(db.Model):
             'is_verified': self.is_verified,
             'average_rating': self.average_rating,
             'total_reviews': self.total_reviews,
+            'rating_distribution': self.get_rating_distribution(),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -93,7 +102,7 @@ class Vendor(db.Model):
 
 class MenuItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), nullable=False)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id', ondelete='CASCADE'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
     price = db.Column(db.Float, nullable=False)
@@ -110,6 +119,8 @@ class MenuItem(db.Model):
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_menu_item_vendor_category', 'vendor_id', 'category'),)
 
     def __repr__(self):
         return f'<MenuItem {self.name}>'
@@ -135,26 +146,137 @@ class MenuItem(db.Model):
 
 class Review(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
+    # active_history loads the old value on change, so vendor aggregates can subtract it
+    vendor_id = column_property(db.Column(db.Integer, db.ForeignKey('vendor.id', ondelete='CASCADE'), nullable=False), active_history=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    rating = column_property(db.Column(db.Integer, nullable=False), active_history=True)  # 1-5 stars
     comment = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     user = db.relationship('User', backref='reviews')
+    
+    __table_args__ = (
+        db.Index('ix_review_vendor_created', 'vendor_id', 'created_at'),
+        db.Index('ix_review_user', 'user_id'),
+    )
 
     def __repr__(self):
         return f'<Review {self.rating} stars for vendor {self.vendor_id}>'
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_user=True):
+        result = {
             'id': self.id,
             'vendor_id': self.vendor_id,
             'user_id': self.user_id,
             'rating': self.rating,
             'comment': self.comment,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'user': self.user.to_public_dict() if self.user else None
+            'created_at': self.created_at.isoformat() if self.created_at else None
         }
+        
+        if include_user:
+            result['user'] = self.user.to_public_dict() if self.user else None
+            
+        return result
+
+
+_AGGREGATE_COLUMNS = ['rating_sum', 'total_reviews'] + [f'rating_{star}' for star in RATING_STARS]
+
+
+def _apply_rating_deltas(connection, deltas):
+    """
+    Add per-vendor deltas to the aggregate columns in one atomic UPDATE each,
+    so concurrent reviews never overwrite each other's counts.
+    """
+    table = Vendor.__table__
+    new_sum = table.c.rating_sum + bindparam('_rating_sum')
+    new_count = func.coalesce(table.c.total_reviews, 0) + bindparam('_total_reviews')
+    statement = update(table).where(table.c.id == bindparam('_id')).values(
+        rating_sum=new_sum,
+        total_reviews=new_count,
+        # SET expressions see the old row, so the average is built from the new totals here
+        average_rating=case((new_count > 0, new_sum * 1.0 / new_count), else_=0.0),
+        updated_at=table.c.updated_at,
+        **{f'rating_{star}': table.c[f'rating_{star}'] + bindparam(f'_rating_{star}') for star in RATING_STARS}
+    )
+    connection.execute(statement, [
+        {'_id': vendor_id, **{f'_{column}': delta.get(column, 0) for column in _AGGREGATE_COLUMNS}}
+        for vendor_id, delta in deltas.items()
+    ])
+
+
+def _add_review(deltas, vendor_id, rating, sign):
+    if vendor_id is None or rating is None:
+        return
+    delta = deltas.setdefault(vendor_id, {})
+    delta['rating_sum'] = delta.get('rating_sum', 0) + sign * rating
+    delta['total_reviews'] = delta.get('total_reviews', 0) + sign
+    if rating in RATING_STARS:
+        delta[f'rating_{rating}'] = delta.get(f'rating_{rating}', 0) + sign
+
+
+def _previous(review, key):
+    history = attributes.get_history(review, key)
+    return history.deleted[0] if history.deleted else getattr(review, key)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_rating_aggregates(session, flush_context):
+    deltas = {}
+    for review in session.new:
+        if isinstance(review, Review):
+            _add_review(deltas, review.vendor_id, review.rating, 1)
+    for review in session.deleted:
+        if isinstance(review, Review):
+            _add_review(deltas, _previous(review, 'vendor_id'), _previous(review, 'rating'), -1)
+    for review in session.dirty:
+        if isinstance(review, Review) and (
+            attributes.get_history(review, 'rating').has_changes()
+            or attributes.get_history(review, 'vendor_id').has_changes()
+        ):
+            _add_review(deltas, _previous(review, 'vendor_id'), _previous(review, 'rating'), -1)
+            _add_review(deltas, review.vendor_id, review.rating, 1)
+
+    deltas = {vendor_id: delta for vendor_id, delta in deltas.items() if any(delta.values())}
+    if deltas:
+        _apply_rating_deltas(session.connection(), deltas)
+        session.info.setdefault('rated_vendor_ids', set()).update(deltas)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expire_rating_aggregates(session, flush_context):
+    # Loaded vendors would otherwise keep showing their pre-review ratings
+    for vendor_id in session.info.pop('rated_vendor_ids', ()):
+        vendor = session.identity_map.get(session.identity_key(Vendor, vendor_id))
+        if vendor is not None:
+            session.expire(vendor, _AGGREGATE_COLUMNS + ['average_rating'])
+
+
+def recompute_vendor_ratings(vendor_ids=None):
+    """
+    Rebuild rating aggregates from the reviews, for repairs and backfills.
+    Returns the number of vendors whose aggregates were wrong. The caller commits.
+    """
+    vendor = Vendor.__table__
+    review = Review.__table__
+
+    def aggregate(expression):
+        return select(func.coalesce(expression, 0)).where(review.c.vendor_id == vendor.c.id).scalar_subquery()
+
+    values = {
+        'rating_sum': aggregate(func.sum(review.c.rating)),
+        'total_reviews': aggregate(func.count(review.c.id)),
+    }
+    for star in RATING_STARS:
+        values[f'rating_{star}'] = aggregate(func.sum(case((review.c.rating == star, 1), else_=0)))
+    values['average_rating'] = func.coalesce(
+        select(func.avg(review.c.rating) * 1.0).where(review.c.vendor_id == vendor.c.id).scalar_subquery(),
+        0.0
+    )
 
+    statement = update(vendor).where(
+        or_(*(func.coalesce(vendor.c[column], -1) != expression for column, expression in values.items()))
+    ).values(updated_at=vendor.c.updated_at, **values).execution_options(synchronize_session=False)
+    if vendor_ids is not None:
+        statement = statement.where(vendor.c.id.in_(vendor_ids))
+    return db.session.execute(statement).rowcount
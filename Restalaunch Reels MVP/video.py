@@ -1,10 +1,26 @@
 from src.models.user import db
-from datetime import datetime
+from sqlalchemy import event, select, update, func, Computed
+from datetime import datetime, timezone
+import math
+
+CUISINE_KEY_SQL = 'lower(trim(cuisine_type))'
+
+
+def compute_rank_score(view_count, like_count, comment_count, created_at):
+    """Blend engagement and recency into the for-you ranking score"""
+    created_at = created_at or datetime.utcnow()
+    return (
+        math.log10((view_count or 0) + 1) * 0.3 +
+        math.log10((like_count or 0) + 1) * 0.4 +
+        math.log10((comment_count or 0) + 1) * 0.3 +
+        created_at.replace(tzinfo=timezone.utc).timestamp() / 100000  # Recency factor
+    )
+
 
 class Video(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), nullable=True)  # If posted by vendor
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id', ondelete='SET NULL'), nullable=True)  # If posted by vendor
     
     # Video content
     title = db.Column(db.String(200), nullable=True)
@@ -21,6 +37,7 @@ class Video(db.Model):
     # Content categorization
     hashtags = db.Column(db.Text, nullable=True)  # Comma-separated hashtags
     cuisine_type = db.Column(db.String(100), nullable=True)
+    cuisine_key = db.Column(db.String(100), Computed(CUISINE_KEY_SQL))  # Generated; exact cuisine lookups
     food_category = db.Column(db.String(50), nullable=True)  # appetizer, main, dessert, etc.
     
     # Location (if different from vendor location)
@@ -34,6 +51,9 @@ class Video(db.Model):
     comment_count = db.Column(db.Integer, default=0)
     share_count = db.Column(db.Integer, default=0)
     
+    # Materialized for-you ranking score (see compute_rank_score)
+    rank_score = db.Column(db.Float, default=0.0, nullable=False)
+    
     # Status
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     is_featured = db.Column(db.Boolean, default=False, nullable=False)
@@ -47,18 +67,58 @@ class Video(db.Model):
     comments = db.relationship('Comment', backref='video', lazy='dynamic', cascade='all, delete-orphan')
     video_menu_items = db.relationship('VideoMenuItem', backref='video', lazy='dynamic', cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_video_active_rank', 'is_active', 'rank_score'),
+        db.Index('ix_video_active_created', 'is_active', 'created_at'),
+        db.Index('ix_video_user_created', 'user_id', 'created_at'),
+        db.Index('ix_video_vendor_created', 'vendor_id', 'created_at'),
+        db.Index('ix_video_cuisine_rank', 'cuisine_type', 'rank_score'),
+        db.Index('ix_video_cuisine_key_active', 'cuisine_key', 'is_active'),
+        db.Index('ix_video_category_rank', 'food_category', 'rank_score'),
+        db.Index('ix_video_featured_created', 'is_featured', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<Video {self.id} by {self.user_id}>'
 
     def increment_view(self):
         """Increment view count"""
-        self.view_count += 1
+        self._increment_counter('view_count', 1)
+
+    def increment_share(self):
+        """Increment share count"""
+        self._increment_counter('share_count', 1)
+
+    def adjust_like_count(self, delta):
+        """Apply a like (+1) or unlike (-1) to the like count"""
+        self._increment_counter('like_count', delta)
+
+    def _increment_counter(self, field, amount):
+        """Apply an increment as an atomic SQL UPDATE (see services.counters for buffering)"""
+        db.session.execute(
+            update(Video).where(Video.id == self.id).values(
+                {field: getattr(Video, field) + amount}
+            ).execution_options(synchronize_session=False)
+        )
+        # Reloads with the new value on next access
+        db.session.expire(self, [field])
 
     def update_engagement_counts(self):
         """Update engagement counts based on actual data"""
         self.like_count = self.likes.count()
         self.comment_count = self.comments.count()
 
+    def update_rank_score(self):
+        """Recompute the materialized ranking score from the current counters"""
+        counts = (self.view_count, self.like_count, self.comment_count)
+        if not all(count is None or isinstance(count, int) for count in counts):
+            # A counter is being set with a SQL expression; the rank worker's
+            # sweep over updated rows picks the new value up
+            return
+        self.rank_score = compute_rank_score(
+            self.view_count, self.like_count, self.comment_count, self.created_at
+        )
+
     def get_hashtags_list(self):
         """Return hashtags as a list"""
         if self.hashtags:
@@ -102,13 +162,23 @@ class Video(db.Model):
         return result
 
 
+@event.listens_for(Video, 'before_insert')
+@event.listens_for(Video, 'before_update')
+def _refresh_rank_score(mapper, connection, target):
+    """Keep rank_score in step with engagement counters written through the ORM"""
+    target.update_rank_score()
+
+
 class Like(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'video_id', name='unique_like'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'video_id', name='unique_like'),
+        db.Index('ix_like_video', 'video_id'),
+    )
 
     def __repr__(self):
         return f'<Like user:{self.user_id} video:{self.video_id}>'
@@ -124,9 +194,10 @@ class Like(db.Model):
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
-    parent_id = db.Column(db.Integer, db.ForeignKey('comment.id'), nullable=True)  # For replies
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id', ondelete='CASCADE'), nullable=False)
+    parent_id = db.Column(db.Integer, db.ForeignKey('comment.id', ondelete='CASCADE'), nullable=True)  # For replies
+    root_id = db.Column(db.Integer, nullable=True)  # Top-level comment of a reply's thread; set on insert
     content = db.Column(db.Text, nullable=False)
     like_count = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -134,37 +205,62 @@ class Comment(db.Model):
     
     # Relationships
     replies = db.relationship('Comment', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
+    
+    __table_args__ = (
+        db.Index('ix_comment_video_parent_created', 'video_id', 'parent_id', 'created_at'),
+        db.Index('ix_comment_parent_created', 'parent_id', 'created_at'),
+        db.Index('ix_comment_root_created', 'root_id', 'created_at', 'id'),
+        db.Index('ix_comment_user', 'user_id'),
+    )
 
     def __repr__(self):
         return f'<Comment {self.id} by {self.user_id}>'
 
-    def to_dict(self, include_replies=False):
+    def to_dict(self, include_replies=False, include_user=True):
         result = {
             'id': self.id,
             'user_id': self.user_id,
             'video_id': self.video_id,
             'parent_id': self.parent_id,
+            'root_id': self.root_id,
             'content': self.content,
             'like_count': self.like_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'user': self.user.to_public_dict() if self.user else None
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
         
+        if include_user:
+            result['user'] = self.user.to_public_dict() if self.user else None
+        
         if include_replies:
             result['replies'] = [reply.to_dict() for reply in self.replies.all()]
             
         return result
 
 
+@event.listens_for(Comment, 'before_insert')
+def _set_comment_root(mapper, connection, target):
+    """Replies at any depth point at their thread's top-level comment"""
+    if target.parent_id is None:
+        target.root_id = None
+        return
+    # The parent row is already written, even if it was added in this flush
+    target.root_id = connection.execute(
+        select(func.coalesce(Comment.root_id, Comment.id)).where(Comment.id == target.parent_id)
+    ).scalar()
+
+
 class VideoMenuItem(db.Model):
     """Link videos to menu items they feature"""
     id = db.Column(db.Integer, primary_key=True)
-    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
-    menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id', ondelete='CASCADE'), nullable=False)
+    menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('video_id', 'menu_item_id', name='unique_video_menu_item'),)
+    __table_args__ = (
+        db.UniqueConstraint('video_id', 'menu_item_id', name='unique_video_menu_item'),
+        db.Index('ix_video_menu_item_menu_item', 'menu_item_id'),
+    )
 
     def to_dict(self):
         return {
@@ -0,0 +1,10 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c src/gunicorn.conf.py src.wsgi:app
+
+gunicorn.conf.py creates the schema once and starts the background services
+in every worker. Other servers should run `flask init-db` before starting
+and call start_background_services() once in each worker process.
+"""
+from src.main import app